@@ -1,5 +1,5 @@
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnableParallel, RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, RunnablePick
 from langchain_core.output_parsers import StrOutputParser
 from typing import Any
 
@@ -21,21 +21,20 @@ def get_final_answer_prompt():
 
 
 def get_cot_chain(llm_step1: Any, llm_step2: Any):
-    """組合成 LCEL 雙階段 Chain of Thought chain，支援 chat_history"""
-
-    # 第一步：思考與推理
-    step1_chain = RunnableParallel({
-        "question": RunnablePassthrough(),
-        "chat_history": RunnablePassthrough()
-    }) | get_thought_prompt() | llm_step1 | StrOutputParser()
-
-    # 第二步：產出最終答案
-    step2_chain = RunnableParallel({
-        "thought": step1_chain
-    }) | get_final_answer_prompt() | llm_step2 | StrOutputParser()
-
-    # 返回兩階段 Chain 結果（thought + final_answer）
-    return RunnableParallel({
-        "thought": step1_chain,
-        "final_answer": step2_chain
-    })
+    """組合成 LCEL 雙階段 Chain of Thought chain，支援 chat_history
+
+    推理只計算一次，再把結果傳給第二階段，整個問題固定只呼叫兩次 LLM。
+    """
+
+    # 第一步：思考與推理（輸入需包含 question 與 chat_history）
+    step1_chain = get_thought_prompt() | llm_step1 | StrOutputParser()
+
+    # 第二步：根據第一步的 thought 產出最終答案
+    step2_chain = get_final_answer_prompt() | llm_step2 | StrOutputParser()
+
+    # 返回兩階段 Chain 結果（thought + final_answer），兩個欄位都可以串流
+    return (
+        RunnablePassthrough.assign(thought=step1_chain)
+        | RunnablePassthrough.assign(final_answer=step2_chain)
+        | RunnablePick(["thought", "final_answer"])
+    )
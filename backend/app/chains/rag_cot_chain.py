@@ -1,13 +1,16 @@
+from operator import itemgetter
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnableParallel
+from langchain_core.runnables import RunnablePassthrough, RunnablePick
 from langchain_core.output_parsers import StrOutputParser
-from typing import Any
+from typing import Any, Callable, Optional
+
+from prompt.rag_prompt import format_docs
 
 
 def get_thought_prompt():
     return ChatPromptTemplate.from_messages([
         ("system", "你是一位善於思考的AI助手，請根據以下資料，對問題進行邏輯推理。"),
-        ("system", "資料如下：\n{context}"),
+        ("system", "資料如下（每段以 [編號] 與來源開頭，引用時請標註編號）：\n{context}"),
         MessagesPlaceholder(variable_name="chat_history"),
         ("human", "{question}")
     ])
@@ -20,28 +23,30 @@ def get_final_answer_prompt():
     ])
 
 
-def get_rag_cot_chain(llm_step1: Any, llm_step2: Any, retriever: Any, use_cot: bool = True):
-    """組合成 LCEL 雙階段 RAG + CoT chain，支援 chat_history"""
+def get_rag_cot_chain(llm_step1: Any, llm_step2: Any, retriever: Any, use_cot: bool = True,
+                      context_formatter: Optional[Callable] = None):
+    """組合成 LCEL 雙階段 RAG + CoT chain，支援 chat_history
+
+    每個問題只檢索一次、推理只計算一次，之後的階段都沿用前一階段的結果。
+    context_formatter 決定檢索結果如何整理成參考資料（預設使用 format_docs 的 token 預算）。
+    """
 
-    format_docs = lambda docs: "\n\n".join([doc.page_content for doc in docs])
+    # 檢索：只在最前面執行一次
+    context_chain = itemgetter("question") | retriever | (context_formatter or format_docs)
 
     # 第一步：RAG -> 推理（CoT）
-    step1_chain = RunnableParallel({
-        "context": (lambda x: x["question"]) | retriever | format_docs,
-        "question": (lambda x: x["question"]),
-        "chat_history": (lambda x: x["chat_history"]),
-    }) | get_thought_prompt() | llm_step1 | StrOutputParser()
+    step1_chain = get_thought_prompt() | llm_step1 | StrOutputParser()
 
     # 第二步：推理輸出 -> 最終答案
-    step2_chain = RunnableParallel({
-        "thought": step1_chain,
-        "chat_history": (lambda x: x["chat_history"]),
-    }) | get_final_answer_prompt() | llm_step2 | StrOutputParser()
+    step2_chain = get_final_answer_prompt() | llm_step2 | StrOutputParser()
+
+    chain = (
+        RunnablePassthrough.assign(context=context_chain)
+        | RunnablePassthrough.assign(thought=step1_chain)
+        | RunnablePassthrough.assign(final_answer=step2_chain)
+    )
 
     if not use_cot:
-        return step2_chain
+        return chain | RunnablePick("final_answer")
 
-    return RunnableParallel({
-        "thought": step1_chain,
-        "final_answer": step2_chain
-    })
+    return chain | RunnablePick(["thought", "final_answer"])
@@ -0,0 +1,185 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Literal, Optional
+
+from utils.coordination import coordinator
+from utils.embedding import EMBEDDING_MODELS
+from utils.scheduler import BULK, request_priority
+from vectorstore import index_key, vectorstore_manager
+
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "2"))
+MAX_FINISHED_JOBS = int(os.getenv("MAX_FINISHED_JOBS", "200"))
+
+FINISHED_STAGES = ("done", "duplicate", "failed")
+
+
+@dataclass
+class IngestionJob:
+    job_id: str
+    file_name: str
+    file_path: str
+    embed_type: str
+    index_key: str
+    # 重新上傳（取代）時，舊版本的索引 key，未改變的 chunk 沿用其向量
+    previous_key: Optional[str] = None
+    # queued -> loading -> embedding -> saving -> done；重複內容為 duplicate，失敗為 failed
+    stage: str = "queued"
+    chunks: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data.pop("file_path")
+        data.pop("index_key")
+        data.pop("previous_key")
+        return data
+
+
+class IngestionQueue:
+    """背景索引工作佇列：上傳請求只負責存檔並排入工作，load / split / embed / save 都在 worker 中執行。
+    多 worker 時工作狀態另外寫入共用的 SQLite，查詢進度的請求由哪個 worker 處理都能取得"""
+
+    def __init__(self, concurrency: int = INGEST_CONCURRENCY):
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._active: dict[str, str] = {}  # index_key -> 進行中的 job_id
+        self._latest: dict[str, str] = {}  # 檔案路徑 -> 最近一次的 job_id
+        self._lock = threading.Lock()
+        self._compaction_pending = False
+
+    def submit(
+        self,
+        file_path: str,
+        embed_type: Literal["openai", "ollama"] = "openai",
+        previous_key: Optional[str] = None,
+    ) -> IngestionJob:
+        key = index_key(file_path, embed_type)
+        with self._lock:
+            # 相同內容的檔案正在建立索引，直接回傳那個工作
+            if key in self._active:
+                return self._jobs[self._active[key]]
+
+            job = IngestionJob(
+                job_id=uuid.uuid4().hex,
+                file_name=os.path.basename(file_path),
+                file_path=file_path,
+                embed_type=embed_type,
+                index_key=key,
+                previous_key=previous_key,
+            )
+            self._jobs[job.job_id] = job
+            self._latest[os.path.normpath(file_path)] = job.job_id
+            self._prune()
+
+            # 相同內容已經建立過索引，不需重新處理
+            if vectorstore_manager.is_indexed(file_path, embed_type):
+                job.stage = "duplicate"
+            else:
+                self._active[key] = job.job_id
+        self._share(job)
+        if job.stage != "duplicate":
+            self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and coordinator is not None:
+            data = coordinator.load_job(job_id)
+            job = IngestionJob(**data) if data else None
+        return job
+
+    def latest_for(self, file_path: str) -> Optional[IngestionJob]:
+        """檔案最近一次的索引工作（列出檔案狀態用）；多 worker 時以共用紀錄為準"""
+        if coordinator is not None:
+            data = coordinator.latest_job(os.path.normpath(file_path))
+            return IngestionJob(**data) if data else None
+        with self._lock:
+            job_id = self._latest.get(os.path.normpath(file_path))
+            return self._jobs.get(job_id) if job_id else None
+
+    def _share(self, job: IngestionJob):
+        if coordinator is None:
+            return
+        with self._lock:
+            data = asdict(job)
+        try:
+            coordinator.save_job(job.job_id, os.path.normpath(job.file_path), data)
+        except Exception as e:
+            print(f"[ERROR] Failed to share ingestion job {job.job_id}: {str(e)}")
+
+    def _update(self, job: IngestionJob, stage: str, chunks: Optional[int] = None):
+        with self._lock:
+            job.stage = stage
+            if chunks is not None:
+                job.chunks = chunks
+            job.updated_at = time.time()
+        self._share(job)
+
+    def _run(self, job: IngestionJob):
+        try:
+            self._update(job, "loading")
+            # 背景索引屬於批次工作，embedding 名額優先讓給互動請求
+            with request_priority(BULK):
+                db = vectorstore_manager.get(
+                    job.file_path,
+                    embed_type=job.embed_type,
+                    on_progress=lambda stage, chunks: self._update(job, stage, chunks),
+                    reuse_from=job.previous_key,
+                )
+            self._update(job, "done", db.index.ntotal)
+            if job.previous_key and job.previous_key != job.index_key:
+                # 舊版本的索引已不再被引用，交給背景壓縮清除
+                self.schedule_compaction(os.path.dirname(job.file_path))
+        except Exception as e:
+            print(f"[ERROR] Ingestion Failed: {job.file_name}: {str(e)}")
+            with self._lock:
+                job.error = str(e)
+            self._update(job, "failed")
+        finally:
+            with self._lock:
+                self._active.pop(job.index_key, None)
+
+    def schedule_compaction(self, upload_dir: str):
+        """在背景清除沒有任何上傳檔案引用的索引；已排入但尚未執行時不重複排入"""
+        with self._lock:
+            if self._compaction_pending:
+                return
+            self._compaction_pending = True
+        self._pool.submit(self._compact, upload_dir)
+
+    def _compact(self, upload_dir: str):
+        with self._lock:
+            self._compaction_pending = False
+        try:
+            live_keys = set()
+            for name in os.listdir(upload_dir):
+                file_path = os.path.join(upload_dir, name)
+                if os.path.isfile(file_path):
+                    live_keys.update(index_key(file_path, embed_type) for embed_type in EMBEDDING_MODELS)
+            removed = vectorstore_manager.compact(live_keys)
+            if removed:
+                print(f"[INFO] Index compaction removed {removed} unused index(es)")
+        except Exception as e:
+            print(f"[ERROR] Index compaction failed: {str(e)}")
+
+    def _prune(self):
+        # 只保留最近的已完成工作，避免工作紀錄無限成長
+        finished = [job_id for job_id, job in self._jobs.items() if job.stage in FINISHED_STAGES]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+        live = set(self._jobs)
+        for file_path in [path for path, job_id in self._latest.items() if job_id not in live]:
+            del self._latest[file_path]
+        if coordinator is not None and len(finished) > MAX_FINISHED_JOBS:
+            coordinator.prune_jobs(MAX_FINISHED_JOBS + len(self._jobs) - len(finished))
+
+
+ingestion_queue = IngestionQueue()
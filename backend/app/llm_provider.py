@@ -1,42 +1,78 @@
 import os
+import threading
+from typing import Any
+
+import httpx
 from dotenv import load_dotenv
-from langchain_community.chat_models import ChatOpenAI
+from langchain_openai import ChatOpenAI
 from langchain_ollama import ChatOllama
-from langchain.callbacks.streaming_aiter import AsyncIteratorCallbackHandler
+from langchain_core.language_models import BaseChatModel
+
+from utils.fake_backends import ENABLE_FAKE_BACKENDS, create_fake_llm
 
 load_dotenv()
 
-def get_llm(model_name: str = "openai", stream: bool = False):
-    if model_name == "openai":
-        if stream:
-            callback = AsyncIteratorCallbackHandler()
-            llm = ChatOpenAI(
-                model="gpt-4o-mini",
-                temperature=0,
-                api_key=os.getenv("OPENAI_API_KEY"),
-                streaming=True,
-                callbacks=[callback],
-            )
-            return llm, callback
-        else:
-            llm = ChatOpenAI(
-                model="gpt-4o-mini",
+LLM_MODELS = {
+    "openai": "gpt-4o-mini",
+    "ollama": "llama3.2",
+}
+
+# 共用 HTTP 連線池設定（keep-alive，所有請求共用 TCP / TLS 連線）
+HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "120"))
+
+
+class LLMRegistry:
+    """LLM client 註冊表：每組 (backend, model, params) 只建立一個長期存在的 client。
+
+    client 本身不綁定任何 callback，串流與追蹤 callback 一律由每次呼叫的 config 傳入，
+    因此可以安全地在所有請求之間共用。
+    """
+
+    def __init__(self):
+        self._clients: dict[tuple, BaseChatModel] = {}
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._http_async_client = None
+
+    def _http_clients(self) -> tuple[httpx.Client, httpx.AsyncClient]:
+        if self._http_client is None:
+            limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE)
+            self._http_client = httpx.Client(limits=limits, timeout=HTTP_TIMEOUT)
+            self._http_async_client = httpx.AsyncClient(limits=limits, timeout=HTTP_TIMEOUT)
+        return self._http_client, self._http_async_client
+
+    def _create(self, backend: str, params: dict[str, Any]) -> BaseChatModel:
+        if backend == "openai":
+            http_client, http_async_client = self._http_clients()
+            return ChatOpenAI(
+                model=LLM_MODELS["openai"],
                 temperature=0,
                 api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=http_client,
+                http_async_client=http_async_client,
+                **params,
             )
-            return llm, None
-    elif model_name == "ollama":
-        if stream:
-            callback = AsyncIteratorCallbackHandler()
-            llm = ChatOllama(
-                model="llama3.2",
-                streaming=True,
-                callbacks=[callback],
-            )
-            return llm, callback
+        elif backend == "ollama":
+            return ChatOllama(model=LLM_MODELS["ollama"], **params)
+        elif backend == "fake" and ENABLE_FAKE_BACKENDS:
+            return create_fake_llm(**params)
         else:
-            llm = ChatOllama(model="llama3.2")
-            return llm, None
-    else:
-        raise ValueError("Unsupported model")
+            raise ValueError("Unsupported model")
+
+    def get(self, backend: str, **params: Any) -> BaseChatModel:
+        key = (backend, LLM_MODELS.get(backend, backend), tuple(sorted(params.items())))
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._create(backend, params)
+                self._clients[key] = client
+            return client
+
+
+llm_registry = LLMRegistry()
 
+def get_llm(model_name: str = "openai", **params: Any) -> BaseChatModel:
+    """取得共用的 LLM client；串流一律透過 astream / astream_events，callback 由 config 傳入"""
+    return llm_registry.get(model_name, **params)
@@ -1,9 +1,20 @@
-from fastapi import FastAPI
+import logging
+import math
+import os
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from routes.ask import router as ask_router
 from routes.agent import router as agent_router
 from routes.upload import router as upload_router
 from routes.files import router as files_router
+from routes.metrics import router as metrics_router
+from utils.coordination import WORKERS
+from utils.metrics import TimingMiddleware
+from utils.scheduler import Overloaded
+
+# 結構化追蹤（agent.trace）等記錄以 INFO 輸出
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 
 app = FastAPI()
 
@@ -14,11 +25,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# 各請求的耗時統計（/api/metrics）與可選的 Server-Timing header
+app.add_middleware(TimingMiddleware)
+
+# 後端（LLM / embedding）排隊已滿或等待逾時：串流開始前發生時回 429，讓 client 依 Retry-After 重試
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
 
 # 加入路由
 app.include_router(ask_router, prefix="/api")
 app.include_router(agent_router, prefix="/api")
 app.include_router(upload_router, prefix="/api")
 app.include_router(files_router, prefix="/api")
+app.include_router(metrics_router, prefix="/api")
+
+if __name__ == "__main__":
+    import uvicorn
 
+    # 多 worker：python main.py（WORKERS=4）；索引以 mmap 在各 worker 間共用，狀態經由 SQLite 協調
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=WORKERS,
+    )
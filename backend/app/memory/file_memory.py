@@ -1,7 +1,21 @@
-from langchain_community.chat_message_histories import FileChatMessageHistory
-import os
+from typing import Optional
 
-def get_memory(session_id: str):
-    os.makedirs("history_store", exist_ok=True)
-    file_path = os.path.join("history_store", f"{session_id}.json")
-    return FileChatMessageHistory(file_path)
+from memory.history_policy import HistoryPolicy, WindowedChatMessageHistory
+from memory.history_store import HistoryStore, StoreChatMessageHistory, create_backend, validate_session_id
+
+# 行程內共用的對話紀錄快取，後端由 HISTORY_BACKEND 決定（sqlite / jsonl）
+history_store = HistoryStore(create_backend())
+
+# 請求沒有帶 X-Session-ID 時共用的 session
+DEFAULT_SESSION_ID = "default"
+
+def resolve_session_id(session_id: Optional[str]) -> str:
+    """X-Session-ID header 的值：未提供或空白時使用預設 session，格式不合法時 ValueError"""
+    return validate_session_id(session_id.strip()) if session_id and session_id.strip() else DEFAULT_SESSION_ID
+
+def get_memory(session_id: str, policy: Optional[HistoryPolicy] = None):
+    history = StoreChatMessageHistory(session_id, history_store)
+    if policy is None:
+        return history
+    # 提供給 prompt 的歷史紀錄套用 token 預算視窗與滾動摘要
+    return WindowedChatMessageHistory(session_id, history, policy)
@@ -0,0 +1,148 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from utils.tokens import count_tokens
+
+# 每個模型可放入 prompt 的歷史紀錄 token 上限
+HISTORY_TOKEN_BUDGETS = {
+    "openai": int(os.getenv("HISTORY_TOKEN_BUDGET_OPENAI", "3000")),
+    "ollama": int(os.getenv("HISTORY_TOKEN_BUDGET_OLLAMA", "1500")),
+}
+DEFAULT_HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# 最多保留幾輪原文（一輪 = 提問 + 回答）
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "6"))
+# 視窗滑動時一次多摺疊幾輪，讓摘要不必每一輪都重算
+HISTORY_SUMMARY_STEP_TURNS = int(os.getenv("HISTORY_SUMMARY_STEP_TURNS", "2"))
+HISTORY_SUMMARY_CACHE_SESSIONS = int(os.getenv("HISTORY_SUMMARY_CACHE_SESSIONS", "1024"))
+# 每次送去摘要的新訊息 token 上限；快取失效（重新啟動、被淘汰、其他 worker）時較早的紀錄分段摺疊，
+# 不會把整段歷史放進同一個 prompt
+HISTORY_SUMMARY_CHUNK_TOKENS = int(os.getenv("HISTORY_SUMMARY_CHUNK_TOKENS", "2000"))
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Progressively summarize the conversation. Merge the new lines into the existing summary "
+               "and return a concise summary that keeps names, numbers, decisions and open questions. "
+               "Reply in the language of the conversation."),
+    ("human", "Existing summary:\n{summary}\n\nNew lines:\n{lines}\n\nNew summary:"),
+])
+
+
+def message_tokens(message: BaseMessage) -> int:
+    # 每則訊息另計角色等格式開銷
+    return count_tokens(str(message.content)) + 4
+
+
+class HistoryPolicy:
+    """歷史紀錄視窗：最近幾輪保留原文，較早的對話摺疊成滾動摘要，prompt 大小維持在 token 預算內。
+
+    摘要以 (session_id) 快取並記錄涵蓋到第幾則訊息，只有視窗往後滑動時才會把新移出的訊息併入摘要。
+    """
+
+    def __init__(self, summarizer: Any, token_budget: int, keep_turns: int = HISTORY_KEEP_TURNS,
+                 step_turns: int = HISTORY_SUMMARY_STEP_TURNS):
+        self.summarizer_chain = SUMMARY_PROMPT | summarizer | StrOutputParser()
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.step_turns = step_turns
+        self._summaries: "OrderedDict[str, tuple[int, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _min_split(self, messages: Sequence[BaseMessage], budget: int) -> int:
+        """回傳最少要摺疊掉的訊息數，使剩下的原文符合輪數與 token 上限"""
+        split = max(0, len(messages) - self.keep_turns * 2)
+        used = sum(message_tokens(m) for m in messages[split:])
+        while split < len(messages) and used > budget:
+            used -= message_tokens(messages[split])
+            split += 1
+        return split
+
+    def window(self, session_id: str, messages: List[BaseMessage]) -> List[BaseMessage]:
+        # 摘要本身最多佔預算的四分之一
+        recent_budget = self.token_budget * 3 // 4
+        split = self._min_split(messages, recent_budget)
+        if split == 0:
+            return messages
+
+        with self._lock:
+            cached = self._summaries.get(session_id)
+            if cached:
+                self._summaries.move_to_end(session_id)
+
+        if cached and split <= cached[0] <= len(messages):
+            covered, summary = cached
+        else:
+            # 視窗滑動：多摺疊 step_turns 輪，接下來幾輪都能沿用同一份摘要
+            covered = min(split + self.step_turns * 2, max(split, len(messages) - 2))
+            if cached and cached[0] <= covered:
+                summary = self._fold(cached[1], messages[cached[0]:covered])
+            else:
+                summary = self._fold("", messages[:covered])
+            with self._lock:
+                self._summaries[session_id] = (covered, summary)
+                while len(self._summaries) > HISTORY_SUMMARY_CACHE_SESSIONS:
+                    self._summaries.popitem(last=False)
+
+        return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] + messages[covered:]
+
+    def _fold(self, summary: str, messages: Sequence[BaseMessage],
+              chunk_tokens: int = HISTORY_SUMMARY_CHUNK_TOKENS) -> str:
+        """依序把訊息併入摘要，每次最多 chunk_tokens 個 token 的新內容；單則過長的訊息截斷"""
+        lines: List[str] = []
+        used = 0
+        for message in messages:
+            line = f"{message.type}: {message.content}"
+            tokens = count_tokens(line)
+            if tokens > chunk_tokens:
+                line = line[:len(line) * chunk_tokens // tokens] + " …"
+                tokens = chunk_tokens
+            if lines and used + tokens > chunk_tokens:
+                summary = self._summarize(summary, lines)
+                lines, used = [], 0
+            lines.append(line)
+            used += tokens
+        return self._summarize(summary, lines) if lines else summary
+
+    def _summarize(self, summary: str, lines: List[str]) -> str:
+        return self.summarizer_chain.invoke({"summary": summary or "(empty)", "lines": "\n".join(lines)})
+
+
+class WindowedChatMessageHistory(BaseChatMessageHistory):
+    """讀取時套用 HistoryPolicy 的視窗，寫入時原樣保存完整紀錄"""
+
+    def __init__(self, session_id: str, history: BaseChatMessageHistory, policy: HistoryPolicy):
+        self.session_id = session_id
+        self.history = history
+        self.policy = policy
+
+    @property
+    def messages(self) -> List[BaseMessage]:  # type: ignore[override]
+        return self.policy.window(self.session_id, self.history.messages)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.history.add_messages(messages)
+
+    def clear(self) -> None:
+        self.history.clear()
+
+
+_policies: dict[str, HistoryPolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def get_history_policy(model_name: str) -> Optional[HistoryPolicy]:
+    """每個模型一份 policy，摘要使用同一個模型（非串流）"""
+    from llm_provider import get_llm
+
+    with _policies_lock:
+        if model_name not in _policies:
+            _policies[model_name] = HistoryPolicy(
+                summarizer=get_llm(model_name=model_name),
+                token_budget=HISTORY_TOKEN_BUDGETS.get(model_name, DEFAULT_HISTORY_TOKEN_BUDGET),
+            )
+        return _policies[model_name]
@@ -0,0 +1,248 @@
+import atexit
+import json
+import os
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+from utils.coordination import MULTI_WORKER
+from utils.metrics import span
+
+HISTORY_DIR = os.getenv("HISTORY_DIR", "history_store")
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite")  # sqlite / jsonl
+HISTORY_CACHE_SESSIONS = int(os.getenv("HISTORY_CACHE_SESSIONS", "1024"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.2"))
+# session id 會成為檔名（jsonl 後端與舊版 .json 搬移），只允許不含路徑字元的名稱
+SESSION_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,128}")
+
+
+def validate_session_id(session_id: str) -> str:
+    if not isinstance(session_id, str) or not SESSION_ID_RE.fullmatch(session_id):
+        raise ValueError(f"Invalid session id: {session_id!r}")
+    return session_id
+
+
+class HistoryBackend(ABC):
+    """對話紀錄的持久化後端：只需支援整段讀取與附加寫入"""
+
+    @abstractmethod
+    def load(self, session_id: str) -> List[BaseMessage]:
+        ...
+
+    @abstractmethod
+    def append(self, session_id: str, messages: Sequence[BaseMessage]):
+        ...
+
+    @abstractmethod
+    def clear(self, session_id: str):
+        ...
+
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """SQLite (WAL) 後端：每則訊息一列，附加寫入為 O(1)；多個 worker 行程可以同時讀寫"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, message TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id)")
+        self._conn.commit()
+
+    def load(self, session_id: str) -> List[BaseMessage]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message FROM messages WHERE session_id = ? ORDER BY id", (session_id,)
+            ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]):
+        rows = [(session_id, json.dumps(message_to_dict(m), ensure_ascii=False)) for m in messages]
+        with self._lock:
+            self._conn.executemany("INSERT INTO messages (session_id, message) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+
+class JsonlHistoryBackend(HistoryBackend):
+    """append-only JSON Lines 後端：每個 session 一個檔案，新訊息只附加在檔尾"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{validate_session_id(session_id)}.jsonl")
+
+    def load(self, session_id: str) -> List[BaseMessage]:
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return messages_from_dict([json.loads(line) for line in f if line.strip()])
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]):
+        with open(self._path(session_id), "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(message_to_dict(m), ensure_ascii=False) + "\n" for m in messages))
+
+    def clear(self, session_id: str):
+        path = self._path(session_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class HistoryStore:
+    """對話紀錄的記憶體快取 + write-behind：讀取直接走快取，寫入由背景執行緒批次送到後端。
+
+    每個 session 有自己的鎖，同一 session 的並行請求不會互相覆蓋。
+    舊版 history_store/{session_id}.json 會在第一次讀取時自動搬移到新後端。
+    shared（多 worker）時同一 session 的下一個請求可能由其他行程處理：不使用讀取快取，寫入直接送到後端。
+    """
+
+    def __init__(self, backend: HistoryBackend, legacy_dir: str = HISTORY_DIR,
+                 max_sessions: int = HISTORY_CACHE_SESSIONS, flush_interval: float = HISTORY_FLUSH_INTERVAL,
+                 shared: bool = MULTI_WORKER):
+        self.backend = backend
+        self.shared = shared
+        self.legacy_dir = legacy_dir
+        self.max_sessions = max_sessions
+        self.flush_interval = flush_interval
+        self._cache: "OrderedDict[str, List[BaseMessage]]" = OrderedDict()
+        self._pending: dict[str, List[BaseMessage]] = {}
+        self._inflight: dict[str, List[BaseMessage]] = {}
+        self._session_locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        with self._lock:
+            return self._session_locks.setdefault(session_id, threading.Lock())
+
+    def _migrate_legacy(self, session_id: str) -> List[BaseMessage]:
+        path = os.path.join(self.legacy_dir, f"{validate_session_id(session_id)}.json")
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            messages = messages_from_dict(json.load(f))
+        if messages:
+            self.backend.append(session_id, messages)
+        os.replace(path, f"{path}.migrated")
+        return messages
+
+    def _load(self, session_id: str) -> List[BaseMessage]:
+        """呼叫前需持有該 session 的鎖"""
+        if self.shared:
+            return self.backend.load(session_id) or self._migrate_legacy(session_id)
+        with self._lock:
+            messages = self._cache.get(session_id)
+            if messages is not None:
+                self._cache.move_to_end(session_id)
+                return messages
+
+        messages = self.backend.load(session_id) or self._migrate_legacy(session_id)
+        with self._lock:
+            # 尚未寫入後端的訊息也要算進去
+            messages = messages + self._pending.get(session_id, [])
+            self._cache[session_id] = messages
+            self._evict()
+        return messages
+
+    def _evict(self):
+        # 超過上限時淘汰最久未使用、且沒有待寫入訊息的 session
+        for session_id in list(self._cache.keys()):
+            if len(self._cache) <= self.max_sessions:
+                break
+            if session_id not in self._pending and session_id not in self._inflight:
+                del self._cache[session_id]
+
+    def messages(self, session_id: str) -> List[BaseMessage]:
+        with span("history_read"), self._session_lock(session_id):
+            return list(self._load(session_id))
+
+    def add_messages(self, session_id: str, messages: Sequence[BaseMessage]):
+        if not messages:
+            return
+        if self.shared:
+            with span("history_write"), self._session_lock(session_id):
+                self.backend.append(session_id, messages)
+            return
+        with span("history_write"), self._session_lock(session_id):
+            cached = self._load(session_id)
+            with self._lock:
+                cached.extend(messages)
+                self._pending.setdefault(session_id, []).extend(messages)
+        self._wakeup.set()
+
+    def clear(self, session_id: str):
+        with self._session_lock(session_id):
+            with self._lock:
+                self._pending.pop(session_id, None)
+                self._cache[session_id] = []
+            self.backend.clear(session_id)
+
+    def flush(self):
+        """把所有待寫入的訊息寫到後端（每個 session 一次批次寫入）"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._inflight = pending
+        for session_id, messages in pending.items():
+            try:
+                with span("history_flush"):
+                    self.backend.append(session_id, messages)
+            except Exception as e:
+                print(f"[ERROR] History write failed for {session_id}: {str(e)}")
+        with self._lock:
+            self._inflight = {}
+
+    def _write_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # 稍等一下，讓同一輪的多次寫入合併成一次
+            if self.flush_interval:
+                threading.Event().wait(self.flush_interval)
+            self.flush()
+
+
+class StoreChatMessageHistory(BaseChatMessageHistory):
+    """給 RunnableWithMessageHistory 使用的 session 對話紀錄"""
+
+    def __init__(self, session_id: str, store: HistoryStore):
+        self.session_id = session_id
+        self.store = store
+
+    @property
+    def messages(self) -> List[BaseMessage]:  # type: ignore[override]
+        return self.store.messages(self.session_id)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.store.add_messages(self.session_id, messages)
+
+    def clear(self) -> None:
+        self.store.clear(self.session_id)
+
+
+def create_backend(name: str = HISTORY_BACKEND) -> HistoryBackend:
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    if name == "sqlite":
+        return SQLiteHistoryBackend(os.path.join(HISTORY_DIR, "history.sqlite"))
+    elif name == "jsonl":
+        return JsonlHistoryBackend(HISTORY_DIR)
+    else:
+        raise ValueError(f"Unsupported history backend: {name}")
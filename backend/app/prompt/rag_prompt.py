@@ -1,5 +1,15 @@
+from typing import Callable, List
+
+from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
 
-def format_docs(docs):
-    """將 Document 陣列格式化成純文字供 Prompt 使用"""
-    return "\n\n".join(doc.page_content for doc in docs)
+from utils.context import DEFAULT_CONTEXT_TOKEN_BUDGET, assemble_context, context_budget
+
+def format_docs(docs: List[Document], token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET) -> str:
+    """將 Document 陣列整理成 Prompt 的參考資料：去除重疊與重複、MMR 挑選、依 token 預算打包並附上來源編號"""
+    return assemble_context(docs, token_budget)
+
+def docs_formatter(model: str, agent: bool = False) -> Callable[[List[Document]], str]:
+    """依模型（與是否為 agent）的 token 預算格式化，可直接接在 retriever 後面"""
+    budget = context_budget(model, agent)
+    return lambda docs: format_docs(docs, budget)
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import faiss
+import numpy as np
+
+from utils.normalize import normalize_question
+
+RESPONSE_CACHE_DEFAULT = os.getenv("RESPONSE_CACHE_DEFAULT", "false").lower() == "true"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+# 問題向量的 cosine 相似度達到此門檻才視為同一個問題
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+
+
+def cache_scope(model: str, mode: str, context_keys: list[str], history: Sequence = ()) -> str:
+    """回答會因模型、模式（plain / rag / cot / rag_cot）、檢索來源與放入 prompt 的對話紀錄而不同，
+    四者組成快取範圍；有對話紀錄時，追問（例如「那第二個呢？」）只會命中同一段對話的快取"""
+    history_hash = hashlib.sha256(
+        "\n".join(f"{m.type}: {m.content}" for m in history).encode("utf-8")
+    ).hexdigest() if history else ""
+    raw = "|".join([model, mode, history_hash, *sorted(context_keys)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    entry_id: int
+    key: str
+    scope: str
+    value: dict[str, str]
+    files: tuple[str, ...]
+    embed_model: Optional[str]
+    created_at: float
+
+
+class ResponseCache:
+    """回答快取：先以正規化問題做精確比對，再以問題 embedding 在小型 FAISS 索引中找相似問題。
+
+    以 TTL + LRU 淘汰；來源檔案重新上傳時，相關的快取一併失效。
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_SIZE,
+                 similarity: float = RESPONSE_CACHE_SIMILARITY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._by_id: dict[int, CacheEntry] = {}
+        self._indexes: dict[str, faiss.IndexIDMap2] = {}  # 每個 embedding 模型一個相似問題索引
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(question: str, scope: str) -> str:
+        return hashlib.sha256(f"{scope}|{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalize_vector(vector: list[float]) -> np.ndarray:
+        array = np.asarray([vector], dtype=np.float32)
+        faiss.normalize_L2(array)
+        return array
+
+    def _remove(self, entry: CacheEntry):
+        """呼叫前需持有鎖"""
+        self._entries.pop(entry.key, None)
+        self._by_id.pop(entry.entry_id, None)
+        index = self._indexes.get(entry.embed_model) if entry.embed_model else None
+        if index is not None:
+            index.remove_ids(np.asarray([entry.entry_id], dtype=np.int64))
+
+    def _alive(self, entry: CacheEntry) -> bool:
+        if time.time() - entry.created_at <= self.ttl:
+            return True
+        self._remove(entry)
+        return False
+
+    def lookup(self, question: str, scope: str, embeddings=None, embed_model: Optional[str] = None) -> Optional[dict[str, str]]:
+        key = self._key(question, scope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._alive(entry):
+                self._entries.move_to_end(key)
+                return entry.value
+            index = self._indexes.get(embed_model) if embed_model else None
+            if index is None or index.ntotal == 0 or embeddings is None:
+                return None
+
+        vector = self._normalize_vector(embeddings.embed_query(question))
+        with self._lock:
+            index = self._indexes.get(embed_model)
+            if index is None or index.ntotal == 0 or index.d != vector.shape[1]:
+                return None
+            scores, ids = index.search(vector, min(8, index.ntotal))
+            for score, entry_id in zip(scores[0], ids[0]):
+                if entry_id < 0 or score < self.similarity:
+                    break
+                entry = self._by_id.get(int(entry_id))
+                if entry is not None and entry.scope == scope and self._alive(entry):
+                    self._entries.move_to_end(entry.key)
+                    return entry.value
+        return None
+
+    def store(self, question: str, scope: str, value: dict[str, str], files: list[str],
+              embeddings=None, embed_model: Optional[str] = None):
+        vector = self._normalize_vector(embeddings.embed_query(question)) if embeddings is not None and embed_model else None
+        key = self._key(question, scope)
+        with self._lock:
+            if key in self._entries:
+                self._remove(self._entries[key])
+            entry = CacheEntry(self._next_id, key, scope, value, tuple(files),
+                               embed_model if vector is not None else None, time.time())
+            self._next_id += 1
+            self._entries[key] = entry
+            self._by_id[entry.entry_id] = entry
+            if vector is not None:
+                index = self._indexes.get(embed_model)
+                if index is None or index.d != vector.shape[1]:
+                    index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+                    self._indexes[embed_model] = index
+                index.add_with_ids(vector, np.asarray([entry.entry_id], dtype=np.int64))
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries.values())))
+
+    def invalidate_file(self, file_path: str) -> int:
+        """來源檔案內容改變（重新上傳）時，移除所有引用該檔案的快取"""
+        target = os.path.normpath(file_path)
+        with self._lock:
+            stale = [entry for entry in self._entries.values()
+                     if any(os.path.normpath(f) == target for f in entry.files)]
+            for entry in stale:
+                self._remove(entry)
+        return len(stale)
+
+
+response_cache = ResponseCache()
@@ -1,25 +1,34 @@
-from fastapi import APIRouter, Request
+import math
+import os
+import uuid
+from functools import lru_cache
+from typing import AsyncIterator
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from langchain_core.runnables import RunnableConfig
-from langchain.agents import AgentExecutor, create_react_agent
-from langchain_core.prompts import PromptTemplate
+from langchain.agents import AgentExecutor, create_react_agent, create_tool_calling_agent
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
 from langchain_core.tools import Tool
-from langchain_core.documents import Document
-from langchain_ollama import ChatOllama
-from langchain_openai import ChatOpenAI
-from langchain.text_splitter import CharacterTextSplitter
 from langchain_core.runnables import RunnableWithMessageHistory
 
-from utils.embedding import build_vectorstore
-from utils.loader import load_file
-from memory.file_memory import get_memory
+from llm_provider import get_llm
+from vectorstore import vectorstore_manager
+from memory.file_memory import get_memory, resolve_session_id
+from memory.history_policy import get_history_policy
 from tools.tool_registry import TOOL_REGISTRY
-from prompt.rag_prompt import format_docs
+from tools.tool_runtime import managed_tool
+from prompt.rag_prompt import docs_formatter
+from utils.context import CONTEXT_FETCH_K
+from utils.sse import format_sse, stream_until_disconnect
+from utils.tracing import trace_callbacks
+from utils.metrics import metrics_callbacks
+from utils.scheduler import Reservation, get_scheduler
 
 router = APIRouter()
 
-from langchain_core.prompts import PromptTemplate
-
 REACT_PROMPT = PromptTemplate.from_template(
 """You are a smart assistant that can use the following tools to solve problems:
 
@@ -45,6 +54,78 @@ Question: {input}
 {agent_scratchpad}
 """)
 
+# parallel 模式：使用原生 tool calling，模型可在同一步驟發出多個工具呼叫，由 executor 同時執行
+PARALLEL_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a smart assistant. Use the available tools when they help answer the question. "
+               "When several lookups are independent, request them together in a single step."),
+    MessagesPlaceholder("chat_history", optional=True),
+    ("human", "{input}"),
+    MessagesPlaceholder("agent_scratchpad"),
+])
+
+AGENT_MODES = ("react", "parallel")
+AGENT_MODE = os.getenv("AGENT_MODE", "react")
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "32"))
+
+@lru_cache(maxsize=AGENT_CACHE_SIZE)
+def get_agent_chain(model: str, tool_names: tuple[str, ...], mode: str = AGENT_MODE) -> RunnableWithMessageHistory:
+    """依 (模型, 排序後的工具組合, 模式) 建立並快取 agent executor 與記憶包裝；executor 本身無狀態，可跨請求共用"""
+    # --- 1. Init LLM（共用 client，連線池跨請求重複使用）---
+    llm = get_llm(model_name=model)
+
+    # --- 2. Tool 選擇（第一次使用時才載入；非同步執行、逾時與結果快取）---
+    selected_tools: list[Tool] = [managed_tool(TOOL_REGISTRY[name]) for name in tool_names]
+
+    # --- 3. 建立 Agent（追蹤改由請求的 config 依取樣掛上，不使用 verbose）---
+    if mode == "parallel" and selected_tools:
+        agent = create_tool_calling_agent(llm=llm, tools=selected_tools, prompt=PARALLEL_PROMPT)
+    else:
+        agent = create_react_agent(llm=llm, tools=selected_tools,prompt=REACT_PROMPT)
+    agent_executor = AgentExecutor(agent=agent, tools=selected_tools, verbose=False,handle_parsing_errors=True,streaming=True,max_iterations=10)
+
+    # 只有 parallel 的 prompt 有 chat_history；react 仍記錄對話，但不必套用視窗與摘要（結果用不到）
+    history_policy = get_history_policy(model) if mode == "parallel" and selected_tools else None
+    return RunnableWithMessageHistory(
+        agent_executor,
+        lambda session_id: get_memory(session_id, policy=history_policy),
+        input_messages_key="input",
+        history_messages_key="chat_history"
+    )
+
+# ReAct 格式中最後回答的標記，之後的文字才是要串流給 client 的內容
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+async def stream_final_answer(chain: RunnableWithMessageHistory, agent_input: str, config: RunnableConfig,
+                              mode: str) -> AsyncIterator[str]:
+    """以 astream_events 逐 token 轉送最後回答：react 只轉送模型輸出中 "Final Answer:" 之後的文字，
+    parallel 轉送沒有 tool call 的模型輸出；完全沒有串流到回答時（例如達到推理次數上限）改送 executor 的最終輸出"""
+    buffers: dict[str, str] = {}
+    answering: set[str] = set()
+    streamed = False
+    async for event in chain.astream_events({"input": agent_input}, config=config, version="v2"):
+        if event["event"] == "on_chat_model_stream":
+            chunk = event["data"]["chunk"]
+            if not isinstance(chunk.content, str) or not chunk.content or chunk.tool_call_chunks:
+                continue
+            run_id = event["run_id"]
+            if mode == "parallel" or run_id in answering:
+                streamed = True
+                yield chunk.content
+                continue
+            # 標記可能被切在兩個 token 之間，找到標記與回答的第一個字之前先累積這一步的輸出
+            text = buffers.pop(run_id, "") + chunk.content
+            _, marker, answer = text.partition(FINAL_ANSWER_MARKER)
+            if not marker or not answer.strip():
+                buffers[run_id] = text
+                continue
+            answering.add(run_id)
+            streamed = True
+            yield answer.lstrip()
+        elif event["event"] == "on_chain_end" and event["name"] == "AgentExecutor" and not streamed:
+            output = event["data"].get("output")
+            if isinstance(output, dict) and output.get("output"):
+                yield output["output"].strip()
+
 @router.post("/agent")
 async def agent_ask(
     request: Request,
@@ -56,69 +137,75 @@ async def agent_ask(
     use_cot = body.get("use_cot", False)
     plugin_detail = body.get("plugin_detail", [])
     selected_files = body.get("selected_files", [])
-
-    # --- 1. Init LLM ---
-    if model == "openai":
-        llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", streaming=True)
-    elif model == "ollama":
-        llm = ChatOllama(model="llama3.2", streaming=True)
-    else:
-        raise ValueError("Unsupported model")
-
-    # --- 2. Tool 選擇 ---
-    selected_tools: list[Tool] = []
-    for item in plugin_detail:
-        if item.get("enable"):
-            tool = TOOL_REGISTRY.get(item["tool_name"])
-            if tool:
-                selected_tools.append(tool)
-
-    # --- 3. 建立 Agent ---
-    agent = create_react_agent(llm=llm, tools=selected_tools,prompt=REACT_PROMPT)
-    agent_executor = AgentExecutor(agent=agent, tools=selected_tools, verbose=True,handle_parsing_errors=True,streaming=True,max_iterations=10)
-
-    # --- 4. Optional RAG ---
-    retriever = None
-    rag_context_str = ""
-    if use_rag and selected_files:
-        all_docs: list[Document] = []
-        for file_id in selected_files:
-            all_docs.extend(load_file(file_id))
-
-        splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        chunks = splitter.split_documents(all_docs)
-        vectorstore = build_vectorstore(chunks, model=model)
-        retriever = vectorstore.as_retriever()
-
-        rag_context = retriever.invoke(question)
-        rag_context_str = format_docs(rag_context)
-
-        if rag_context_str:
-            agent_input = f"以下是相關資料：\n{rag_context_str}\n\n問題：{question}"
+    agent_mode = body.get("agent_mode", AGENT_MODE)
+    if agent_mode not in AGENT_MODES:
+        agent_mode = AGENT_MODE
+    # session id 不合法時在排隊控制前就回 400
+    try:
+        session_id = resolve_session_id(request.headers.get("X-Session-ID"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # --- 排隊控制：LLM 後端已滿載、預估等待過久時直接回 429 ---
+    scheduler = get_scheduler("llm", model)
+    if not scheduler.admit():
+        raise HTTPException(
+            status_code=429,
+            detail=f"The {model} backend is busy, please retry later",
+            headers={"Retry-After": str(math.ceil(scheduler.retry_after()))},
+        )
+
+    # admit 保留的位置交給串流使用；在那之前處理失敗或 client 斷線時要歸還
+    reservation = Reservation(scheduler)
+    try:
+        # --- 1~3. 取得 Agent（依模型與啟用的工具組合快取，跨請求重複使用）---
+        tool_names = tuple(sorted({
+            item["tool_name"] for item in plugin_detail
+            if item.get("enable") and item.get("tool_name") in TOOL_REGISTRY
+        }))
+        final_chain = await run_in_threadpool(get_agent_chain, model, tool_names, agent_mode)
+        # 沒有啟用工具時 parallel 也使用 react agent
+        stream_mode = "parallel" if agent_mode == "parallel" and tool_names else "react"
+
+        # --- 4. Optional RAG ---
+        retriever = None
+        rag_context_str = ""
+        if use_rag and selected_files:
+            retriever = await run_in_threadpool(vectorstore_manager.get_retriever, selected_files, model, CONTEXT_FETCH_K)
+
+            rag_context = await retriever.ainvoke(question)
+            # agent 的輸入會在每一輪推理重送，使用較小的 token 預算
+            rag_context_str = docs_formatter(model, agent=True)(rag_context)
+
+            if rag_context_str:
+                agent_input = f"以下是相關資料：\n{rag_context_str}\n\n問題：{question}"
+            else:
+                agent_input = question
         else:
-            agent_input = question
-    else:
-         agent_input = question         
-
-    # --- 6. 記憶 ---
-    session_id = request.headers.get("X-Session-ID")
-    final_chain = RunnableWithMessageHistory(
-        agent_executor,
-        lambda session_id: get_memory(session_id),
-        input_messages_key="input",
-        history_messages_key="chat_history"
-    )
-
-    # --- 7. Streaming 回傳 ---
-    
-    async def format_stream(stream):
-       for chunk in stream:
-        print("[DEBUG] Agent chunk:", chunk)
-        # 只抓最後的回答文字（final_output）
-        if "output" in chunk:
-            text = chunk["output"]
-            yield f"{text.strip()}\n\n"   # 清除前後空白、轉成 str，然後組成 SSE 格式   
-    
-    config = RunnableConfig(configurable={"session_id": session_id})
-    stream = final_chain.stream({"input": agent_input}, config=config)
-    return StreamingResponse(format_stream(stream), media_type="text/event-stream")
+             agent_input = question         
+
+        # --- 7. Streaming 回傳（非同步，client 斷線時停止 agent）---
+        config = RunnableConfig(
+            callbacks=trace_callbacks(request_id=uuid.uuid4().hex) + metrics_callbacks(model),
+            configurable={"session_id": session_id},
+        )
+
+        async def format_stream():
+            try:
+                async with scheduler.aslot(reserved=reservation.take()):
+                    # 只轉送最後回答的 token，推理過程與工具呼叫不送出
+                    async for token in stream_final_answer(final_chain, agent_input, config, stream_mode):
+                        yield format_sse(token, event="token")
+            except Exception as e:
+                print(f"[ERROR] Agent stream failed: {str(e)}")
+                yield format_sse(str(e), event="error")
+            yield format_sse("", event="done")
+
+        return StreamingResponse(
+            stream_until_disconnect(request, format_stream()),
+            media_type="text/event-stream",
+            background=BackgroundTask(reservation.release),
+        )
+    except BaseException:
+        reservation.release()
+        raise
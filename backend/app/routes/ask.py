@@ -1,18 +1,27 @@
-from fastapi import APIRouter, Request
-from fastapi.responses import StreamingResponse,PlainTextResponse
-from langchain_core.documents import Document
+import math
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from langchain_core.runnables import RunnableConfig, RunnablePassthrough
 from llm_provider import get_llm
-from utils.loader import load_file
-from utils.embedding import build_vectorstore
-from prompt.rag_prompt import format_docs
+from vectorstore import vectorstore_manager
+from response_cache import RESPONSE_CACHE_DEFAULT, cache_scope, response_cache
+from utils.embedding import EMBEDDING_MODELS, get_embeddings
+from prompt.rag_prompt import docs_formatter
+from utils.context import CONTEXT_FETCH_K
+from utils.sse import format_sse, stream_until_disconnect
+from utils.metrics import metrics_callbacks, span
+from utils.scheduler import Reservation, get_scheduler
 from chains.cot_chain import get_cot_chain
 from chains.rag_cot_chain import get_rag_cot_chain
-from memory.file_memory import get_memory
+from memory.file_memory import get_memory, resolve_session_id
+from memory.history_policy import get_history_policy
 from langchain_core.runnables import RunnableWithMessageHistory
+from langchain_core.messages import HumanMessage, AIMessage
 from pydantic import BaseModel
 from typing import List
-from langchain_core.messages import HumanMessage, AIMessage
 from langchain.schema import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
@@ -24,108 +33,195 @@ class AskRequest(BaseModel):
     use_rag: bool = False
     use_cot: bool = False
     selected_files: List[str] = []
+    use_cache: bool = RESPONSE_CACHE_DEFAULT
+
+# 快取命中時，回答以固定大小的片段串流回傳，前端處理流程不變
+CACHED_CHUNK_CHARS = 32
 
 @router.post("/ask")
 async def ask(request: Request, body: AskRequest):
-    # --- 1. Init LLM ---
-    llm, streaming_handler = get_llm(model_name=body.model, stream=not body.use_cot)
-
-    # --- 2. 建立 Chain ---
-    rag_chain = None
-
-    docs: list[Document] = []
-    if body.selected_files:
-        for file_path in body.selected_files:
-            docs += load_file(file_path)
-
-    if docs:
-        from langchain.text_splitter import CharacterTextSplitter
-        splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        chunks = splitter.split_documents(docs)
-        vectorstore = build_vectorstore(chunks, model=body.model)
-        retriever = vectorstore.as_retriever()
-    else:
-        retriever = None
-
-    if body.use_cot and body.use_rag:
-        rag_chain = get_rag_cot_chain(llm_step1=llm, llm_step2=llm, retriever=retriever, use_cot=True)
-    elif body.use_cot:
-        rag_chain = get_cot_chain(llm_step1=llm, llm_step2=llm)
-    elif body.use_rag:
-        retriever_chain = retriever | format_docs
-        chat_prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are an expert assistant. Please answer the user's question based solely on the provided information. Do not make up any information. If the answer cannot be found in the provided data, reply with 'I don't know'."),
-        ("system", "Reference Information:\n{context}"),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("human", "{question}")
-    ])
-        rag_chain = (
-            RunnablePassthrough.assign(context=lambda x: retriever_chain.invoke(x["question"]))
-            | chat_prompt
-            | llm
-            | StrOutputParser()
+    try:
+        session_id = resolve_session_id(request.headers.get("X-Session-ID"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if body.use_rag and not body.selected_files:
+        raise HTTPException(status_code=400, detail="use_rag requires at least one selected file")
+
+    # --- 0. 回答快取（opt-in）---
+    scope = None
+    if body.use_cache:
+        mode = ("rag_" if body.use_rag else "") + ("cot" if body.use_cot else "plain")
+        context_files = body.selected_files if body.use_rag else []
+        # 以查詢實際使用的索引版本為快取範圍，檔案換成新版本後舊的快取自然不再命中（各 worker 皆然）
+        context_keys = await run_in_threadpool(lambda: [vectorstore_manager.current_key(f, body.model) for f in context_files])
+        # chain 的 prompt 含有套用視窗後的 chat_history，快取範圍也要包含它
+        history = await run_in_threadpool(
+            lambda: get_memory(session_id, policy=get_history_policy(body.model)).messages
         )
-    else:
-        simple_prompt = ChatPromptTemplate.from_messages([
-       ("system", "You are a professional assistant. Please answer the user's questions. Remember the previous conversation and reply coherently."),
-       MessagesPlaceholder(variable_name="chat_history"),
-      ("human", "{question}")
-    ])
-        rag_chain = (
-            simple_prompt
-            | llm
-            | StrOutputParser()
+        scope = cache_scope(body.model, mode, context_keys, history)
+        question_embeddings = get_embeddings(body.model)
+        embed_model = EMBEDDING_MODELS[body.model]
+        with span("response_cache"):
+            cached = await run_in_threadpool(
+                response_cache.lookup, body.question, scope, question_embeddings, embed_model
+            )
+        if cached is not None:
+            return StreamingResponse(
+                stream_until_disconnect(request, replay_cached(session_id, body, cached)),
+                media_type="text/event-stream",
+            )
+
+    # --- 排隊控制：LLM 後端已滿載、預估等待過久時直接回 429，不再排隊 ---
+    scheduler = get_scheduler("llm", body.model)
+    if not scheduler.admit():
+        raise HTTPException(
+            status_code=429,
+            detail=f"The {body.model} backend is busy, please retry later",
+            headers={"Retry-After": str(math.ceil(scheduler.retry_after()))},
         )
 
-    # --- 3. 建立記憶機制 ---
-    session_id = request.headers.get("X-Session-ID")
-
-    def get_session_history(session_id:str):
-        return get_memory(session_id) 
+    # admit 保留的位置交給串流使用；在那之前處理失敗或 client 斷線時要歸還
+    reservation = Reservation(scheduler)
+    try:
+        # --- 1. Init LLM ---
+        llm = get_llm(model_name=body.model)
+
+        # --- 2. 建立 Chain ---
+        rag_chain = None
+
+        # 只有 RAG 模式才載入檔案索引（檔案仍在建立索引時，一般對話不必等待）
+        retriever = format_docs = None
+        if body.use_rag:
+            # 已建立過的檔案索引直接從快取/磁碟載入，只需對問題做一次 embedding
+            # 多取一些候選，由 context 組裝依 token 預算挑選
+            retriever = await run_in_threadpool(
+                vectorstore_manager.get_retriever, body.selected_files, body.model, CONTEXT_FETCH_K
+            )
+            format_docs = docs_formatter(body.model)
+
+        if body.use_cot and body.use_rag:
+            rag_chain = get_rag_cot_chain(llm_step1=llm, llm_step2=llm, retriever=retriever, use_cot=True,
+                                          context_formatter=format_docs)
+        elif body.use_cot:
+            rag_chain = get_cot_chain(llm_step1=llm, llm_step2=llm)
+        elif body.use_rag:
+            retriever_chain = retriever | format_docs
+            chat_prompt = ChatPromptTemplate.from_messages([
+            ("system", "You are an expert assistant. Please answer the user's question based solely on the provided information. Do not make up any information. If the answer cannot be found in the provided data, reply with 'I don't know'."),
+            ("system", "Reference Information (each passage starts with [n] and its source; cite the passages you use as [n]):\n{context}"),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("human", "{question}")
+        ])
+            rag_chain = (
+                RunnablePassthrough.assign(context=lambda x: retriever_chain.invoke(x["question"]))
+                | chat_prompt
+                | llm
+                | StrOutputParser()
+            )
+        else:
+            simple_prompt = ChatPromptTemplate.from_messages([
+           ("system", "You are a professional assistant. Please answer the user's questions. Remember the previous conversation and reply coherently."),
+           MessagesPlaceholder(variable_name="chat_history"),
+          ("human", "{question}")
+        ])
+            rag_chain = (
+                simple_prompt
+                | llm
+                | StrOutputParser()
+            )
+
+        # --- 3. 建立記憶機制 ---
+        history_policy = get_history_policy(body.model)
+
+        def get_session_history(session_id:str):
+            return get_memory(session_id, policy=history_policy)
+
+        memory_chain = RunnableWithMessageHistory(
+            rag_chain,
+            get_session_history,
+            input_messages_key="question",
+            history_messages_key="chat_history",
+            # CoT chain 輸出 {"thought", "final_answer"}，歷史紀錄取最終答案
+            output_messages_key="final_answer" if body.use_cot else None,
+        )
 
-    memory_chain = RunnableWithMessageHistory(
-        rag_chain,
-        get_session_history,
-        input_messages_key="question",
-        history_messages_key="chat_history",
-    )
+        session_input = {"question": body.question}
+        config = RunnableConfig(
+            callbacks=metrics_callbacks(body.model),
+            configurable={"session_id": session_id}
+        )
 
-    session_input = {"question": body.question}
-    config = RunnableConfig(
-        callbacks=[streaming_handler] if not body.use_cot else [],
-        configurable={"session_id": session_id}
+        collected: dict[str, str] = {}
+
+        async def store_in_cache():
+            if scope is not None and collected:
+                await run_in_threadpool(
+                    response_cache.store, body.question, scope, dict(collected), context_files,
+                    question_embeddings, embed_model,
+                )
+
+        # --- 4. CoT 模式：以 thought / final_answer 兩種 SSE 事件分段串流 ---
+        if body.use_cot:
+            async def format_cot_stream():
+                try:
+                    async with scheduler.aslot(reserved=reservation.take()):
+                        async for chunk in memory_chain.astream(session_input, config=config):
+                            if not isinstance(chunk, dict):
+                                chunk = {"final_answer": str(chunk)}
+                            for phase in ("thought", "final_answer"):
+                                if chunk.get(phase):
+                                    collected[phase] = collected.get(phase, "") + chunk[phase]
+                                    yield format_sse(chunk[phase], event=phase)
+                except Exception as e:
+                    print(f"[ERROR] CoT stream failed: {str(e)}")
+                    yield format_sse(str(e), event="error")
+                    yield format_sse("", event="done")
+                    return
+                # 這一輪的提問與最終答案已由 RunnableWithMessageHistory 以單次批次寫入記錄
+                await store_in_cache()
+                yield format_sse("", event="done")
+
+            return StreamingResponse(
+                stream_until_disconnect(request, format_cot_stream()),
+                media_type="text/event-stream",
+                background=BackgroundTask(reservation.release),
+            )
+
+        # --- 5. 非 CoT 模式：StreamingResponse（非同步串流，不阻塞 event loop）---
+        async def format_stream_output():
+            try:
+                async with scheduler.aslot(reserved=reservation.take()):
+                    async for chunk in memory_chain.astream(session_input, config=config):
+                        collected["answer"] = collected.get("answer", "") + str(chunk)
+                        yield format_sse(str(chunk), event="token")
+            except Exception as e:
+                print(f"[ERROR] Ask stream failed: {str(e)}")
+                yield format_sse(str(e), event="error")
+                yield format_sse("", event="done")
+                return
+            await store_in_cache()
+            yield format_sse("", event="done")
+
+        return StreamingResponse(
+            stream_until_disconnect(request, format_stream_output()),
+            media_type="text/event-stream",
+            background=BackgroundTask(reservation.release),
+        )
+    except BaseException:
+        reservation.release()
+        raise
+
+
+async def replay_cached(session_id: str, body: AskRequest, cached: dict[str, str]):
+    """以與即時回答相同的 SSE 事件重播快取內容，並照常記錄這一輪對話"""
+    for phase, text in cached.items():
+        event = phase if body.use_cot else "token"
+        for start in range(0, len(text), CACHED_CHUNK_CHARS):
+            yield format_sse(text[start:start + CACHED_CHUNK_CHARS], event=event)
+
+    answer = cached.get("final_answer", cached.get("answer", ""))
+    await run_in_threadpool(
+        get_memory(session_id).add_messages,
+        [HumanMessage(content=body.question), AIMessage(content=answer)],
     )
-
-    # --- 4. CoT 模式：invoke，一次性回傳 ---
-    if body.use_cot:
-        result = memory_chain.invoke(session_input, config=config)
-        if isinstance(result, dict):
-            output = ""
-            if "thought" in result:
-                output += f"[Thought]\n{result['thought']}\n\n"
-            if "final_answer" in result:
-                output += f"[Final Answer]\n{result['final_answer']}\n"
-        
-            memory = get_memory(session_id)
-            memory.add_messages([
-            HumanMessage(content=body.question),
-            AIMessage(content=output)
-            ])
-
-            return PlainTextResponse(output)
-
-        else:
-           memory = get_memory(session_id)
-           memory.add_messages([
-            HumanMessage(content=body.question),
-            AIMessage(content=str(result))
-           ])
-           return PlainTextResponse(str(result))
-
-    # --- 5. 非 CoT 模式：StreamingResponse ---
-    async def format_stream_output(stream_result):
-        for chunk in stream_result:
-            yield str(chunk)
-
-    stream = memory_chain.stream(session_input, config=config)
-    return StreamingResponse(format_stream_output(stream), media_type="text/event-stream")
+    yield format_sse("", event="done")
@@ -1,14 +1,53 @@
 from pathlib import Path
 from fastapi.responses import JSONResponse
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from ingestion import FINISHED_STAGES, ingestion_queue
+from response_cache import response_cache
+from vectorstore import vectorstore_manager
 
 router = APIRouter()
 
 UPLOAD_DIR = Path("uploaded_files")
 
+def file_status(path: str) -> dict:
+    """檔案的索引狀態：indexing（背景工作進行中）/ indexed / failed / not_indexed"""
+    job = ingestion_queue.latest_for(path)
+    if job is not None and job.stage not in FINISHED_STAGES:
+        status = "indexing"
+    elif vectorstore_manager.is_indexed(path):
+        status = "indexed"
+    elif job is not None and job.stage == "failed":
+        status = "failed"
+    else:
+        status = "not_indexed"
+    return {
+        "status": status,
+        "stage": job.stage if job else None,
+        "chunks": job.chunks if job else None,
+        "job_id": job.job_id if job else None,
+        "error": job.error if job else None,
+    }
+
 @router.get("/files")
 def list_uploaded_files():
     if not UPLOAD_DIR.exists():
         return []
-    files = [str(UPLOAD_DIR / f.name).replace("\\", "/") for f in UPLOAD_DIR.iterdir() if f.is_file()]
+    files = []
+    for f in sorted(UPLOAD_DIR.iterdir(), key=lambda f: f.name):
+        if not f.is_file():
+            continue
+        path = str(UPLOAD_DIR / f.name).replace("\\", "/")
+        files.append({"path": path, "file_name": f.name, "size": f.stat().st_size, **file_status(path)})
     return JSONResponse(content=files)
+
+@router.delete("/files/{file_name}")
+def delete_uploaded_file(file_name: str):
+    file_path = UPLOAD_DIR / file_name
+    # 只允許刪除上傳目錄下的檔案
+    if file_path.name != file_name or not file_path.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+    file_path.unlink()
+    response_cache.invalidate_file(str(file_path))
+    # 檔案的向量索引由背景壓縮移除（其他相同內容的檔案仍會保留共用的索引）
+    ingestion_queue.schedule_compaction(str(UPLOAD_DIR))
+    return JSONResponse(content={"status": "success", "file_name": file_name})
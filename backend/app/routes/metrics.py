@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from tools.tool_runtime import tool_result_cache
+from utils.metrics import register_callback, render_metrics
+from vectorstore import vectorstore_manager
+
+router = APIRouter()
+
+# 快取狀態在輸出時才讀取
+register_callback("tool_cache_hits_total", "Agent tool result cache hits", lambda: tool_result_cache.hits, kind="counter")
+register_callback("tool_cache_misses_total", "Agent tool result cache misses", lambda: tool_result_cache.misses, kind="counter")
+register_callback("vector_index_cached", "Vector indexes held in the in-process LRU cache", vectorstore_manager.cached_count)
+
+
+@router.get("/metrics")
+def metrics():
+    """Prometheus 文字格式的延遲分布與快取狀態"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
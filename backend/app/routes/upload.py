@@ -1,51 +1,95 @@
 import os
 import shutil
-from fastapi import APIRouter, UploadFile, File, HTTPException
+import threading
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
-from vectorstore import create_vectorstore_from_file
+from ingestion import ingestion_queue
+from response_cache import response_cache
+from vectorstore import index_key
 
 router = APIRouter()
 
 # 儲存路徑
 UPLOAD_DIR = "uploaded_files"
-VECTORSTORE_DIR = "vectorstores"
 
 # 確保路徑存在
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(VECTORSTORE_DIR, exist_ok=True)
 
-def get_unique_filename(directory: str, filename: str) -> str:
+def reserve_unique_filename(directory: str, filename: str) -> str:
+    """挑選不重複的檔名，並以 O_EXCL 建立空檔佔住這個名稱；
+    同時上傳同名檔案（包含其他 worker）時不會選到同一個名稱而互相覆蓋"""
     base, ext = os.path.splitext(filename)
-    counter = 1
-    new_filename = filename
-    while os.path.exists(os.path.join(directory, new_filename)):
-        new_filename = f"{base}({counter}){ext}"
-        counter += 1
-    return new_filename
+    counter = 0
+    while True:
+        new_filename = f"{base}({counter}){ext}" if counter else filename
+        try:
+            fd = os.open(os.path.join(directory, new_filename), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            counter += 1
+            continue
+        os.close(fd)
+        return new_filename
 
-@router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+def save_upload(file: UploadFile, file_path: str):
+    # 先寫到暫存目錄再 rename 取代，其他 worker 不會讀到（或 hash 到）寫一半的檔案
+    tmp_dir = os.path.join(os.path.dirname(file_path), ".partial")
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, f"{os.path.basename(file_path)}.{os.getpid()}-{threading.get_ident()}")
     try:
-        # 自動重新命名重複檔案
-        unique_filename = get_unique_filename(UPLOAD_DIR, file.filename)
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
-
-        # 儲存檔案
-        with open(file_path, "wb") as f:
+        with open(tmp_path, "wb") as f:
             shutil.copyfileobj(file.file, f)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+@router.post("/upload")
+async def upload_file(file: UploadFile = File(...), replace: bool = Form(False)):
+    try:
+        previous_key = None
+        reserved = False
+        if replace and os.path.isfile(os.path.join(UPLOAD_DIR, file.filename)):
+            # 取代同名檔案：記下舊版本的索引，重建時只 embedding 有變動的 chunk
+            unique_filename = file.filename
+            file_path = os.path.join(UPLOAD_DIR, unique_filename)
+            previous_key = await run_in_threadpool(index_key, file_path, "openai")
+        else:
+            # 自動重新命名重複檔案
+            unique_filename = await run_in_threadpool(reserve_unique_filename, UPLOAD_DIR, file.filename)
+            file_path = os.path.join(UPLOAD_DIR, unique_filename)
+            reserved = True
 
-        # 向量儲存資料夾
-        vectorstore_path = os.path.join(VECTORSTORE_DIR, "default")
+        # 儲存檔案（磁碟 I/O 與 hash 計算不在 event loop 上執行）
+        try:
+            await run_in_threadpool(save_upload, file, file_path)
+        except BaseException:
+            # 寫入失敗時移除佔位的空檔
+            if reserved:
+                os.remove(file_path)
+            raise
+        # 同一路徑的檔案內容已改變，引用它的快取回答全部失效
+        response_cache.invalidate_file(file_path)
 
-        # 建立向量資料庫
-        create_vectorstore_from_file(file_path, embed_type="openai", save_path=vectorstore_path)
+        # 排入背景索引工作，立即回傳 job id
+        job = await run_in_threadpool(ingestion_queue.submit, file_path, "openai", previous_key)
 
         return JSONResponse(content={
             "status": "success",
-            "message": "File uploaded and vectorstore created",
-            "file_name": unique_filename
+            "message": "File uploaded, vectorstore is being built" if job.stage != "duplicate"
+                       else "File uploaded, identical content is already indexed",
+            "file_name": unique_filename,
+            "job_id": job.job_id,
+            "stage": job.stage,
         })
 
     except Exception as e:
         print(f"[ERROR] Upload Failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+
+@router.get("/upload/{job_id}")
+def upload_status(job_id: str):
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job.to_dict())
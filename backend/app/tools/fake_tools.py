@@ -0,0 +1,25 @@
+import os
+import time
+
+from langchain_core.tools import tool
+
+# 離線測試用假工具的延遲（秒），模擬網路工具的等待時間
+FAKE_TOOL_LATENCY = float(os.getenv("FAKE_TOOL_LATENCY", "0.5"))
+
+
+@tool
+def fake_search(query: str) -> str:
+    """
+    離線假搜尋：等待固定延遲後回傳假的搜尋摘要，用於 benchmark。
+    """
+    time.sleep(FAKE_TOOL_LATENCY)
+    return f"1. Fake result for {query} - offline snippet (https://example.com/search)"
+
+
+@tool
+def fake_lookup(query: str) -> str:
+    """
+    離線假百科查詢：等待固定延遲後回傳假的條目內容，用於 benchmark。
+    """
+    time.sleep(FAKE_TOOL_LATENCY)
+    return f"Page: {query}\nSummary: fake encyclopedia entry used for offline benchmarks."
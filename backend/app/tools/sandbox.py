@@ -0,0 +1,195 @@
+import atexit
+import contextlib
+import io
+import math
+import os
+import queue
+import signal
+import threading
+from typing import Optional
+
+from utils.spawn import light_main, spawn_context
+
+# 沙箱行程池設定：每個 worker 是獨立的子行程，執行時互不影響，也不會卡住 API server
+SANDBOX_WORKERS = int(os.getenv("SANDBOX_WORKERS", str(min(4, os.cpu_count() or 1))))
+SANDBOX_TIMEOUT = float(os.getenv("SANDBOX_TIMEOUT", "10"))
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "5"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "1024"))
+SANDBOX_MAX_RUNS = int(os.getenv("SANDBOX_MAX_RUNS", "50"))
+SANDBOX_MAX_OUTPUT = int(os.getenv("SANDBOX_MAX_OUTPUT", "10000"))
+# worker 啟動時預先 import 的模組，名稱之後可直接在程式碼中使用
+SANDBOX_PRELOAD = [name for name in os.getenv("SANDBOX_PRELOAD", "math,statistics,json,datetime,numpy,pandas").split(",") if name]
+
+try:
+    import resource
+except ImportError:  # Windows 沒有 resource 模組，只保留 wall-clock 逾時
+    resource = None
+
+
+def _set_limits(cpu_seconds: int, memory_mb: int):
+    if resource is None:
+        return
+    if memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if cpu_seconds > 0:
+        # RLIMIT_CPU 是整個行程累計的 CPU 時間，每次執行前以目前用量為基準重新設定
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = math.ceil(usage.ru_utime + usage.ru_stime)
+        resource.setrlimit(resource.RLIMIT_CPU, (used + cpu_seconds, resource.RLIM_INFINITY))
+
+
+def _execute(code: str, namespace: dict) -> str:
+    """每次執行使用新的 globals（只帶入預先 import 的模組），stdout 只屬於這個 worker"""
+    buffer = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buffer):
+            try:
+                # 嘗試先用 eval（適合像 2 + 2、"Hello".upper()）
+                result = eval(code, dict(namespace))
+                if result is not None:
+                    print(result)
+            except SyntaxError:
+                # eval 不行就 fallback 用 exec（適合多行、定義函數、賦值等）
+                exec(code, dict(namespace))
+        output = buffer.getvalue().strip()
+    except MemoryError:
+        return "Error: memory limit exceeded"
+    except Exception as e:
+        return f"Error: {str(e)}"
+    if len(output) > SANDBOX_MAX_OUTPUT:
+        output = output[:SANDBOX_MAX_OUTPUT] + "\n... (output truncated)"
+    return output
+
+
+def _worker_main(conn, cpu_seconds: int, memory_mb: int, preload: list[str]):
+    """子行程進入點：先預載模組，再套用記憶體限制，之後逐一執行收到的程式碼"""
+    # 平行度由行程池提供，每個 worker 內的數值函式庫只用單一執行緒
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, "1")
+    namespace: dict = {}
+    for name in preload:
+        try:
+            namespace[name.split(".")[0]] = __import__(name.strip())
+        except ImportError:
+            pass
+    if "numpy" in namespace:
+        namespace["np"] = namespace["numpy"]
+    if "pandas" in namespace:
+        namespace["pd"] = namespace["pandas"]
+    _set_limits(0, memory_mb)
+
+    while True:
+        try:
+            code = conn.recv()
+        except EOFError:
+            break
+        _set_limits(cpu_seconds, 0)
+        conn.send(_execute(code, namespace))
+
+
+class SandboxWorker:
+    def __init__(self, ctx, cpu_seconds: int, memory_mb: int, preload: list[str]):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, cpu_seconds, memory_mb, preload),
+            daemon=True,
+        )
+        # 子行程只 import 本模組，不會重新執行 server 的 __main__（整個 app）
+        with light_main():
+            self.process.start()
+        child_conn.close()
+        self.runs = 0
+
+    def kill(self):
+        with contextlib.suppress(Exception):
+            self.process.kill()
+            self.process.join(timeout=1)
+        with contextlib.suppress(Exception):
+            self.conn.close()
+
+
+class SandboxPool:
+    """預先啟動的子行程池：每個 worker 有 CPU 時間、記憶體與 wall-clock 限制，
+    逾時或崩潰的 worker 直接砍掉並補上新的，執行 max_runs 次後也會換新，避免狀態與記憶體累積。"""
+
+    def __init__(
+        self,
+        size: int = SANDBOX_WORKERS,
+        timeout: float = SANDBOX_TIMEOUT,
+        cpu_seconds: int = SANDBOX_CPU_SECONDS,
+        memory_mb: int = SANDBOX_MEMORY_MB,
+        max_runs: int = SANDBOX_MAX_RUNS,
+        preload: Optional[list[str]] = None,
+    ):
+        # spawn：不繼承 server 的執行緒與連線狀態，各平台行為一致
+        self._ctx = spawn_context()
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.max_runs = max_runs
+        self.preload = SANDBOX_PRELOAD if preload is None else preload
+        self._idle: "queue.Queue[SandboxWorker]" = queue.Queue()
+        self._workers: set[SandboxWorker] = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(max(1, size)):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> SandboxWorker:
+        worker = SandboxWorker(self._ctx, self.cpu_seconds, self.memory_mb, self.preload)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _retire(self, worker: SandboxWorker):
+        worker.kill()
+        with self._lock:
+            self._workers.discard(worker)
+
+    def run(self, code: str, timeout: Optional[float] = None) -> str:
+        """在閒置的 worker 中執行程式碼；所有 worker 都忙碌時排隊等待"""
+        timeout = self.timeout if timeout is None else timeout
+        worker = self._idle.get()
+        healthy = False
+        try:
+            worker.conn.send(code)
+            if not worker.conn.poll(timeout):
+                return f"Error: execution timed out after {timeout:g}s"
+            output = worker.conn.recv()
+            healthy = True
+            return output
+        except (EOFError, OSError):
+            worker.process.join(timeout=1)
+            if resource is not None and worker.process.exitcode == -signal.SIGXCPU:
+                return f"Error: CPU time limit of {self.cpu_seconds}s exceeded"
+            return f"Error: interpreter process exited unexpectedly (code {worker.process.exitcode})"
+        finally:
+            worker.runs += 1
+            if not healthy or worker.runs >= self.max_runs:
+                self._retire(worker)
+                worker = None if self._closed else self._spawn()
+            if worker is not None:
+                self._idle.put(worker)
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.kill()
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool() -> SandboxPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool()
+            atexit.register(_pool.close)
+        return _pool
@@ -1,14 +1,72 @@
-from tools.web_search_tool import web_search
-from tools.code_interpreter_tool import code_interpreter
-from langchain_community.tools import WikipediaQueryRun
-from langchain_community.utilities.wikipedia import WikipediaAPIWrapper
-from langchain_community.tools.arxiv.tool import ArxivQueryRun
-from langchain_community.utilities.arxiv import ArxivAPIWrapper
+import threading
+from collections.abc import Mapping
+from typing import Callable, Iterator
+
+from langchain_core.tools import BaseTool
+
+from utils.fake_backends import ENABLE_FAKE_BACKENDS
+
+
+def _load_web_search() -> BaseTool:
+    from tools.web_search_tool import web_search
+    return web_search
+
+
+def _load_code_interpreter() -> BaseTool:
+    from tools.code_interpreter_tool import code_interpreter
+    return code_interpreter
+
+
+def _load_wikipedia() -> BaseTool:
+    from langchain_community.tools import WikipediaQueryRun
+    from langchain_community.utilities.wikipedia import WikipediaAPIWrapper
+    return WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper())
+
+
+def _load_arxiv() -> BaseTool:
+    from langchain_community.tools.arxiv.tool import ArxivQueryRun
+    from langchain_community.utilities.arxiv import ArxivAPIWrapper
+    return ArxivQueryRun(api_wrapper=ArxivAPIWrapper())
+
+
+def _load_fake_search() -> BaseTool:
+    from tools.fake_tools import fake_search
+    return fake_search
+
+
+def _load_fake_lookup() -> BaseTool:
+    from tools.fake_tools import fake_lookup
+    return fake_lookup
+
+
+class LazyToolRegistry(Mapping):
+    """工具在第一次被使用時才 import 與建立，之後重複使用同一個實例"""
+
+    def __init__(self, loaders: dict[str, Callable[[], BaseTool]]):
+        self._loaders = loaders
+        self._tools: dict[str, BaseTool] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> BaseTool:
+        loader = self._loaders[name]
+        with self._lock:
+            if name not in self._tools:
+                self._tools[name] = loader()
+            return self._tools[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._loaders)
+
+    def __len__(self) -> int:
+        return len(self._loaders)
+
 
 # 註冊工具字典
-TOOL_REGISTRY = {
-    "web_search": web_search,
-    "code_interpreter": code_interpreter,
-    "wikipedia": WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper()),
-    "arxiv": ArxivQueryRun(api_wrapper=ArxivAPIWrapper()),
-}
+TOOL_REGISTRY = LazyToolRegistry({
+    "web_search": _load_web_search,
+    "code_interpreter": _load_code_interpreter,
+    "wikipedia": _load_wikipedia,
+    "arxiv": _load_arxiv,
+    # 離線假工具，只在 ENABLE_FAKE_BACKENDS 時提供（benchmark 使用）
+    **({"fake_search": _load_fake_search, "fake_lookup": _load_fake_lookup} if ENABLE_FAKE_BACKENDS else {}),
+})
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Optional
+
+from langchain_core.tools import BaseTool, StructuredTool
+
+from utils.normalize import normalize_question
+from utils.metrics import METRICS_ENABLED, tool_call_seconds
+
+# 工具執行緒池大小：同一步驟中多個工具呼叫可同時執行
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "8"))
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "15"))
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", "600"))
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "1024"))
+
+# 各工具的逾時（秒），未列出的使用 TOOL_TIMEOUT
+TOOL_TIMEOUTS = {
+    "web_search": float(os.getenv("TOOL_TIMEOUT_WEB_SEARCH", "10")),
+    "wikipedia": float(os.getenv("TOOL_TIMEOUT_WIKIPEDIA", "10")),
+    "arxiv": float(os.getenv("TOOL_TIMEOUT_ARXIV", "15")),
+    "code_interpreter": float(os.getenv("TOOL_TIMEOUT_CODE_INTERPRETER", "30")),
+}
+# 結果會隨執行而改變的工具不快取
+UNCACHED_TOOLS = {"code_interpreter"}
+
+_tool_pool = ThreadPoolExecutor(max_workers=TOOL_CONCURRENCY, thread_name_prefix="tool")
+
+
+def tool_cache_key(tool_name: str, tool_input: Any) -> tuple[str, str]:
+    """以 (工具名稱, 正規化後的輸入) 為 key，大小寫、空白與標點差異視為同一個查詢"""
+    if isinstance(tool_input, str):
+        return tool_name, normalize_question(tool_input)
+    if isinstance(tool_input, dict) and len(tool_input) == 1:
+        value = next(iter(tool_input.values()))
+        if isinstance(value, str):
+            return tool_name, normalize_question(value)
+    return tool_name, json.dumps(tool_input, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class ToolResultCache:
+    """工具結果的 TTL + LRU 快取，所有 agent 請求共用"""
+
+    def __init__(self, ttl: float = TOOL_CACHE_TTL, max_entries: int = TOOL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple[str, str], tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple[str, str]) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple[str, str], result: str):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+tool_result_cache = ToolResultCache()
+
+
+def _error_result(tool_name: str, message: str) -> str:
+    # 以文字回傳給 agent 當作 Observation，讓 agent 可以改用其他工具或直接回答
+    return f"Error: {tool_name} {message}"
+
+
+def managed_tool(
+    tool: BaseTool,
+    timeout: Optional[float] = None,
+    cache: Optional[ToolResultCache] = tool_result_cache,
+) -> BaseTool:
+    """包裝工具：在共用執行緒池中執行（非同步呼叫不會卡住 event loop）、套用逾時並快取結果"""
+    name = tool.name
+    timeout = timeout if timeout is not None else TOOL_TIMEOUTS.get(name, TOOL_TIMEOUT)
+    if name in UNCACHED_TOOLS:
+        cache = None
+
+    def parse(args: tuple, kwargs: dict) -> Any:
+        # ReAct 傳入單一字串；tool calling 傳入參數 dict，單一參數時取其值，與原工具的呼叫方式一致
+        if args:
+            return args[0]
+        return kwargs if len(kwargs) != 1 else next(iter(kwargs.values()))
+
+    def lookup(tool_input: Any) -> tuple[Optional[tuple[str, str]], Optional[str]]:
+        if cache is None:
+            return None, None
+        key = tool_cache_key(name, tool_input)
+        return key, cache.get(key)
+
+    def finish(key: Optional[tuple[str, str]], result: Any) -> str:
+        result = str(result)
+        if key is not None and not result.startswith("Error:"):
+            cache.put(key, result)
+        return result
+
+    def observe(started: float, status: str):
+        if METRICS_ENABLED:
+            tool_call_seconds.observe(time.perf_counter() - started, name, status)
+
+    def run(*args: Any, **kwargs: Any) -> str:
+        started = time.perf_counter()
+        tool_input = parse(args, kwargs)
+        key, cached = lookup(tool_input)
+        if cached is not None:
+            observe(started, "cached")
+            return cached
+        future = _tool_pool.submit(tool.invoke, tool_input)
+        try:
+            result = finish(key, future.result(timeout=timeout))
+            observe(started, "ok")
+            return result
+        except FutureTimeoutError:
+            future.cancel()
+            observe(started, "timeout")
+            return _error_result(name, f"timed out after {timeout:g}s")
+        except Exception as e:
+            observe(started, "error")
+            return _error_result(name, f"failed: {e}")
+
+    async def arun(*args: Any, **kwargs: Any) -> str:
+        started = time.perf_counter()
+        tool_input = parse(args, kwargs)
+        key, cached = lookup(tool_input)
+        if cached is not None:
+            observe(started, "cached")
+            return cached
+        loop = asyncio.get_running_loop()
+        try:
+            result = await asyncio.wait_for(loop.run_in_executor(_tool_pool, tool.invoke, tool_input), timeout)
+            result = finish(key, result)
+            observe(started, "ok")
+            return result
+        except asyncio.TimeoutError:
+            observe(started, "timeout")
+            return _error_result(name, f"timed out after {timeout:g}s")
+        except Exception as e:
+            observe(started, "error")
+            return _error_result(name, f"failed: {e}")
+
+    return StructuredTool(
+        name=name,
+        description=tool.description,
+        args_schema=tool.args_schema,
+        func=run,
+        coroutine=arun,
+    )
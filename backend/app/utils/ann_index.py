@@ -0,0 +1,167 @@
+import math
+import os
+import pickle
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+from utils.coordination import MULTI_WORKER
+from utils.docstore import has_docstore, open_docstore, write_docstore
+
+# 索引類型：flat（精確搜尋）/ ivf_flat / hnsw / ivf_pq / sq8，auto 依 chunk 數自動選擇
+ANN_INDEX_MODE = os.getenv("ANN_INDEX_MODE", "auto")
+# auto 模式的門檻（依 benchmarks/bench_ann.py 的 recall / 延遲結果）
+ANN_FLAT_MAX = int(os.getenv("ANN_FLAT_MAX", "20000"))
+ANN_HNSW_MAX = int(os.getenv("ANN_HNSW_MAX", "200000"))
+# 向量數太少時分群 / 量化訓練不穩定，任何模式都改用 flat
+ANN_MIN_VECTORS = int(os.getenv("ANN_MIN_VECTORS", "1000"))
+# 搜尋參數：探索的 IVF 分群數 / HNSW 候選數，越大 recall 越高、越慢
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+ANN_EF_SEARCH = int(os.getenv("ANN_EF_SEARCH", "64"))
+ANN_HNSW_M = int(os.getenv("ANN_HNSW_M", "32"))
+ANN_PQ_M = int(os.getenv("ANN_PQ_M", "64"))
+# 每個分群取多少個向量訓練，上限避免大型語料訓練過久
+ANN_TRAIN_PER_LIST = int(os.getenv("ANN_TRAIN_PER_LIST", "64"))
+# 以 mmap 唯讀方式載入索引，向量留在 page cache，由作業系統按需讀取；多個 worker 共用同一份
+ANN_MMAP = os.getenv("ANN_MMAP", "true").lower() in ("1", "true", "yes")
+
+ANN_INDEX_MODES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "sq8")
+
+
+def choose_index_mode(ntotal: int, mode: str = ANN_INDEX_MODE) -> str:
+    """小型語料用精確搜尋；中型用 HNSW；大型用 IVF + 8-bit 純量量化，記憶體約為 float32 的 1/4"""
+    if ntotal < ANN_MIN_VECTORS:
+        return "flat"
+    if mode != "auto":
+        if mode not in ANN_INDEX_MODES:
+            raise ValueError(f"Unsupported index mode: {mode}")
+        return mode
+    if ntotal <= ANN_FLAT_MAX:
+        return "flat"
+    if ntotal <= ANN_HNSW_MAX:
+        # HNSW 的圖與向量讀檔時一定會複製到行程記憶體，多 worker 共用索引時改用可以 mmap 的 IVF
+        return "ivf_flat" if MULTI_WORKER and ANN_MMAP else "hnsw"
+    return "sq8"
+
+
+def _nlist(ntotal: int) -> int:
+    # 分群數約為 4 * sqrt(n)，且每群至少有 39 個訓練點
+    return max(1, min(int(4 * math.sqrt(ntotal)), ntotal // 39))
+
+
+def _pq_m(dim: int) -> int:
+    # PQ 子向量數必須整除維度
+    return max(m for m in range(1, min(ANN_PQ_M, dim) + 1) if dim % m == 0)
+
+
+def index_factory_spec(mode: str, ntotal: int, dim: int) -> str:
+    nlist = _nlist(ntotal)
+    if mode == "flat":
+        return "Flat"
+    elif mode == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    elif mode == "hnsw":
+        return f"HNSW{ANN_HNSW_M},Flat"
+    elif mode == "ivf_pq":
+        return f"IVF{nlist},PQ{_pq_m(dim)}x8"
+    elif mode == "sq8":
+        return f"IVF{nlist},SQ8"
+    else:
+        raise ValueError(f"Unsupported index mode: {mode}")
+
+
+def tune_search(index: faiss.Index, nprobe: int = ANN_NPROBE, ef_search: int = ANN_EF_SEARCH) -> faiss.Index:
+    """設定搜尋參數（不會隨索引存檔，載入後需重新設定）"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    hnsw = getattr(index, "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+    return index
+
+
+def build_ann_index(vectors: np.ndarray, mode: str, metric: int = faiss.METRIC_L2) -> faiss.Index:
+    """以指定類型建立索引；需要訓練的類型以均勻抽樣的向量訓練"""
+    ntotal, dim = vectors.shape
+    index = faiss.index_factory(dim, index_factory_spec(mode, ntotal, dim), metric)
+    if not index.is_trained:
+        sample_size = min(ntotal, _nlist(ntotal) * ANN_TRAIN_PER_LIST)
+        if mode == "ivf_pq":
+            sample_size = max(sample_size, min(ntotal, 256 * 39))  # PQ 每個子空間 256 個中心
+        sample = vectors[np.random.default_rng(0).choice(ntotal, sample_size, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    return tune_search(index)
+
+
+def to_ann(db: FAISS, mode: str = ANN_INDEX_MODE) -> FAISS:
+    """把串流建立的 flat 索引換成依語料大小選擇的索引類型，向量順序與 docstore 對應不變"""
+    ntotal = db.index.ntotal
+    mode = choose_index_mode(ntotal, mode)
+    if mode == "flat":
+        return db
+    vectors = db.index.reconstruct_n(0, ntotal)
+    metric = faiss.METRIC_INNER_PRODUCT if db.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT else faiss.METRIC_L2
+    db.index = build_ann_index(vectors, mode, metric)
+    return db
+
+
+def is_exact(index: faiss.Index) -> bool:
+    """索引是否保存原始向量（量化索引 reconstruct 只會得到近似值）"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return isinstance(faiss.downcast_index(ivf), faiss.IndexIVFFlat)
+    storage = getattr(index, "storage", None)
+    if storage is not None:
+        return isinstance(faiss.downcast_index(storage), faiss.IndexFlat)
+    return isinstance(index, faiss.IndexFlat)
+
+
+def reconstruct(index: faiss.Index, position: int) -> np.ndarray:
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        # IVF 需要 id -> 位置的對照表才能 reconstruct，只建立一次
+        ivf.make_direct_map()
+    return index.reconstruct(position)
+
+
+def mmap_compatible(index: faiss.Index) -> faiss.Index:
+    """faiss 讀取 IndexFlat 時一定會把向量複製到記憶體，即使指定 IO_FLAG_MMAP；
+    改存成只有一個分群的 IVF（搜尋時掃描全部向量，結果與 flat 完全相同），向量才能以 mmap 共用"""
+    if not isinstance(index, faiss.IndexFlat):
+        return index
+    ivf = faiss.index_factory(index.d, "IVF1,Flat", index.metric_type)
+    # 只有一個分群，中心點不影響結果，不需要訓練
+    faiss.extract_index_ivf(ivf).quantizer.add(np.zeros((1, index.d), dtype=np.float32))
+    ivf.is_trained = True
+    if index.ntotal:
+        ivf.add(index.reconstruct_n(0, index.ntotal))
+    return tune_search(ivf)
+
+
+def save_faiss(db: FAISS, path: str, mmap: bool = ANN_MMAP):
+    """等同 FAISS.save_local，但 docstore 存成 SQLite（查詢時才讀取命中的 chunk），
+    使用 mmap 時 flat 索引改存成可以 mmap 的格式"""
+    os.makedirs(path, exist_ok=True)
+    faiss.write_index(mmap_compatible(db.index) if mmap else db.index, os.path.join(path, "index.faiss"))
+    write_docstore(path, db.index_to_docstore_id, db.docstore)
+
+
+def load_faiss(path: str, embeddings, mmap: bool = ANN_MMAP) -> FAISS:
+    """等同 FAISS.load_local，但可用 mmap 唯讀載入向量索引；docstore 以唯讀 SQLite 開啟，
+    舊格式的索引目錄仍以 pickle 讀入 index.pkl（只讀取本服務自己寫入的檔案）"""
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    index = tune_search(faiss.read_index(os.path.join(path, "index.faiss"), flags))
+    if has_docstore(path):
+        docstore, index_to_docstore_id = open_docstore(path)
+    else:
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def index_bytes(index: faiss.Index) -> int:
+    return faiss.serialize_index(index).nbytes
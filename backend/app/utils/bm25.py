@@ -0,0 +1,193 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from collections.abc import Sequence
+from typing import Iterable, Optional, Union
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from utils.embedding_cache import text_hash
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# 檔名帶版本，斷詞規則或儲存格式改變時會自動重建
+BM25_PREFIX = "bm25-v2"
+
+# 英數字詞（保留 SKU-123、v1.2、col_name 這類代碼）與連續的 CJK 字元
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[\-_.][a-z0-9]+)*|[㐀-鿿豈-﫿぀-ヿ가-힯]+")
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿぀-ヿ가-힯]")
+
+
+def tokenize(text: str) -> list[str]:
+    """英數字以詞為單位（代碼另外拆出各段），CJK 以字元 bigram 為單位（單字則保留 unigram）"""
+    tokens: list[str] = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        if _CJK_RE.match(token):
+            if len(token) == 1:
+                tokens.append(token)
+            else:
+                tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+            if any(sep in token for sep in "-_."):
+                tokens.extend(part for part in re.split(r"[\-_.]", token) if part)
+    return tokens
+
+
+def doc_key(doc: Document) -> str:
+    # FAISS 回傳的 Document.id 即 docstore id，與 BM25 的 doc id 相同
+    return doc.id or text_hash(doc.page_content)
+
+
+class PackedPostings:
+    """存檔後的倒排串列：所有 term 的文件位置與詞頻各自串成一個陣列（以 mmap 讀取，多個 worker 共用），
+    term -> [start, end) 指向其中一段"""
+
+    def __init__(self, offsets: dict[str, list[int]], positions: np.ndarray, freqs: np.ndarray):
+        self.offsets = offsets
+        self.positions = positions
+        self.freqs = freqs
+
+    def get(self, term: str) -> Optional[tuple[np.ndarray, np.ndarray]]:
+        span = self.offsets.get(term)
+        if span is None:
+            return None
+        start, end = span
+        return self.positions[start:end], self.freqs[start:end]
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+
+class PackedIds(Sequence):
+    """以固定寬度 bytes 陣列（mmap）存放的 docstore id"""
+
+    def __init__(self, ids: np.ndarray):
+        self.ids = ids
+
+    def __getitem__(self, i):
+        return self.ids[i].decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+Postings = Union[dict[str, tuple[np.ndarray, np.ndarray]], PackedPostings]
+
+
+class BM25Index:
+    """單一檔案的 BM25 倒排索引：term -> (文件位置陣列, 詞頻陣列)，與 FAISS 索引放在同一個目錄"""
+
+    def __init__(self, doc_ids: Sequence[str], doc_lengths: np.ndarray, postings: Postings):
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        self.postings = postings
+
+    @classmethod
+    def build(cls, docs: Iterable[tuple[str, str]]) -> "BM25Index":
+        doc_ids: list[str] = []
+        lengths: list[int] = []
+        positions: dict[str, list[int]] = defaultdict(list)
+        freqs: dict[str, list[int]] = defaultdict(list)
+        for position, (doc_id, text) in enumerate(docs):
+            tokens = tokenize(text)
+            doc_ids.append(doc_id)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                positions[term].append(position)
+                freqs[term].append(tf)
+        postings = {
+            term: (np.asarray(positions[term], dtype=np.int32), np.asarray(freqs[term], dtype=np.float32))
+            for term in positions
+        }
+        return cls(doc_ids, np.asarray(lengths, dtype=np.float32), postings)
+
+    @classmethod
+    def from_faiss(cls, db: FAISS) -> "BM25Index":
+        def docs():
+            for position in range(len(db.index_to_docstore_id)):
+                doc_id = db.index_to_docstore_id[position]
+                doc = db.docstore.search(doc_id)
+                if isinstance(doc, Document):
+                    yield doc_id, doc.page_content
+        return cls.build(docs())
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        """回傳 (docstore id, BM25 分數)，分數越大越相關"""
+        n = len(self.doc_ids)
+        if n == 0:
+            return []
+        scores = np.zeros(n, dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / max(self.avg_length, 1e-9))
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            positions, tf = posting
+            idf = math.log(1 + (n - len(positions) + 0.5) / (len(positions) + 0.5))
+            scores[positions] += idf * tf * (BM25_K1 + 1) / (tf + norm[positions])
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(self.doc_ids[i], float(scores[i])) for i in hits]
+
+    @staticmethod
+    def _path(index_dir: str, name: str) -> str:
+        return os.path.join(index_dir, f"{BM25_PREFIX}-{name}")
+
+    def save(self, index_dir: str):
+        """存成 numpy 陣列檔（可 mmap）與 term 對照表；對照表最後寫入，存在即表示其他檔案都已完成"""
+        offsets: dict[str, list[int]] = {}
+        start = 0
+        for term, (positions, _) in self.postings.items():
+            offsets[term] = [start, start + len(positions)]
+            start += len(positions)
+        values = list(self.postings.values())
+        ids = [doc_id.encode("utf-8") for doc_id in self.doc_ids]
+        arrays = {
+            "positions.npy": np.concatenate([p for p, _ in values]) if values else np.zeros(0, dtype=np.int32),
+            "freqs.npy": np.concatenate([f for _, f in values]) if values else np.zeros(0, dtype=np.float32),
+            "lengths.npy": np.asarray(self.doc_lengths, dtype=np.float32),
+            "ids.npy": np.asarray(ids, dtype=f"S{max((len(i) for i in ids), default=1)}"),
+        }
+        suffix = f".tmp-{os.getpid()}-{threading.get_ident()}"
+        for name, array in arrays.items():
+            with open(self._path(index_dir, name) + suffix, "wb") as f:
+                np.save(f, array)
+            os.replace(self._path(index_dir, name) + suffix, self._path(index_dir, name))
+        with open(self._path(index_dir, "terms.json") + suffix, "w", encoding="utf-8") as f:
+            json.dump(offsets, f, ensure_ascii=False)
+        os.replace(self._path(index_dir, "terms.json") + suffix, self._path(index_dir, "terms.json"))
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["BM25Index"]:
+        terms_path = cls._path(index_dir, "terms.json")
+        if not os.path.exists(terms_path):
+            return None
+        with open(terms_path, "r", encoding="utf-8") as f:
+            offsets = json.load(f)
+        arrays = {name: np.load(cls._path(index_dir, f"{name}.npy"), mmap_mode="r")
+                  for name in ("positions", "freqs", "lengths", "ids")}
+        postings = PackedPostings(offsets, arrays["positions"], arrays["freqs"])
+        return cls(PackedIds(arrays["ids"]), arrays["lengths"], postings)
+
+
+def load_or_build_bm25(index_dir: str, db: FAISS) -> BM25Index:
+    """讀取索引目錄中的 BM25；舊索引沒有時由 docstore 建立並寫回"""
+    bm25 = BM25Index.load(index_dir)
+    if bm25 is None:
+        bm25 = BM25Index.from_faiss(db)
+        if os.path.isdir(index_dir):
+            try:
+                bm25.save(index_dir)
+            except OSError as e:
+                print(f"[ERROR] Failed to save BM25 index: {str(e)}")
+    return bm25
@@ -0,0 +1,163 @@
+import os
+import re
+from typing import Iterable, Iterator, List, Optional
+
+from langchain_core.documents import Document
+
+from utils.tokens import count_tokens
+
+# 切塊參數（以 token 計）：每個 chunk 的上限、相鄰 chunk 的重疊量、parent 區塊的上限
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+PARENT_CHUNK_TOKENS = int(os.getenv("PARENT_CHUNK_TOKENS", "1200"))
+# 切塊規則改變時提高版本，讓索引 key 跟著改變
+CHUNKER_VERSION = "2"
+
+_PARAGRAPH_RE = re.compile(r"\n[ \t]*\n+")
+# 在句末標點（中英文）之後切開，標點留在前一句
+_SENTENCE_RE = re.compile(r"(?<=[。！？；!?;…])|(?<=[.])(?=\s)")
+# 章節標題：Markdown 標題、「第X章 / 節」、「1.2 標題」
+_HEADING_RE = re.compile(
+    r"^(#{1,6}\s+\S.*|第[一二三四五六七八九十百千零〇0-9]+[章節节篇部].{0,40}|\d+(\.\d+){0,3}\.?\s+[^\s.。].{0,60})$"
+)
+
+
+def chunker_signature() -> str:
+    return f"chunker={CHUNKER_VERSION}/{CHUNK_TOKENS}/{CHUNK_OVERLAP_TOKENS}/{PARENT_CHUNK_TOKENS}"
+
+
+def is_heading(paragraph: str) -> bool:
+    line = paragraph.strip()
+    return "\n" not in line and len(line) <= 80 and bool(_HEADING_RE.match(line)) and not line.endswith(("。", "."))
+
+
+def split_sentences(text: str) -> List[str]:
+    return [part for part in _SENTENCE_RE.split(text) if part]
+
+
+class _ChunkBuilder:
+    """累積句子 / 列直到 token 上限後輸出一個 chunk，並記錄章節與 parent / child 編號"""
+
+    def __init__(self, chunk_tokens: int, overlap_tokens: int, parent_tokens: int):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.parent_tokens = parent_tokens
+        # (文字, token 數, CSV 列號或 None)
+        self.pieces: list[tuple[str, int, Optional[int]]] = []
+        self.tokens = 0
+        self.metadata: Optional[dict] = None
+        self.section: Optional[str] = None
+        self.chunk_id = 0
+        self.parent_id = 0
+        self.parent_used = 0
+
+    def start(self, metadata: dict) -> Iterator[Document]:
+        """來源位置（例如 PDF 頁碼）改變時結束目前的 chunk 與 parent，chunk 不會跨頁"""
+        base = {key: value for key, value in metadata.items() if key != "row"}
+        if base != self.metadata:
+            yield from self.flush(end_parent=True)
+            self.metadata = base
+
+    def add(self, text: str, tokens: Optional[int] = None, row: Optional[int] = None) -> Iterator[Document]:
+        tokens = count_tokens(text) if tokens is None else tokens
+        if tokens > self.chunk_tokens:
+            # 單句（或單列）就超過上限，例如沒有標點的長段落，依字元比例硬切
+            step = max(1, len(text) * self.chunk_tokens // tokens)
+            for start in range(0, len(text), step):
+                yield from self.add(text[start:start + step], row=row)
+            return
+        if self.pieces and self.tokens + tokens > self.chunk_tokens:
+            yield from self.emit(overlap=row is None)
+        if not self.pieces and not text.strip():
+            return
+        self.pieces.append((text, tokens, row))
+        self.tokens += tokens
+
+    def add_paragraph(self, paragraph: str) -> Iterator[Document]:
+        if is_heading(paragraph):
+            # 新章節從新的 chunk 與 parent 開始，標題本身放在 chunk 開頭
+            yield from self.flush(end_parent=True)
+            self.section = paragraph.strip().lstrip("#").strip()
+        text = paragraph + "\n\n"
+        tokens = count_tokens(text)
+        if self.tokens + tokens <= self.chunk_tokens:
+            yield from self.add(text, tokens)
+            return
+        for sentence in split_sentences(text):
+            yield from self.add(sentence)
+
+    def add_row(self, row: int, text: str) -> Iterator[Document]:
+        """CSV 列整列打包：多個小列合成一個 chunk，列不會被切開（除非單列超過上限）"""
+        yield from self.add(text + "\n\n", row=row)
+
+    def emit(self, overlap: bool) -> Iterator[Document]:
+        content = "".join(text for text, _, _ in self.pieces).strip()
+        if content:
+            if self.parent_used and self.parent_used + self.tokens > self.parent_tokens:
+                self.parent_id += 1
+                self.parent_used = 0
+            metadata = dict(self.metadata or {})
+            if self.section:
+                metadata["section"] = self.section
+            rows = [row for _, _, row in self.pieces if row is not None]
+            if rows:
+                metadata["row"], metadata["row_end"] = rows[0], rows[-1]
+            metadata["chunk_id"] = self.chunk_id
+            metadata["parent_id"] = self.parent_id
+            self.chunk_id += 1
+            self.parent_used += self.tokens
+            yield Document(page_content=content, metadata=metadata)
+
+        # 保留尾端幾句作為下一個 chunk 的開頭，讓跨 chunk 的句子仍有上下文
+        kept: list[tuple[str, int, Optional[int]]] = []
+        kept_tokens = 0
+        if overlap and self.overlap_tokens > 0:
+            for piece in reversed(self.pieces):
+                if kept_tokens + piece[1] > self.overlap_tokens or piece[2] is not None:
+                    break
+                kept.insert(0, piece)
+                kept_tokens += piece[1]
+        self.pieces, self.tokens = kept, kept_tokens
+
+    def flush(self, end_parent: bool = False) -> Iterator[Document]:
+        if self.pieces:
+            yield from self.emit(overlap=False)
+        if end_parent and self.parent_used:
+            self.parent_id += 1
+            self.parent_used = 0
+
+
+class Chunker:
+    """token 預算導向、保留文件結構的切塊器，取代 CharacterTextSplitter：
+
+    - 以段落 -> 句子（含中文標點）-> 字元的順序切分，chunk 大小以 token 計算
+    - PDF 的 chunk 不跨頁，章節標題會開新的 chunk 並記錄在 metadata["section"]
+    - CSV 的多個小列打包成一個 chunk（metadata 記錄 row 與 row_end）
+    - 每個 chunk 有 chunk_id，相鄰的 chunk 組成 parent（parent_id），可用來擴充上下文
+    """
+
+    def __init__(
+        self,
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        parent_tokens: int = PARENT_CHUNK_TOKENS,
+    ):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.parent_tokens = parent_tokens
+
+    def iter_chunks(self, docs: Iterable[Document]) -> Iterator[Document]:
+        """逐一處理 loader 串流出的 Document，邊讀邊輸出 chunk"""
+        builder = _ChunkBuilder(self.chunk_tokens, self.overlap_tokens, self.parent_tokens)
+        for doc in docs:
+            yield from builder.start(doc.metadata)
+            if "row" in doc.metadata:
+                yield from builder.add_row(doc.metadata["row"], doc.page_content)
+                continue
+            for paragraph in _PARAGRAPH_RE.split(doc.page_content):
+                if paragraph.strip():
+                    yield from builder.add_paragraph(paragraph)
+        yield from builder.flush(end_parent=True)
+
+    def split_documents(self, docs: Iterable[Document]) -> List[Document]:
+        return list(self.iter_chunks(docs))
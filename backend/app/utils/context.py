@@ -0,0 +1,177 @@
+import os
+import re
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from utils.bm25 import tokenize
+from utils.metrics import histogram
+from utils.tokens import count_tokens
+
+# 每個模型放入 prompt 的參考資料 token 上限；agent 的輸入會在每一輪推理重送，預算較小
+CONTEXT_TOKEN_BUDGETS = {
+    "openai": int(os.getenv("CONTEXT_TOKEN_BUDGET_OPENAI", "2000")),
+    "ollama": int(os.getenv("CONTEXT_TOKEN_BUDGET_OLLAMA", "1200")),
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+AGENT_CONTEXT_TOKEN_BUDGET = int(os.getenv("AGENT_CONTEXT_TOKEN_BUDGET", "600"))
+# 檢索時多取一些候選，再由 MMR 與 token 預算決定實際放入哪些
+CONTEXT_FETCH_K = int(os.getenv("CONTEXT_FETCH_K", "8"))
+# MMR 中相關度的權重（1 = 只看檢索排名，0 = 只看多樣性）與近似重複的相似度門檻
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+# 剩餘預算少於這個值時不再截斷段落硬塞
+CONTEXT_MIN_PASSAGE_TOKENS = int(os.getenv("CONTEXT_MIN_PASSAGE_TOKENS", "40"))
+
+context_tokens = histogram(
+    "rag_context_tokens",
+    "Tokens of retrieved context before (raw) and after (packed) context assembly",
+    ("kind",),
+    buckets=(100, 250, 500, 1000, 1500, 2000, 3000, 5000, 10000),
+)
+
+_SENTENCE_END_RE = re.compile(r"[。！？!?.;；\n]")
+
+
+def context_budget(model: str, agent: bool = False) -> int:
+    if agent:
+        return AGENT_CONTEXT_TOKEN_BUDGET
+    return CONTEXT_TOKEN_BUDGETS.get(model, DEFAULT_CONTEXT_TOKEN_BUDGET)
+
+
+def _similarity(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _overlap(previous: str, text: str, max_chars: int = 4000) -> int:
+    """previous 的結尾與 text 的開頭重疊的字元數（相鄰 chunk 的重疊句子）；太短的重疊不處理"""
+    anchor = text[:16]
+    if len(anchor) < 16:
+        return 0
+    pos = previous.find(anchor, max(0, len(previous) - max_chars))
+    while pos != -1:
+        if text.startswith(previous[pos:]):
+            return len(previous) - pos
+        pos = previous.find(anchor, pos + 1)
+    return 0
+
+
+def _location(doc: Document) -> tuple:
+    # 同一來源、同一頁（PDF chunk 不跨頁）的相鄰 chunk 才合併
+    return doc.metadata.get("source"), doc.metadata.get("page")
+
+
+def merge_adjacent(docs: List[Document]) -> List[Document]:
+    """同一來源中 chunk_id 連續的片段合併成一段，並去掉重疊的部分；合併後放在其中排名最前的位置"""
+    ranks = sorted(
+        (rank for rank, doc in enumerate(docs) if doc.metadata.get("chunk_id") is not None),
+        key=lambda rank: (repr(_location(docs[rank])), docs[rank].metadata["chunk_id"]),
+    )
+    runs: List[List[int]] = []
+    for rank in ranks:
+        previous = runs[-1][-1] if runs else None
+        if (previous is not None and _location(docs[previous]) == _location(docs[rank])
+                and docs[previous].metadata["chunk_id"] + 1 == docs[rank].metadata["chunk_id"]):
+            runs[-1].append(rank)
+        else:
+            runs.append([rank])
+
+    merged: List[Optional[Document]] = list(docs)
+    for run in runs:
+        if len(run) == 1:
+            continue
+        first = docs[run[0]]
+        text = first.page_content
+        metadata = dict(first.metadata)
+        for rank in run[1:]:
+            other = docs[rank]
+            overlap = _overlap(text, other.page_content)
+            # 有重疊表示兩段原本相連，直接接上；沒有重疊時另起一行
+            text += other.page_content[overlap:] if overlap else "\n" + other.page_content
+            if "row_end" in other.metadata:
+                metadata["row_end"] = other.metadata["row_end"]
+            merged[rank] = None
+        merged[run[0]] = None
+        merged[min(run)] = Document(page_content=text, metadata=metadata, id=first.id)
+    return [doc for doc in merged if doc is not None]
+
+
+def select_mmr(docs: List[Document], lambda_mult: float = CONTEXT_MMR_LAMBDA,
+               dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD) -> List[Document]:
+    """依檢索排名（已融合 / rerank）為相關度做 MMR 排序，並丟掉與已選片段近似重複的片段。
+    相似度以詞彙集合（英數字詞與 CJK bigram）的 Jaccard 計算，不需要額外的 embedding 呼叫。"""
+    n = len(docs)
+    terms = [set(tokenize(doc.page_content)) for doc in docs]
+    relevance = [1.0 - rank / n for rank in range(n)]
+    selected: List[int] = []
+    remaining = list(range(n))
+    while remaining:
+        best, best_score = None, float("-inf")
+        for i in list(remaining):
+            redundancy = max((_similarity(terms[i], terms[j]) for j in selected), default=0.0)
+            if redundancy >= dedup_threshold:
+                remaining.remove(i)
+                continue
+            score = lambda_mult * relevance[i] - (1 - lambda_mult) * redundancy
+            if score > best_score:
+                best, best_score = i, score
+        if best is None:
+            break
+        selected.append(best)
+        remaining.remove(best)
+    return [docs[i] for i in selected]
+
+
+def citation(doc: Document) -> str:
+    """來源標示，例如：report.pdf p.3 §2 Method、data.csv rows 10-25"""
+    metadata = doc.metadata
+    parts = [str(metadata.get("source", "unknown"))]
+    if metadata.get("page") is not None:
+        parts.append(f"p.{metadata['page']}")
+    if metadata.get("row") is not None:
+        row_end = metadata.get("row_end", metadata["row"])
+        parts.append(f"rows {metadata['row']}-{row_end}" if row_end != metadata["row"] else f"row {metadata['row']}")
+    if metadata.get("section"):
+        parts.append(f"§{metadata['section']}")
+    return " ".join(parts)
+
+
+def _truncate(text: str, budget: int) -> str:
+    """截斷到預算內，盡量停在句尾"""
+    tokens = count_tokens(text)
+    if tokens <= budget:
+        return text
+    cut = text[:max(1, len(text) * budget // tokens)]
+    while cut and count_tokens(cut) > budget:
+        cut = cut[:int(len(cut) * 0.9)]
+    ends = [m.end() for m in _SENTENCE_END_RE.finditer(cut)]
+    if ends and ends[-1] > len(cut) // 2:
+        cut = cut[:ends[-1]]
+    return cut.rstrip() + " …"
+
+
+def assemble_context(docs: List[Document], token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET) -> str:
+    """檢索結果 -> prompt 的參考資料：合併相鄰片段、去除近似重複、MMR 排序，依 token 預算打包，
+    每段以 [n] 與來源標示開頭，模型可以引用編號"""
+    if not docs:
+        return ""
+    raw_tokens = sum(count_tokens(doc.page_content) for doc in docs)
+    passages: List[str] = []
+    used = 0
+    for doc in select_mmr(merge_adjacent(docs)):
+        header = f"[{len(passages) + 1}] {citation(doc)}\n"
+        text = doc.page_content.strip()
+        cost = count_tokens(header) + count_tokens(text) + 2
+        if used + cost > token_budget:
+            remaining = token_budget - used - count_tokens(header) - 2
+            if remaining < CONTEXT_MIN_PASSAGE_TOKENS:
+                continue
+            text = _truncate(text, remaining)
+            cost = count_tokens(header) + count_tokens(text) + 2
+        passages.append(header + text)
+        used += cost
+    context_tokens.observe(raw_tokens, "raw")
+    context_tokens.observe(used, "packed")
+    return "\n\n".join(passages)
@@ -0,0 +1,141 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# uvicorn worker 行程數（預設沿用 uvicorn 的 WEB_CONCURRENCY）；大於 1 時索引建立、索引工作狀態與
+# 對話紀錄改由 SQLite 跨行程協調。以 uvicorn --workers 啟動時也要設定相同的值
+WORKERS = int(os.getenv("WORKERS", os.getenv("WEB_CONCURRENCY", "1")))
+MULTI_WORKER = WORKERS > 1
+COORDINATION_DB = os.getenv("COORDINATION_DB", os.path.join("vectorstores", "coordination.sqlite"))
+# 租約有效秒數：持有者定期續約，行程意外結束時最多這麼久後由其他行程接手
+LEASE_TTL = float(os.getenv("LEASE_TTL", "30"))
+LEASE_POLL_INTERVAL = float(os.getenv("LEASE_POLL_INTERVAL", "0.2"))
+
+
+class Coordinator:
+    """worker 行程之間的協調狀態（SQLite WAL，同一台機器上的行程共用一個檔案）：
+
+    - 具名租約：同一個索引只由一個行程建立，其他行程等待後直接載入結果
+    - 索引工作狀態：上傳與查詢進度的請求可以由任何一個 worker 處理
+    """
+
+    def __init__(self, path: str = COORDINATION_DB, ttl: float = LEASE_TTL):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY, file_path TEXT NOT NULL, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_file ON jobs (file_path, updated_at)")
+        self._held: set[str] = set()
+        self._renewer: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _owner() -> str:
+        return str(os.getpid())
+
+    def try_acquire(self, name: str) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT owner, expires FROM leases WHERE name = ?", (name,)).fetchone()
+                if row is not None and row[0] != self._owner() and row[1] > now:
+                    return False
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO leases (name, owner, expires) VALUES (?, ?, ?)",
+                    (name, self._owner(), now + self.ttl),
+                )
+                self._held.add(name)
+                return True
+            finally:
+                self._conn.execute("COMMIT")
+
+    def release(self, name: str):
+        with self._lock:
+            self._held.discard(name)
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self._owner()))
+
+    def is_held(self, name: str) -> bool:
+        """其他行程目前是否持有租約"""
+        with self._lock:
+            row = self._conn.execute("SELECT owner, expires FROM leases WHERE name = ?", (name,)).fetchone()
+        return row is not None and row[0] != self._owner() and row[1] > time.time()
+
+    def _ensure_renewer(self):
+        with self._lock:
+            if self._renewer is None or not self._renewer.is_alive():
+                self._renewer = threading.Thread(target=self._renew_loop, name="lease-renewer", daemon=True)
+                self._renewer.start()
+
+    def _renew_loop(self):
+        while True:
+            time.sleep(self.ttl / 3)
+            with self._lock:
+                held = list(self._held)
+                if held:
+                    placeholders = ",".join("?" * len(held))
+                    self._conn.execute(
+                        f"UPDATE leases SET expires = ? WHERE owner = ? AND name IN ({placeholders})",
+                        [time.time() + self.ttl, self._owner(), *held],
+                    )
+
+    @contextmanager
+    def lease(self, name: str) -> Iterator[None]:
+        """等待並持有具名租約；持有期間由背景執行緒續約"""
+        while not self.try_acquire(name):
+            time.sleep(LEASE_POLL_INTERVAL)
+        self._ensure_renewer()
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    def save_job(self, job_id: str, file_path: str, data: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, file_path, data, updated_at) VALUES (?, ?, ?, ?)",
+                (job_id, file_path, json.dumps(data, ensure_ascii=False), time.time()),
+            )
+
+    def load_job(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def latest_job(self, file_path: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM jobs WHERE file_path = ? ORDER BY updated_at DESC LIMIT 1", (file_path,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def prune_jobs(self, keep: int):
+        """只保留最近更新的 keep 筆工作紀錄"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE job_id NOT IN (SELECT job_id FROM jobs ORDER BY updated_at DESC LIMIT ?)", (keep,)
+            )
+
+
+# 單一 worker 時不建立，所有協調都留在行程內
+coordinator = Coordinator() if MULTI_WORKER else None
+
+
+@contextmanager
+def shared_lock(name: str) -> Iterator[None]:
+    """多 worker 時為跨行程的租約；單一行程時不做任何事（由呼叫端的執行緒鎖負責）"""
+    if coordinator is None:
+        yield
+        return
+    with coordinator.lease(name):
+        yield
@@ -0,0 +1,94 @@
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Iterator, Union
+
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+DOCSTORE_FILE = "docstore.sqlite"
+# 讀取時以 mmap 存取資料庫檔案，頁面留在作業系統的 page cache，多個 worker 共用同一份
+DOCSTORE_MMAP_SIZE = int(os.getenv("DOCSTORE_MMAP_SIZE", str(1 << 30)))
+
+
+def write_docstore(index_dir: str, index_to_docstore_id: dict[int, str], docstore: Docstore):
+    """把 FAISS 的 docstore 與向量位置 -> docstore id 對照表寫成 SQLite 檔（取代 index.pkl）"""
+    path = os.path.join(index_dir, DOCSTORE_FILE)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute(
+            "CREATE TABLE docs (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE,"
+            " text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        rows = []
+        for position, doc_id in index_to_docstore_id.items():
+            doc = docstore.search(doc_id)
+            if isinstance(doc, Document):
+                rows.append((int(position), doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False)))
+        conn.executemany("INSERT INTO docs (position, id, text, metadata) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class SQLiteDocstore(Docstore):
+    """唯讀的 SQLite docstore：chunk 文字不載入行程記憶體，查詢時才讀取命中的列。
+    索引目錄發布後不再改變，以 immutable 模式開啟，不需要任何檔案鎖。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        self._conn.execute(f"PRAGMA mmap_size={DOCSTORE_MMAP_SIZE}")
+
+    def _query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def search(self, search: str) -> Union[str, Document]:
+        rows = self._query("SELECT id, text, metadata FROM docs WHERE id = ?", (search,))
+        if not rows:
+            return f"ID {search} not found."
+        doc_id, text, metadata = rows[0]
+        return Document(id=doc_id, page_content=text, metadata=json.loads(metadata))
+
+    def add(self, texts: dict[str, Document]) -> None:
+        raise NotImplementedError("SQLiteDocstore is read-only")
+
+    def delete(self, ids: list) -> None:
+        raise NotImplementedError("SQLiteDocstore is read-only")
+
+
+class SQLiteIndexMap(Mapping):
+    """向量位置 -> docstore id 的唯讀對照表（FAISS.index_to_docstore_id），同樣存在 docstore.sqlite 中"""
+
+    def __init__(self, docstore: SQLiteDocstore):
+        self._docstore = docstore
+        self._size = docstore._query("SELECT COUNT(*) FROM docs")[0][0]
+
+    def __getitem__(self, position: int) -> str:
+        rows = self._docstore._query("SELECT id FROM docs WHERE position = ?", (int(position),))
+        if not rows:
+            raise KeyError(position)
+        return rows[0][0]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[int]:
+        return (row[0] for row in self._docstore._query("SELECT position FROM docs ORDER BY position"))
+
+    def items(self):
+        return self._docstore._query("SELECT position, id FROM docs ORDER BY position")
+
+
+def open_docstore(index_dir: str) -> tuple[SQLiteDocstore, SQLiteIndexMap]:
+    docstore = SQLiteDocstore(os.path.join(index_dir, DOCSTORE_FILE))
+    return docstore, SQLiteIndexMap(docstore)
+
+
+def has_docstore(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, DOCSTORE_FILE))
@@ -1,4 +1,5 @@
 import os
+import threading
 from typing import List, Literal
 
 from langchain_community.vectorstores import FAISS
@@ -7,18 +8,47 @@ from langchain_core.documents import Document
 from langchain_openai import OpenAIEmbeddings
 from langchain_ollama import OllamaEmbeddings
 
-def get_embeddings(model: Literal["openai", "ollama"] = "openai"):
+from utils.ann_index import to_ann
+from utils.embedding_cache import CachedEmbeddings, FakeEmbeddings, get_embedding_store
+from utils.fake_backends import ENABLE_FAKE_BACKENDS
+from utils.scheduler import get_scheduler
+
+# 各後端實際使用的 embedding 模型名稱（也作為向量索引快取 key 的一部分）
+EMBEDDING_MODELS = {
+    "openai": "text-embedding-ada-002",
+    "ollama": "nomic-embed-text",
+    "fake": "fake-embedding-256",
+}
+
+# 每個後端只建立一個 embedding client，並包上 embedding 快取
+_embeddings: dict[str, CachedEmbeddings] = {}
+_embeddings_lock = threading.Lock()
+
+def _create_embeddings(model: str):
     if model == "openai":
-        return OpenAIEmbeddings()  # 可接收 openai_api_key from env
+        return OpenAIEmbeddings(model=EMBEDDING_MODELS["openai"])  # 可接收 openai_api_key from env
     elif model == "ollama":
-        return OllamaEmbeddings(model="nomic-embed-text")
+        return OllamaEmbeddings(model=EMBEDDING_MODELS["ollama"])
+    elif model == "fake" and ENABLE_FAKE_BACKENDS:
+        return FakeEmbeddings(size=256, latency=float(os.getenv("FAKE_EMBEDDING_LATENCY", "0")))
     else:
         raise ValueError(f"Unsupported embedding model: {model}")
 
+def get_embeddings(model: Literal["openai", "ollama", "fake"] = "openai") -> CachedEmbeddings:
+    with _embeddings_lock:
+        if model not in _embeddings:
+            _embeddings[model] = CachedEmbeddings(
+                _create_embeddings(model),
+                model_name=EMBEDDING_MODELS[model],
+                store=get_embedding_store(),
+                scheduler=get_scheduler("embedding", model),
+            )
+        return _embeddings[model]
+
 def build_vectorstore(
     docs: List[Document],
-    model: Literal["openai", "ollama"] = "openai"
+    model: Literal["openai", "ollama", "fake"] = "openai"
 ) -> FAISS:
     embeddings = get_embeddings(model)
-    vectorstore = FAISS.from_documents(docs, embeddings)
+    vectorstore = to_ann(FAISS.from_documents(docs, embeddings))
     return vectorstore
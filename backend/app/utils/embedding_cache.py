@@ -0,0 +1,175 @@
+import contextlib
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils.scheduler import BackendScheduler, current_priority
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join("embedding_cache", "embeddings.sqlite"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SQLiteEmbeddingStore:
+    """以 (model, sha256(text)) 為 key 的本機 embedding 快取，向量以 float32 bytes 存放"""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> dict[str, List[float]]:
+        found: dict[str, List[float]] = {}
+        # SQLite 參數數量有上限，分段查詢
+        for start in range(0, len(hashes), 500):
+            part = hashes[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *part],
+                ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, items: dict[str, List[float]]):
+        rows = [(model, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """包裝實際的 embedding 後端：命中快取直接回傳，未命中的文字去重後分批、限量平行送出"""
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model_name: str,
+        store: SQLiteEmbeddingStore,
+        batch_size: int = EMBED_BATCH_SIZE,
+        concurrency: int = EMBED_CONCURRENCY,
+        scheduler: Optional[BackendScheduler] = None,
+    ):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.store = store
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.scheduler = scheduler
+        self.hits = 0
+        self.misses = 0
+
+    def _slot(self, priority: int):
+        # 實際呼叫後端時才佔用名額，快取命中不受限制
+        return self.scheduler.slot(priority) if self.scheduler is not None else contextlib.nullcontext()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.store.get_many(self.model_name, list(dict.fromkeys(hashes)))
+
+        # 同一批內重複的文字只送一次
+        missing: dict[str, str] = {}
+        for key, text in zip(hashes, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            keys = list(missing.keys())
+            batches = [keys[i:i + self.batch_size] for i in range(0, len(keys), self.batch_size)]
+            # 分批的執行緒不會繼承呼叫端的 context，先取出優先順序
+            priority = current_priority()
+
+            def embed_batch(batch_keys: List[str]) -> dict[str, List[float]]:
+                with self._slot(priority):
+                    result = self.underlying.embed_documents([missing[key] for key in batch_keys])
+                return dict(zip(batch_keys, result))
+
+            if len(batches) == 1 or self.concurrency <= 1:
+                results = [embed_batch(batch) for batch in batches]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+                    results = list(pool.map(embed_batch, batches))
+
+            for batch_result in results:
+                self.store.put_many(self.model_name, batch_result)
+                vectors.update(batch_result)
+
+        return [vectors[key] for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        # 查詢向量與文件向量分開存放（部分模型兩者不同）
+        key = text_hash(text)
+        model = f"{self.model_name}:query"
+        cached = self.store.get_many(model, [key])
+        if key in cached:
+            self.hits += 1
+            return cached[key]
+        self.misses += 1
+        with self._slot(current_priority()):
+            vector = self.underlying.embed_query(text)
+        self.store.put_many(model, {key: vector})
+        return vector
+
+
+class FakeEmbeddings(Embeddings):
+    """離線用的假 embedding：由文字 hash 產生固定向量，可加上模擬的每批延遲，用於 benchmark"""
+
+    def __init__(self, size: int = 256, latency: float = 0.0, latency_per_text: float = 0.0):
+        self.size = size
+        self.latency = latency
+        self.latency_per_text = latency_per_text
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency or self.latency_per_text:
+            time.sleep(self.latency + self.latency_per_text * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+_store: Optional[SQLiteEmbeddingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_store() -> SQLiteEmbeddingStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SQLiteEmbeddingStore()
+        return _store
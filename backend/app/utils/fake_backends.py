@@ -0,0 +1,67 @@
+import json
+import os
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# 離線假後端（model="fake" 的 LLM / embedding 與 fake_search / fake_lookup 工具）只供 benchmark 與測試使用，
+# 預設不註冊，client 無法選用；需要時以 ENABLE_FAKE_BACKENDS=true 啟動
+ENABLE_FAKE_BACKENDS = os.getenv("ENABLE_FAKE_BACKENDS", "false").lower() in ("1", "true", "yes")
+
+# 離線測試用假模型的每個 token 延遲（秒）
+FAKE_LLM_TOKEN_DELAY = float(os.getenv("FAKE_LLM_TOKEN_DELAY", "0.01"))
+FAKE_LLM_RESPONSE = os.getenv("FAKE_LLM_RESPONSE", "This is a fake streamed answer used for offline benchmarks.")
+
+
+class FakeToolCallingChatModel(FakeListChatModel):
+    """離線假模型：未綁定工具時與 FakeListChatModel 相同；綁定工具後，第一輪對每個工具各發出一個
+    tool call（可測試平行執行），拿到工具結果後回傳固定答案。"""
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    @staticmethod
+    def _tool_calls(messages: list[BaseMessage], tools: Optional[list[dict]]) -> list[dict]:
+        if not tools or any(isinstance(m, ToolMessage) for m in messages):
+            return []
+        question = str(messages[-1].content)
+        calls = []
+        for i, spec in enumerate(tools):
+            function = spec["function"]
+            arg_name = next(iter(function.get("parameters", {}).get("properties", {})), "query")
+            calls.append({"name": function["name"], "args": {arg_name: question}, "id": f"call_{i}"})
+        return calls
+
+    def _generate(self, messages, stop=None, run_manager=None, tools=None, **kwargs) -> ChatResult:
+        calls = self._tool_calls(messages, tools)
+        if calls:
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="", tool_calls=calls))])
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _tool_call_chunk(self, calls: list[dict]) -> ChatGenerationChunk:
+        return ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+            {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+            for i, call in enumerate(calls)
+        ]))
+
+    def _stream(self, messages, stop=None, run_manager=None, tools=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        calls = self._tool_calls(messages, tools)
+        if calls:
+            yield self._tool_call_chunk(calls)
+            return
+        yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, tools=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        calls = self._tool_calls(messages, tools)
+        if calls:
+            yield self._tool_call_chunk(calls)
+            return
+        async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            yield chunk
+
+
+def create_fake_llm(**params: Any) -> FakeToolCallingChatModel:
+    return FakeToolCallingChatModel(responses=[FAKE_LLM_RESPONSE], sleep=FAKE_LLM_TOKEN_DELAY, **params)
@@ -1,52 +1,137 @@
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional
 from langchain_core.documents import Document
 import os
+import threading
 
-def load_txt(file_path: str) -> List[Document]:
+from utils.spawn import light_main, spawn_context
+
+# 串流讀檔參數：讓大型檔案的記憶體用量維持固定
+TXT_BLOCK_CHARS = int(os.getenv("TXT_BLOCK_CHARS", str(256 * 1024)))
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "5000"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "32"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+
+def iter_txt(file_path: str, block_chars: int = TXT_BLOCK_CHARS) -> Iterator[Document]:
+    """逐段讀取文字檔，累積到 block_chars 後在段落（空行）邊界切出一個 Document"""
+    source = os.path.basename(file_path)
+    buffer: list[str] = []
+    size = 0
     with open(file_path, "r", encoding="utf-8") as f:
-        text = f.read()
-    return [Document(page_content=text, metadata={"source": os.path.basename(file_path)})]
+        for line in f:
+            buffer.append(line)
+            size += len(line)
+            # 優先在空行切開；若長時間沒有空行，超過兩倍大小時在行尾切開
+            if (size >= block_chars and not line.strip()) or size >= block_chars * 2:
+                yield Document(page_content="".join(buffer), metadata={"source": source})
+                buffer, size = [], 0
+    if buffer:
+        yield Document(page_content="".join(buffer), metadata={"source": source})
 
-def load_pdf(file_path: str) -> List[Document]:
+def load_txt(file_path: str) -> List[Document]:
+    return list(iter_txt(file_path))
+
+def _extract_pdf_pages(file_path: str, start: int, end: int) -> list[tuple[int, str]]:
+    """在子行程中擷取 [start, end) 頁的文字"""
+    import fitz  # PyMuPDF
+    with fitz.open(file_path) as doc:
+        return [(page_num + 1, doc.load_page(page_num).get_text()) for page_num in range(start, end)]
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """所有 PDF 共用一個行程池；ingestion 是多執行緒的，以 spawn 啟動子行程才不會繼承其他執行緒持有的鎖"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=spawn_context())
+        return _pdf_pool
+
+def _reset_pdf_pool(pool: ProcessPoolExecutor):
+    """worker 意外結束後行程池無法再使用，下一個 PDF 改用新的行程池"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _iter_pdf_pages(file_path: str) -> Iterator[tuple[int, str]]:
     import fitz  # PyMuPDF
-    doc = fitz.open(file_path)
-    documents = []
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        text = page.get_text()
+    with fitz.open(file_path) as doc:
+        page_count = len(doc)
+        if page_count < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS <= 1:
+            for page_num in range(page_count):
+                yield page_num + 1, doc.load_page(page_num).get_text()
+            return
+
+    # 大型 PDF：依頁碼區間分給行程池平行擷取，最多只預先排入 2 倍 worker 數的區間
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+    pool = _get_pdf_pool()
+    pending = []
+    try:
+        for start, end in ranges:
+            # 行程池在第一次 submit 時才啟動子行程
+            with light_main():
+                pending.append(pool.submit(_extract_pdf_pages, file_path, start, end))
+            if len(pending) >= PDF_WORKERS * 2:
+                yield from pending.pop(0).result()
+        while pending:
+            yield from pending.pop(0).result()
+    except BrokenProcessPool:
+        _reset_pdf_pool(pool)
+        raise
+    finally:
+        # 讀取中途停止（例如建立索引失敗）時，取消還沒開始的區間
+        for future in pending:
+            future.cancel()
+
+def iter_pdf(file_path: str) -> Iterator[Document]:
+    source = os.path.basename(file_path)
+    for page, text in _iter_pdf_pages(file_path):
         if text.strip():
-            documents.append(
-                Document(
-                    page_content=text,
-                    metadata={
-                        "source": os.path.basename(file_path),
-                        "page": page_num + 1,
-                    },
-                )
+            yield Document(
+                page_content=text,
+                metadata={
+                    "source": source,
+                    "page": page,
+                },
             )
-    return documents
 
-def load_csv(file_path: str) -> List[Document]:
+def load_pdf(file_path: str) -> List[Document]:
+    return list(iter_pdf(file_path))
+
+def iter_csv(file_path: str, chunksize: int = CSV_CHUNK_ROWS) -> Iterator[Document]:
+    """以 chunksize 分批讀取 CSV，並以欄為單位向量化組出每列文字"""
     import pandas as pd
-    df = pd.read_csv(file_path)
-    documents = []
-    for index, row in df.iterrows():
-        row_text = "\n".join([f"{col}: {row[col]}" for col in df.columns])
-        documents.append(
-            Document(
+    source = os.path.basename(file_path)
+    for frame in pd.read_csv(file_path, chunksize=chunksize):
+        if frame.empty:
+            continue
+        columns = [f"{col}: " + frame[col].astype(str) for col in frame.columns]
+        texts = columns[0].str.cat(columns[1:], sep="\n") if len(columns) > 1 else columns[0]
+        for index, row_text in zip(frame.index, texts):
+            yield Document(
                 page_content=row_text,
-                metadata={"source": os.path.basename(file_path), "row": index + 1},
+                metadata={"source": source, "row": int(index) + 1},
             )
-        )
-    return documents
 
-def load_file(file_path: str) -> List[Document]:
+def load_csv(file_path: str) -> List[Document]:
+    return list(iter_csv(file_path))
+
+def iter_file(file_path: str) -> Iterator[Document]:
     ext = os.path.splitext(file_path)[1].lower()
     if ext == ".txt":
-        return load_txt(file_path)
+        return iter_txt(file_path)
     elif ext == ".pdf":
-        return load_pdf(file_path)
+        return iter_pdf(file_path)
     elif ext == ".csv":
-        return load_csv(file_path)
+        return iter_csv(file_path)
     else:
         raise ValueError(f"Unsupported file type: {ext}")
+
+def load_file(file_path: str) -> List[Document]:
+    return list(iter_file(file_path))
@@ -0,0 +1,275 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterable, Iterator, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 關閉時 span 不做任何事，/api/metrics 回傳空內容
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# 在回應加上 Server-Timing header（只含開始回應前已完成的階段，串流中的 LLM 時間不在其中）
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "false").lower() in ("1", "true", "yes")
+
+# 延遲分布的 bucket 上界（秒），涵蓋快取命中到長時間的索引建立
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Prometheus 格式的 histogram：每組 label 值各自累計 bucket 次數、總和與次數"""
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # label 值 -> [各 bucket 次數（最後一格為 +Inf）, 總和, 次數]
+        self._series: dict[tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = [(values, list(series[0]), series[1], series[2]) for values, series in self._series.items()]
+        for values, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labels, values, 'le="%s"' % le)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, values)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labels, values)} {count}"
+
+
+class CallbackMetric:
+    """輸出時才讀取目前值的 gauge / counter（例如快取命中次數、佇列長度），平常沒有任何開銷。
+    有 labels 時 read 回傳 {label 值: 數值}"""
+
+    def __init__(self, name: str, description: str, kind: str, read: Callable[[], Any], labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.kind = kind
+        self.read = read
+        self.labels = labels
+
+    def render(self) -> Iterator[str]:
+        try:
+            values = self.read() if self.labels else {(): self.read()}
+            series = [(label_values, float(value)) for label_values, value in values.items()]
+        except Exception as e:
+            print(f"[ERROR] Failed to read metric {self.name}: {str(e)}")
+            return
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for label_values, value in sorted(series):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+_metrics: dict[str, Any] = {}
+_metrics_lock = threading.Lock()
+
+
+def histogram(name: str, description: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+    with _metrics_lock:
+        if name not in _metrics:
+            _metrics[name] = Histogram(name, description, labels, buckets)
+        return _metrics[name]
+
+
+def register_callback(name: str, description: str, read: Callable[[], Any], kind: str = "gauge", labels: tuple[str, ...] = ()):
+    with _metrics_lock:
+        _metrics[name] = CallbackMetric(name, description, kind, read, labels)
+
+
+def render_metrics() -> str:
+    if not METRICS_ENABLED:
+        return ""
+    with _metrics_lock:
+        metrics = list(_metrics.values())
+    return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+stage_seconds = histogram(
+    "rag_stage_seconds",
+    "Time spent in each stage: file_load, split, embed, index_build, index_train, index_save, index_load, bm25_load, "
+    "retrieval, query_embed, rerank, response_cache, history_read, history_write, history_flush",
+    ("stage",),
+)
+llm_ttft_seconds = histogram("llm_time_to_first_token_seconds", "Time from LLM call start to the first streamed token", ("model",))
+llm_call_seconds = histogram("llm_call_seconds", "Total duration of each LLM call", ("model",))
+tool_call_seconds = histogram("tool_call_seconds", "Duration of each agent tool call", ("tool", "status"))
+http_request_seconds = histogram("http_request_seconds", "Duration of HTTP requests until the response body is complete", ("method", "route", "status"))
+
+
+# 目前請求已完成的階段：(名稱, 秒數)，由 TimingMiddleware 設定；contextvars 會帶進 run_in_threadpool
+_request_timings: ContextVar[Optional[list[tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def record_stage(stage: str, seconds: float):
+    if not METRICS_ENABLED:
+        return
+    stage_seconds.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """量測一段程式的耗時並記錄到 rag_stage_seconds（例外也會記錄）"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+class Stopwatch:
+    """累計多段時間，用在串流處理中交錯執行的階段（例如讀檔與切塊）"""
+
+    def __init__(self):
+        self.total = 0.0
+
+    def iterate(self, iterable: Iterable) -> Iterator:
+        """包裝 iterator，只累計取得下一個元素所花的時間"""
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.total += time.perf_counter() - started
+                return
+            self.total += time.perf_counter() - started
+            yield item
+
+    @contextmanager
+    def measure(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.total += time.perf_counter() - started
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """記錄每次 LLM 呼叫的首個 token 時間與總時間；run_inline 讓非同步串流時直接在 event loop 執行，不另開執行緒"""
+
+    run_inline = True
+
+    def __init__(self, model: str):
+        self.model = model
+        self._started: dict[UUID, float] = {}
+        self._first_token: set[UUID] = set()
+
+    def _start(self, run_id: UUID):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        if run_id in self._first_token:
+            return
+        started = self._started.get(run_id)
+        if started is not None:
+            self._first_token.add(run_id)
+            llm_ttft_seconds.observe(time.perf_counter() - started, self.model)
+
+    def _finish(self, run_id: UUID):
+        started = self._started.pop(run_id, None)
+        self._first_token.discard(run_id)
+        if started is not None:
+            llm_call_seconds.observe(time.perf_counter() - started, self.model)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id)
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id)
+
+
+def metrics_callbacks(model: str) -> list[BaseCallbackHandler]:
+    return [LLMMetricsHandler(model)] if METRICS_ENABLED else []
+
+
+class TimingMiddleware:
+    """ASGI middleware：記錄每個請求的總耗時（以路由樣板為 label），並可選擇加上 Server-Timing header。
+    直接包裝 send，不像 BaseHTTPMiddleware 會額外轉接串流回應。"""
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING_HEADER):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings: list[tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                if self.server_timing:
+                    header = server_timing_header(timings, time.perf_counter() - started)
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
+            route = scope.get("route")
+            http_request_seconds.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+            )
+
+
+def server_timing_header(timings: list[tuple[str, float]], total: float) -> str:
+    # 同名階段（例如多個檔案的 index_load）加總成一筆
+    merged: dict[str, float] = {}
+    for stage, seconds in list(timings):
+        merged[stage] = merged.get(stage, 0.0) + seconds
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in merged.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,12 @@
+import re
+import unicodedata
+
+_PUNCT_RE = re.compile(r"[\s?？!！。.,，;；:：]+$")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """快取 key 用的正規化：全半形統一、小寫、合併空白並去掉結尾標點"""
+    text = unicodedata.normalize("NFKC", question).strip().lower()
+    text = _SPACE_RE.sub(" ", text)
+    return _PUNCT_RE.sub("", text)
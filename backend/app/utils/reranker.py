@@ -0,0 +1,49 @@
+import os
+import threading
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+# 本機 cross-encoder 模型（例如 BAAI/bge-reranker-base）；未設定時不做 rerank
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+RERANKER_BATCH_SIZE = int(os.getenv("RERANKER_BATCH_SIZE", "16"))
+
+
+class CrossEncoderReranker:
+    """以 cross-encoder 對 (問題, chunk) 逐對打分，重新排序融合後的候選"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import CrossEncoder
+        self.model_name = model_name
+        self._model = CrossEncoder(model_name)
+        self._lock = threading.Lock()
+
+    def rerank(self, query: str, docs: List[Document], k: int) -> List[Document]:
+        if len(docs) <= 1:
+            return docs[:k]
+        with self._lock:
+            scores = self._model.predict(
+                [(query, doc.page_content) for doc in docs], batch_size=RERANKER_BATCH_SIZE
+            )
+        ranked = sorted(zip(docs, scores), key=lambda item: item[1], reverse=True)
+        return [doc for doc, _ in ranked[:k]]
+
+
+_reranker: Optional[CrossEncoderReranker] = None
+_reranker_failed = False
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Optional[CrossEncoderReranker]:
+    """第一次使用時才載入模型；未安裝 sentence-transformers 或載入失敗時停用 rerank"""
+    global _reranker, _reranker_failed
+    if not RERANKER_MODEL or _reranker_failed:
+        return None
+    with _reranker_lock:
+        if _reranker is None and not _reranker_failed:
+            try:
+                _reranker = CrossEncoderReranker(RERANKER_MODEL)
+            except Exception as e:
+                _reranker_failed = True
+                print(f"[ERROR] Failed to load reranker {RERANKER_MODEL}: {str(e)}")
+        return _reranker
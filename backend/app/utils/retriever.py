@@ -0,0 +1,111 @@
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from utils.bm25 import BM25Index, doc_key
+from utils.metrics import span
+
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "4"))
+# hybrid：向量 + BM25 以 RRF 融合；vector：只用向量搜尋
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# 融合前每種搜尋各取多少候選、RRF 的平滑常數、送進 reranker 的候選數
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+
+# 多個索引的查詢共用同一個執行緒池（FAISS 搜尋時會釋放 GIL）
+_search_pool = ThreadPoolExecutor(max_workers=SEARCH_CONCURRENCY, thread_name_prefix="faiss-search")
+
+
+class MultiIndexRetriever(BaseRetriever):
+    """同時查詢多個檔案各自的 FAISS 索引，依分數合併出 top-k。
+
+    問題只做一次 embedding，之後對每個索引平行搜尋，選檔組合改變時不需要重建任何索引。
+    提供 bm25_indexes 時改為 hybrid：向量與 BM25 各取 fetch_k 個候選，以 RRF（reciprocal rank fusion）
+    融合排名，再交給可選的 cross-encoder reranker 選出最後的 k 個。
+    """
+
+    vectorstores: List[FAISS]
+    embeddings: Embeddings
+    k: int = 4
+    bm25_indexes: Optional[List[BM25Index]] = None
+    fetch_k: int = RETRIEVAL_FETCH_K
+    reranker: Optional[Any] = None
+
+    def _search(self, vectorstore: FAISS, embedding: List[float], k: Optional[int] = None) -> list[tuple[Document, float]]:
+        results = vectorstore.similarity_search_with_score_by_vector(embedding, k=k or self.k)
+        # 統一成「分數越小越相關」，內積類型的索引分數越大越相關
+        if vectorstore.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+            return [(doc, -score) for doc, score in results]
+        return results
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if not self.vectorstores:
+            return []
+        with span("retrieval"):
+            return self._search_all(query)
+
+    def _search_all(self, query: str) -> List[Document]:
+        if self.bm25_indexes:
+            return self._hybrid_search(query)
+
+        with span("query_embed"):
+            embedding = self.embeddings.embed_query(query)
+        if len(self.vectorstores) == 1:
+            results = self._search(self.vectorstores[0], embedding)
+        else:
+            futures = [_search_pool.submit(self._search, vs, embedding) for vs in self.vectorstores]
+            results = [item for future in futures for item in future.result()]
+
+        top = heapq.nsmallest(self.k, results, key=lambda item: item[1])
+        return [doc for doc, _ in top]
+
+    def _hybrid_search(self, query: str) -> List[Document]:
+        # BM25 不需要 embedding，先排入執行緒池與問題的 embedding 同時進行
+        bm25_futures = [_search_pool.submit(bm25.search, query, self.fetch_k) for bm25 in self.bm25_indexes]
+        with span("query_embed"):
+            embedding = self.embeddings.embed_query(query)
+        vector_futures = [_search_pool.submit(self._search, vs, embedding, self.fetch_k) for vs in self.vectorstores]
+
+        # 各自合併成全域排名（向量：距離越小越前；BM25：分數越大越前），key = (索引位置, docstore id)
+        vector_hits = sorted(
+            ((i, doc, score) for i, future in enumerate(vector_futures) for doc, score in future.result()),
+            key=lambda item: item[2],
+        )
+        bm25_hits = sorted(
+            ((i, doc_id, score) for i, future in enumerate(bm25_futures) for doc_id, score in future.result()),
+            key=lambda item: item[2],
+            reverse=True,
+        )
+
+        fused: dict[tuple[int, str], float] = {}
+        docs: dict[tuple[int, str], Document] = {}
+        for rank, (i, doc, _) in enumerate(vector_hits[:self.fetch_k]):
+            key = (i, doc_key(doc))
+            docs[key] = doc
+            fused[key] = fused.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+        for rank, (i, doc_id, _) in enumerate(bm25_hits[:self.fetch_k]):
+            key = (i, doc_id)
+            if key not in docs:
+                doc = self.vectorstores[i].docstore.search(doc_id)
+                if not isinstance(doc, Document):
+                    continue
+                docs[key] = doc
+            fused[key] = fused.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        ranked = sorted(fused, key=fused.get, reverse=True)
+        if self.reranker is None:
+            return [docs[key] for key in ranked[:self.k]]
+        candidates = [docs[key] for key in ranked[:max(self.k, RERANK_CANDIDATES)]]
+        with span("rerank"):
+            return self.reranker.rerank(query, candidates, self.k)
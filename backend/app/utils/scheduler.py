@@ -0,0 +1,279 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Iterator, Optional
+
+from utils.coordination import WORKERS
+from utils.metrics import histogram, register_callback
+
+# 優先順序：數字越小越先取得執行名額
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# 各後端同時進行的呼叫數上限（LLM 與 embedding 分開計算；Ollama 對每個模型各自排隊）；
+# 這是整個服務的總數，多 worker 時平均分給每個行程（每個行程至少 1）
+BACKEND_CONCURRENCY = {
+    "llm/ollama": int(os.getenv("LLM_CONCURRENCY_OLLAMA", "2")),
+    "llm/openai": int(os.getenv("LLM_CONCURRENCY_OPENAI", "32")),
+    "llm/fake": int(os.getenv("LLM_CONCURRENCY_FAKE", "64")),
+    "embedding/ollama": int(os.getenv("EMBEDDING_CONCURRENCY_OLLAMA", "2")),
+    "embedding/openai": int(os.getenv("EMBEDDING_CONCURRENCY_OPENAI", "16")),
+    "embedding/fake": int(os.getenv("EMBEDDING_CONCURRENCY_FAKE", "64")),
+}
+DEFAULT_CONCURRENCY = int(os.getenv("BACKEND_CONCURRENCY", "16"))
+# 互動請求的排隊上限與最長等待（秒）；超過時直接回 429，不讓請求一起逾時
+SCHEDULER_QUEUE_MAX = int(os.getenv("SCHEDULER_QUEUE_MAX", "32"))
+SCHEDULER_DEADLINE = float(os.getenv("SCHEDULER_DEADLINE", "30"))
+
+# 目前請求的優先順序；背景索引工作設為 BULK，API 請求預設為 INTERACTIVE
+_priority: ContextVar[int] = ContextVar("scheduler_priority", default=INTERACTIVE)
+
+wait_seconds = histogram("scheduler_wait_seconds", "Time spent waiting for a backend slot", ("backend", "priority"))
+
+
+class Overloaded(Exception):
+    """後端忙碌：排隊已滿、預估等待超過期限，或等待逾時"""
+
+    def __init__(self, backend: str, retry_after: float):
+        super().__init__(f"{backend} is overloaded, retry after {retry_after:.0f}s")
+        self.backend = backend
+        self.retry_after = retry_after
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+@contextmanager
+def request_priority(priority: int) -> Iterator[None]:
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("priority", "event", "loop", "future", "granted")
+
+    def __init__(self, priority: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority = priority
+        self.event = threading.Event() if loop is None else None
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.granted = False
+
+
+class BackendScheduler:
+    """單一後端的執行名額：最多 slots 個呼叫同時進行，其餘依 (優先順序, 到達順序) 排隊。
+
+    互動請求的排隊數有上限，並以服務時間的移動平均預估等待時間；預估會超過期限時立即拒絕
+    （admit 回傳 False，路由回 429），不必等到逾時。批次工作（背景索引）不受排隊上限與期限限制。
+    執行緒（embedding）與 event loop（LLM 串流）都可以等待名額。
+    """
+
+    def __init__(self, name: str, slots: int, queue_max: int = SCHEDULER_QUEUE_MAX, deadline: float = SCHEDULER_DEADLINE):
+        self.name = name
+        self.slots = max(1, slots)
+        self.queue_max = queue_max
+        self.deadline = deadline
+        self.in_flight = 0
+        self.shed = 0
+        self._queue: list[tuple[int, int, _Waiter]] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        # 每次呼叫佔用名額時間的指數移動平均，用來預估排隊等待
+        self._service_time = 1.0
+        # 已通過 admit、但還沒開始等待名額的請求（例如正在檢索）的到期時間，避免同時湧入的請求都被放行
+        self._reservations: "deque[float]" = deque()
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return len(self._queue)
+
+    def _interactive_waiting(self) -> int:
+        return sum(1 for priority, _, _ in self._queue if priority == INTERACTIVE)
+
+    def _queued_ahead(self) -> int:
+        """呼叫前需持有 self._lock；新的互動請求前面還要等幾個（含已放行但尚未開始的請求）"""
+        now = time.monotonic()
+        while self._reservations and self._reservations[0] < now:
+            self._reservations.popleft()
+        return max(0, self.in_flight + len(self._reservations) + self._interactive_waiting() - self.slots)
+
+    def _estimated_wait(self) -> float:
+        ahead = self._queued_ahead()
+        if not ahead and self.in_flight + len(self._reservations) < self.slots and not self._queue:
+            return 0.0
+        return (ahead + 1) * self._service_time / self.slots
+
+    def admit(self, priority: Optional[int] = None) -> bool:
+        """入口檢查：排隊已滿或預估等待超過期限時拒絕（只限制互動請求）。
+        通過的請求保留一個位置，之後以 aslot(reserved=True) 取得名額"""
+        priority = current_priority() if priority is None else priority
+        if priority != INTERACTIVE:
+            return True
+        with self._lock:
+            wait = self._estimated_wait()
+            ok = wait == 0 or (self._queued_ahead() < self.queue_max and wait <= self.deadline)
+            if ok:
+                self._reservations.append(time.monotonic() + self.deadline)
+            else:
+                self.shed += 1
+            return ok
+
+    def release_reservation(self):
+        """歸還 admit 保留、但沒有交給 aslot 使用的位置"""
+        with self._lock:
+            if self._reservations:
+                self._reservations.popleft()
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(1.0, self._estimated_wait())
+
+    def _try_acquire(self, waiter: _Waiter, reserved: bool = False) -> bool:
+        """呼叫前需持有 self._lock；有空名額且前面沒有人排隊時直接取得，否則排入佇列"""
+        if reserved and self._reservations:
+            self._reservations.popleft()
+        if self.in_flight < self.slots and not self._queue:
+            self.in_flight += 1
+            return True
+        # 已通過 admit 的請求已計入排隊數，不再拒絕
+        if waiter.priority == INTERACTIVE and not reserved and self._interactive_waiting() >= self.queue_max:
+            self.shed += 1
+            raise Overloaded(self.name, max(1.0, self._estimated_wait()))
+        heapq.heappush(self._queue, (waiter.priority, next(self._counter), waiter))
+        return False
+
+    def _grant_next(self):
+        """呼叫前需持有 self._lock；把空出的名額交給最優先的等待者"""
+        while self._queue and self.in_flight < self.slots:
+            _, _, waiter = heapq.heappop(self._queue)
+            waiter.granted = True
+            self.in_flight += 1
+            if waiter.event is not None:
+                waiter.event.set()
+            else:
+                waiter.loop.call_soon_threadsafe(self._resolve, waiter)
+
+    @staticmethod
+    def _resolve(waiter: _Waiter):
+        if not waiter.future.done():
+            waiter.future.set_result(None)
+
+    def _abandon(self, waiter: _Waiter, shed: bool):
+        """等待逾時或被取消：仍在佇列中就移除；已取得名額則歸還"""
+        with self._lock:
+            if shed:
+                self.shed += 1
+            if waiter.granted:
+                self.in_flight -= 1
+                self._grant_next()
+                return
+            self._queue = [item for item in self._queue if item[2] is not waiter]
+            heapq.heapify(self._queue)
+
+    def _release(self, held: float):
+        with self._lock:
+            self.in_flight -= 1
+            self._service_time = 0.8 * self._service_time + 0.2 * held
+            self._grant_next()
+
+    def _deadline_for(self, priority: int) -> Optional[float]:
+        return self.deadline if priority == INTERACTIVE else None
+
+    def _observe_wait(self, priority: int, waited: float):
+        wait_seconds.observe(waited, self.name, PRIORITY_NAMES.get(priority, str(priority)))
+
+    @contextmanager
+    def slot(self, priority: Optional[int] = None) -> Iterator[None]:
+        """在執行緒中等待並佔用一個名額"""
+        priority = current_priority() if priority is None else priority
+        waiter = _Waiter(priority)
+        started = time.perf_counter()
+        with self._lock:
+            acquired = self._try_acquire(waiter)
+        if not acquired and not waiter.event.wait(self._deadline_for(priority)):
+            self._abandon(waiter, shed=True)
+            raise Overloaded(self.name, self.retry_after())
+        self._observe_wait(priority, time.perf_counter() - started)
+        acquired_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - acquired_at)
+
+    @asynccontextmanager
+    async def aslot(self, priority: Optional[int] = None, reserved: bool = False) -> AsyncIterator[None]:
+        """在 event loop 上等待並佔用一個名額，不阻塞其他請求；reserved 表示已通過 admit"""
+        priority = current_priority() if priority is None else priority
+        waiter = _Waiter(priority, asyncio.get_running_loop())
+        started = time.perf_counter()
+        with self._lock:
+            acquired = self._try_acquire(waiter, reserved)
+        if not acquired:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self._deadline_for(priority))
+            except asyncio.TimeoutError:
+                self._abandon(waiter, shed=True)
+                raise Overloaded(self.name, self.retry_after())
+            except asyncio.CancelledError:
+                # client 斷線：名額可能已經交給這個等待者，要歸還
+                self._abandon(waiter, shed=False)
+                raise
+        self._observe_wait(priority, time.perf_counter() - started)
+        acquired_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - acquired_at)
+
+
+class Reservation:
+    """admit 通過後保留的位置，只能使用一次：交給 aslot(reserved=reservation.take())，
+    或在處理失敗、client 於串流開始前斷線時以 release 歸還（已使用或已歸還時不做任何事）"""
+
+    def __init__(self, scheduler: BackendScheduler):
+        self._scheduler = scheduler
+        self._held = True
+
+    def take(self) -> bool:
+        held, self._held = self._held, False
+        return held
+
+    def release(self):
+        if self.take():
+            self._scheduler.release_reservation()
+
+
+_schedulers: dict[str, BackendScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(kind: str, backend: str) -> BackendScheduler:
+    """kind 為 llm / embedding，backend 為 ollama / openai / fake"""
+    name = f"{kind}/{backend}"
+    with _schedulers_lock:
+        if name not in _schedulers:
+            slots = BACKEND_CONCURRENCY.get(name, DEFAULT_CONCURRENCY)
+            _schedulers[name] = BackendScheduler(name, -(-slots // WORKERS))
+        return _schedulers[name]
+
+
+def _snapshot(read) -> dict[tuple[str, ...], float]:
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return {(scheduler.name,): read(scheduler) for scheduler in schedulers}
+
+
+register_callback("scheduler_queue_depth", "Calls waiting for a backend slot", lambda: _snapshot(BackendScheduler.queue_depth), labels=("backend",))
+register_callback("scheduler_in_flight", "Calls currently holding a backend slot", lambda: _snapshot(lambda s: s.in_flight), labels=("backend",))
+register_callback("scheduler_shed_total", "Calls rejected because the backend was overloaded", lambda: _snapshot(lambda s: s.shed), kind="counter", labels=("backend",))
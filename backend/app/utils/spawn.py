@@ -0,0 +1,26 @@
+import multiprocessing
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+# spawn 子行程啟動時會先重新執行父行程的 __main__；以 python main.py 啟動時那就是整個 app
+# （FastAPI、LangChain、FAISS），每個子行程都會白白載入一次。這個模組只依賴標準函式庫
+_main_lock = threading.Lock()
+
+
+def spawn_context():
+    """不繼承父行程的執行緒與鎖（fork 時其他執行緒持有的鎖會讓子行程卡住）"""
+    return multiprocessing.get_context("spawn")
+
+
+@contextmanager
+def light_main() -> Iterator[None]:
+    """在這個區塊內啟動的 spawn 子行程以本模組作為 __main__，只 import 目標函式所在的模組"""
+    with _main_lock:
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = sys.modules[__name__]
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = main
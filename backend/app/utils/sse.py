@@ -0,0 +1,23 @@
+import json
+from typing import Any, AsyncIterator, Optional
+
+from fastapi import Request
+
+
+def format_sse(data: Any, event: Optional[str] = None) -> str:
+    """組成一個 SSE 事件；data 以 JSON 編碼，內容中的換行不會破壞事件格式"""
+    payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    if event:
+        payload = f"event: {event}\n{payload}"
+    return payload
+
+
+async def stream_until_disconnect(request: Request, events: AsyncIterator[str]) -> AsyncIterator[str]:
+    """轉送 SSE 事件；client 斷線時關閉上游 generator，一併取消進行中的 LLM 呼叫"""
+    try:
+        async for payload in events:
+            if await request.is_disconnected():
+                break
+            yield payload
+    finally:
+        await events.aclose()
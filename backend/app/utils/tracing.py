@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 取樣比例：0 表示完全不追蹤（不掛 callback，沒有額外開銷），1 表示每個請求都追蹤
+AGENT_TRACE_SAMPLE_RATE = float(os.getenv("AGENT_TRACE_SAMPLE_RATE", "0.05"))
+
+logger = logging.getLogger("agent.trace")
+
+
+class AgentTraceHandler(BaseCallbackHandler):
+    """輕量的結構化追蹤：每個事件輸出一行 JSON（LLM / 工具的耗時、agent 動作），取代 verbose=True"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self._started: dict[UUID, float] = {}
+
+    def _emit(self, event: str, **fields: Any):
+        logger.info(json.dumps({"request_id": self.request_id, "event": event, **fields}, ensure_ascii=False, default=str))
+
+    def _elapsed_ms(self, run_id: UUID) -> Optional[float]:
+        started = self._started.pop(run_id, None)
+        return round((time.perf_counter() - started) * 1000, 1) if started is not None else None
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        self._emit("llm_end", ms=self._elapsed_ms(run_id))
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs: Any):
+        self._emit("llm_error", ms=self._elapsed_ms(run_id), error=str(error))
+
+    def on_tool_start(self, serialized, input_str: str, *, run_id: UUID, **kwargs: Any):
+        self._started[run_id] = time.perf_counter()
+        self._emit("tool_start", tool=(serialized or {}).get("name"), input=input_str[:200])
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs: Any):
+        self._emit("tool_end", ms=self._elapsed_ms(run_id), output_chars=len(str(output)))
+
+    def on_tool_error(self, error, *, run_id: UUID, **kwargs: Any):
+        self._emit("tool_error", ms=self._elapsed_ms(run_id), error=str(error))
+
+    def on_agent_action(self, action, *, run_id: UUID, **kwargs: Any):
+        self._emit("agent_action", tool=action.tool)
+
+    def on_agent_finish(self, finish, *, run_id: UUID, **kwargs: Any):
+        self._emit("agent_finish", output_chars=len(str(finish.return_values.get("output", ""))))
+
+
+def trace_callbacks(request_id: str) -> list[BaseCallbackHandler]:
+    """依取樣比例決定這個請求是否追蹤；未取樣時回傳空 list"""
+    if AGENT_TRACE_SAMPLE_RATE > 0 and random.random() < AGENT_TRACE_SAMPLE_RATE:
+        return [AgentTraceHandler(request_id)]
+    return []
@@ -1,25 +1,421 @@
-from typing import Literal,Optional
-from langchain.text_splitter import CharacterTextSplitter
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterator, Literal, Optional
+
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 
-from utils.loader import load_file
-from utils.embedding import get_embeddings
+from utils.loader import iter_file, load_file
+from utils.ann_index import ANN_INDEX_MODE, ANN_MMAP, is_exact, load_faiss, reconstruct, save_faiss, to_ann
+from utils.embedding import EMBEDDING_MODELS, get_embeddings
+from utils.chunking import Chunker, chunker_signature
+from utils.coordination import shared_lock
+from utils.bm25 import BM25Index, load_or_build_bm25
+from utils.embedding_cache import text_hash
+from utils.metrics import Stopwatch, record_stage, span
+from utils.reranker import get_reranker
+from utils.retriever import RETRIEVAL_MODE, MultiIndexRetriever
+
+VECTORSTORE_DIR = os.getenv("VECTORSTORE_DIR", "vectorstores")
+INDEX_CACHE_SIZE = int(os.getenv("INDEX_CACHE_SIZE", "16"))
+
+# 串流建立索引時，每累積多少個 chunk 就送一次 embedding
+INDEX_BATCH_CHUNKS = int(os.getenv("INDEX_BATCH_CHUNKS", "256"))
+# 壓縮時，未完成的暫存目錄超過這個秒數才會被清除（避免刪到正在寫入的索引）
+INDEX_GC_GRACE = float(os.getenv("INDEX_GC_GRACE", "600"))
+
 
 def load_and_split(file_path: str) -> list[Document]:
-    docs = load_file(file_path)
-    splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    return splitter.split_documents(docs)
+    return Chunker().split_documents(load_file(file_path))
+
+
+def iter_chunk_batches(
+    file_path: str,
+    batch_chunks: int = INDEX_BATCH_CHUNKS,
+    load_timer: Optional[Stopwatch] = None,
+) -> Iterator[list[Document]]:
+    """邊讀檔邊切塊，每次回傳固定大小的一批 chunk，整個檔案不會同時留在記憶體中；
+    提供 load_timer 時另外累計讀檔所花的時間"""
+    docs = iter_file(file_path)
+    if load_timer is not None:
+        docs = load_timer.iterate(docs)
+    batch: list[Document] = []
+    for chunk in Chunker().iter_chunks(docs):
+        batch.append(chunk)
+        if len(batch) >= batch_chunks:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# 進度回報：on_progress(stage, chunk_count)
+ProgressCallback = Callable[[str, int], None]
 
 
-def create_vectorstore_from_file(
+def _reusable_vectors(db: FAISS) -> dict[str, int]:
+    """舊索引中每個 chunk 文字 hash 對應的向量位置；量化索引只存近似向量，不沿用"""
+    positions: dict[str, int] = {}
+    if not is_exact(db.index):
+        return positions
+    for position, doc_id in db.index_to_docstore_id.items():
+        doc = db.docstore.search(doc_id)
+        if isinstance(doc, Document):
+            positions.setdefault(text_hash(doc.page_content), position)
+    return positions
+
+
+def build_index(
     file_path: str,
-    embed_type: Literal["openai", "ollama"] = "openai",
-    save_path: Optional[str] = None,
+    embeddings,
+    on_progress: Optional[ProgressCallback] = None,
+    reuse: Optional[FAISS] = None,
 ) -> FAISS:
-    docs = load_and_split(file_path)
-    embeddings = get_embeddings(embed_type)
-    db = FAISS.from_documents(docs, embeddings)
-    if save_path:
-        db.save_local(save_path)
+    """以串流方式建立單一檔案的 FAISS 索引；提供 reuse（同一檔案的舊版本索引）時，
+    內容沒變的 chunk 直接沿用舊向量，只有新增或修改的 chunk 會送去 embedding"""
+    reusable = _reusable_vectors(reuse) if reuse is not None else {}
+    db: Optional[FAISS] = None
+    chunk_count = 0
+    # 讀檔、切塊、embedding 與寫入索引在串流中交錯進行，各自累計後在結束時記錄一次
+    load_timer, chunk_timer, embed_timer, add_timer = Stopwatch(), Stopwatch(), Stopwatch(), Stopwatch()
+    for batch in chunk_timer.iterate(iter_chunk_batches(file_path, load_timer=load_timer)):
+        texts = [doc.page_content for doc in batch]
+        positions = [reusable.get(text_hash(text)) for text in texts]
+        missing = [text for text, position in zip(texts, positions) if position is None]
+        with embed_timer.measure():
+            new_vectors = iter(embeddings.embed_documents(missing) if missing else [])
+        vectors = [
+            reconstruct(reuse.index, position).tolist() if position is not None else next(new_vectors)
+            for position in positions
+        ]
+        text_embeddings = list(zip(texts, vectors))
+        metadatas = [doc.metadata for doc in batch]
+        with add_timer.measure():
+            if db is None:
+                db = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas)
+            else:
+                db.add_embeddings(text_embeddings, metadatas=metadatas)
+        chunk_count += len(batch)
+        if on_progress:
+            on_progress("embedding", chunk_count)
+    record_stage("file_load", load_timer.total)
+    record_stage("split", chunk_timer.total - load_timer.total)
+    record_stage("embed", embed_timer.total)
+    record_stage("index_build", add_timer.total)
+    if db is None:
+        raise ValueError(f"No content could be extracted from {os.path.basename(file_path)}")
     return db
+
+
+# 檔案內容 hash 快取：(path, size, mtime) -> sha256，避免每次提問都重讀整個檔案
+_file_hashes: dict[tuple[str, int, int], str] = {}
+_file_hashes_lock = threading.Lock()
+
+
+def file_content_hash(file_path: str) -> str:
+    stat = os.stat(file_path)
+    cache_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    with _file_hashes_lock:
+        cached = _file_hashes.get(cache_key)
+    if cached:
+        return cached
+
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    digest = sha.hexdigest()
+    with _file_hashes_lock:
+        _file_hashes[cache_key] = digest
+    return digest
+
+
+def index_key(file_path: str, embed_type: Literal["openai", "ollama"] = "openai") -> str:
+    """索引 key = 檔案內容 hash + embedding 模型 + 切塊參數 + 索引類型，任一改變都會產生新的索引"""
+    ext = os.path.splitext(file_path)[1].lower()
+    raw = "|".join([
+        file_content_hash(file_path),
+        ext,
+        embed_type,
+        EMBEDDING_MODELS[embed_type],
+        chunker_signature(),
+        f"ann={ANN_INDEX_MODE}",
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class VectorStoreManager:
+    """以內容 hash 為 key 的向量索引管理器：每個檔案只建一次索引，持久化到磁碟並延遲載入，
+    熱門索引保留在行程內的 LRU 快取中。
+
+    indexes/{key} 是建立後不再改變的版本目錄（寫到暫存目錄後 rename 發布），以 mmap 唯讀載入，
+    多個 worker 共用作業系統 page cache 中的同一份；published/ 下每個檔案一個指標，記錄目前使用的版本，
+    重新上傳時新版本建立完成才 rename 切換，各 worker 下一次查詢即改用新版本，不需要重新啟動。"""
+
+    def __init__(self, root_dir: str = VECTORSTORE_DIR, max_cached: int = INDEX_CACHE_SIZE):
+        self.root_dir = root_dir
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[str, FAISS]" = OrderedDict()
+        self._bm25_cache: "OrderedDict[str, BM25Index]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: dict[str, threading.Lock] = {}
+        # (檔案路徑, embedding 類型) -> 這個行程最近使用的版本，版本切換後釋放舊版本
+        self._file_keys: dict[tuple[str, str], str] = {}
+
+    def _index_path(self, key: str) -> str:
+        return os.path.join(self.root_dir, "indexes", key)
+
+    def _pointer_path(self, file_path: str, embed_type: str) -> str:
+        name = hashlib.sha256(f"{os.path.abspath(file_path)}|{embed_type}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.root_dir, "published", name)
+
+    @staticmethod
+    def _read_pointer(path: str) -> Optional[dict]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def published_key(self, file_path: str, embed_type: Literal["openai", "ollama"] = "openai") -> Optional[str]:
+        pointer = self._read_pointer(self._pointer_path(file_path, embed_type))
+        return pointer["key"] if pointer else None
+
+    def _publish(self, file_path: str, embed_type: str, key: str):
+        """把檔案使用的版本指向 key：先寫暫存檔再 rename，其他 worker 只會讀到舊指標或新指標"""
+        path = self._pointer_path(file_path, embed_type)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"file": os.path.abspath(file_path), "embed_type": embed_type, "key": key}, f)
+        os.replace(tmp_path, path)
+
+    def current_key(self, file_path: str, embed_type: Literal["openai", "ollama"] = "openai") -> str:
+        """查詢使用的版本：目前內容的索引已建立就用它；重新上傳後新版本還在建立中時沿用已發布的舊版本，
+        查詢不必等待（或在另一個 worker 重複）建立索引"""
+        key = index_key(file_path, embed_type)
+        if key in self._cache or os.path.isdir(self._index_path(key)):
+            return key
+        published = self.published_key(file_path, embed_type)
+        if published and os.path.isdir(self._index_path(published)):
+            return published
+        return key
+
+    def _track(self, file_path: str, embed_type: str, key: str):
+        """檔案改用新版本時，沒有其他檔案使用的舊版本移出快取，釋放 mmap"""
+        file_key = (os.path.abspath(file_path), embed_type)
+        with self._lock:
+            previous = self._file_keys.get(file_key)
+            self._file_keys[file_key] = key
+            if previous is None or previous == key or previous in self._file_keys.values():
+                return
+            self._cache.pop(previous, None)
+            self._bm25_cache.pop(previous, None)
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _cache_get(self, key: str) -> Optional[FAISS]:
+        with self._lock:
+            db = self._cache.get(key)
+            if db is not None:
+                self._cache.move_to_end(key)
+            return db
+
+    def _cache_put(self, key: str, db: FAISS):
+        with self._lock:
+            self._cache[key] = db
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def cached_count(self) -> int:
+        with self._lock:
+            return len(self._cache)
+
+    def is_indexed(self, file_path: str, embed_type: Literal["openai", "ollama"] = "openai") -> bool:
+        key = index_key(file_path, embed_type)
+        return key in self._cache or os.path.isdir(self._index_path(key))
+
+    def _load(self, key: str, embeddings) -> Optional[FAISS]:
+        db = self._cache_get(key)
+        if db is None and os.path.isdir(self._index_path(key)):
+            with span("index_load"):
+                db = load_faiss(self._index_path(key), embeddings)
+        return db
+
+    def get(
+        self,
+        file_path: str,
+        embed_type: Literal["openai", "ollama"] = "openai",
+        on_progress: Optional[ProgressCallback] = None,
+        reuse_from: Optional[str] = None,
+    ) -> FAISS:
+        """取得單一檔案的索引：記憶體快取 -> 磁碟 -> 重新建立。
+        reuse_from 為同一檔案舊版本的索引 key，重新建立時會沿用其中未改變 chunk 的向量。"""
+        key = index_key(file_path, embed_type)
+        db = self._cache_get(key)
+        if db is not None:
+            return db
+
+        # 同一個 key 只允許一個執行緒（多 worker 時為一個行程）建立索引，其他請求等待後直接讀取結果
+        with self._key_lock(key), shared_lock(f"index:{key}"):
+            db = self._cache_get(key)
+            if db is not None:
+                return db
+
+            path = self._index_path(key)
+            embeddings = get_embeddings(embed_type)
+            if os.path.isdir(path):
+                with span("index_load"):
+                    db = load_faiss(path, embeddings)
+            else:
+                reuse = self._load(reuse_from, embeddings) if reuse_from and reuse_from != key else None
+                db = build_index(file_path, embeddings, on_progress, reuse=reuse)
+                with span("index_train"):
+                    # 串流建立 flat 索引後，依 chunk 數換成合適的 ANN 索引（大型語料才需要訓練）
+                    db = to_ann(db)
+                if on_progress:
+                    on_progress("saving", db.index.ntotal)
+                with span("index_save"):
+                    # 先寫到暫存目錄再 rename，避免其他請求讀到寫一半的索引
+                    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+                    save_faiss(db, tmp_path)
+                    # BM25 倒排索引與向量索引放在同一個目錄，一起 rename
+                    BM25Index.from_faiss(db).save(tmp_path)
+                try:
+                    os.rename(tmp_path, path)
+                except OSError:
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+                if ANN_MMAP:
+                    # 建立時的索引在行程記憶體中，改以 mmap 重新載入，與其他 worker 共用同一份
+                    with span("index_load"):
+                        db = load_faiss(path, embeddings)
+                self._publish(file_path, embed_type, key)
+            self._cache_put(key, db)
+            return db
+
+    def current(self, file_path: str, embed_type: Literal["openai", "ollama"] = "openai") -> tuple[str, FAISS]:
+        """查詢用的索引：current_key 指向的版本；就是目前內容的版本時與 get 相同（必要時建立）"""
+        key = self.current_key(file_path, embed_type)
+        db = None
+        if key != index_key(file_path, embed_type):
+            db = self._cache_get(key)
+            if db is None:
+                with self._key_lock(key):
+                    db = self._load(key, get_embeddings(embed_type))
+                    if db is not None:
+                        self._cache_put(key, db)
+        if db is None:
+            # 就是目前內容的版本，或指向的舊版本在讀取前已被清理（已發布較新的版本）：改用目前內容的版本
+            key = index_key(file_path, embed_type)
+            db = self.get(file_path, embed_type)
+        self._track(file_path, embed_type, key)
+        return key, db
+
+    def get_bm25(self, file_path: str, embed_type: Literal["openai", "ollama"] = "openai") -> BM25Index:
+        """取得單一檔案目前版本的 BM25 索引"""
+        return self._bm25(*self.current(file_path, embed_type))
+
+    def _bm25(self, key: str, db: FAISS) -> BM25Index:
+        """BM25 索引：記憶體快取 -> 索引目錄 -> 由 docstore 重建"""
+        with self._lock:
+            bm25 = self._bm25_cache.get(key)
+            if bm25 is not None:
+                self._bm25_cache.move_to_end(key)
+                return bm25
+        with self._key_lock(key):
+            with self._lock:
+                bm25 = self._bm25_cache.get(key)
+            if bm25 is None:
+                with span("bm25_load"):
+                    bm25 = load_or_build_bm25(self._index_path(key), db)
+            with self._lock:
+                self._bm25_cache[key] = bm25
+                self._bm25_cache.move_to_end(key)
+                while len(self._bm25_cache) > self.max_cached:
+                    self._bm25_cache.popitem(last=False)
+            return bm25
+
+    def get_retriever(
+        self,
+        file_paths: list[str],
+        embed_type: Literal["openai", "ollama"] = "openai",
+        k: int = 4,
+    ) -> Optional[MultiIndexRetriever]:
+        """每個檔案各自一份索引，查詢時分別搜尋再依分數合併，不會重新 embedding；
+        hybrid 模式另外查詢每個檔案的 BM25 索引並以 RRF 融合"""
+        file_paths = list(dict.fromkeys(file_paths))
+        current = [self.current(file_path, embed_type) for file_path in file_paths]
+        if not current:
+            return None
+        stores = [db for _, db in current]
+        bm25_indexes = None
+        if RETRIEVAL_MODE == "hybrid":
+            bm25_indexes = [self._bm25(key, db) for key, db in current]
+        return MultiIndexRetriever(
+            vectorstores=stores,
+            embeddings=get_embeddings(embed_type),
+            k=k,
+            bm25_indexes=bm25_indexes,
+            reranker=get_reranker(),
+        )
+
+    def _published_keys(self) -> set[str]:
+        """新版本還在建立中、查詢仍在使用的已發布版本；檔案已刪除的指標一併移除"""
+        keys = set()
+        pointer_root = os.path.join(self.root_dir, "published")
+        if not os.path.isdir(pointer_root):
+            return keys
+        for name in os.listdir(pointer_root):
+            path = os.path.join(pointer_root, name)
+            pointer = None if ".tmp-" in name else self._read_pointer(path)
+            if pointer is None:
+                continue
+            if not os.path.isfile(pointer["file"]):
+                os.remove(path)
+            elif self.current_key(pointer["file"], pointer["embed_type"]) == pointer["key"]:
+                keys.add(pointer["key"])
+        return keys
+
+    def compact(self, live_keys: set[str], grace: float = INDEX_GC_GRACE) -> int:
+        """刪除已沒有任何檔案引用的索引（檔案已刪除、被取代或切塊參數已變更），
+        以及寫入中斷留下的暫存目錄；回傳刪除的目錄數。已發布、仍在使用中的版本會保留。
+        其他 worker 已 mmap 的檔案在刪除後仍可讀取，直到它們切換到新版本"""
+        index_root = os.path.join(self.root_dir, "indexes")
+        if not os.path.isdir(index_root):
+            return 0
+        live_keys = live_keys | self._published_keys()
+        removed = 0
+        now = time.time()
+        for name in os.listdir(index_root):
+            path = os.path.join(index_root, name)
+            if ".tmp-" in name:
+                if now - os.path.getmtime(path) < grace:
+                    continue
+            elif name in live_keys:
+                continue
+            else:
+                # 正在建立中的 key 不可刪除
+                lock = self._key_lock(name)
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    with self._lock:
+                        self._cache.pop(name, None)
+                        self._bm25_cache.pop(name, None)
+                        self._key_locks.pop(name, None)
+                finally:
+                    lock.release()
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+        return removed
+
+
+vectorstore_manager = VectorStoreManager()
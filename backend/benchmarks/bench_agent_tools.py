@@ -0,0 +1,80 @@
+"""Agent 工具執行 benchmark（離線，使用假模型與假工具）：
+
+- react：ReAct 逐步執行，兩個工具各佔一輪
+- parallel：tool calling 模式，兩個工具在同一步驟同時執行
+- parallel (cached)：相同問題再問一次，工具結果直接取自 TTL 快取
+- timeout：工具延遲超過逾時設定時，agent 仍會在逾時後拿到錯誤 Observation 並繼續
+
+用法（在 backend/ 目錄下）：
+    python benchmarks/bench_agent_tools.py --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+
+async def timed(label: str, coro):
+    start = time.perf_counter()
+    result = await coro
+    print(f"{label:<22} {time.perf_counter() - start:7.3f} s  output={result['output'][:40]!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.5, help="假工具延遲（秒）")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_agent_")
+    os.environ["ENABLE_FAKE_BACKENDS"] = "true"
+    os.environ["FAKE_TOOL_LATENCY"] = str(args.latency)
+    os.environ["FAKE_LLM_TOKEN_DELAY"] = "0"
+    os.environ.setdefault("HISTORY_DIR", os.path.join(workdir, "history"))
+
+    from langchain.agents import AgentExecutor, create_react_agent
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    from routes.agent import REACT_PROMPT, get_agent_chain
+    from tools.tool_registry import TOOL_REGISTRY
+    from tools.tool_runtime import managed_tool, tool_result_cache
+
+    tool_names = ("fake_lookup", "fake_search")
+    question = "What is FAISS?"
+
+    # ReAct：以腳本化回應模擬模型逐一呼叫兩個工具
+    react_llm = FakeListChatModel(responses=[
+        f"Thought: search first\nAction: fake_search\nAction Input: {question}",
+        f"Thought: then look it up\nAction: fake_lookup\nAction Input: {question}",
+        "Thought: done\nFinal Answer: FAISS is a vector search library.",
+    ])
+    react_tools = [managed_tool(TOOL_REGISTRY[name], cache=None) for name in tool_names]
+    react = AgentExecutor(
+        agent=create_react_agent(react_llm, react_tools, REACT_PROMPT),
+        tools=react_tools,
+        handle_parsing_errors=True,
+    )
+
+    parallel = get_agent_chain("fake", tool_names, "parallel")
+    config = {"configurable": {"session_id": "bench-agent"}}
+
+    async def run():
+        await timed("react (sequential)", react.ainvoke({"input": question}))
+        tool_result_cache.clear()
+        await timed("parallel", parallel.ainvoke({"input": question}, config=config))
+        await timed("parallel (cached)", parallel.ainvoke({"input": "  what is faiss  "}, config=config))
+        print(f"tool cache hits={tool_result_cache.hits} misses={tool_result_cache.misses}")
+
+        slow = [managed_tool(TOOL_REGISTRY[name], timeout=args.latency / 2, cache=None) for name in tool_names]
+        start = time.perf_counter()
+        results = await asyncio.gather(*[tool.ainvoke(question) for tool in slow])
+        print(f"{'timeout':<22} {time.perf_counter() - start:7.3f} s  output={results[0]!r}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
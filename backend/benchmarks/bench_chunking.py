@@ -0,0 +1,86 @@
+"""切塊 benchmark：比較原本的 CharacterTextSplitter(500, 50) 與 utils/chunking.Chunker
+在大型中英文文字檔與 CSV 上的 chunk 數（= embedding 次數）、token 分布與吞吐量。
+
+用法（在 backend/ 目錄下）：
+    python benchmarks/bench_chunking.py --text-mb 20 --csv-rows 100000
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from langchain.text_splitter import CharacterTextSplitter  # noqa: E402
+
+from utils.chunking import Chunker  # noqa: E402
+from utils.loader import iter_file  # noqa: E402
+from utils.tokens import count_tokens  # noqa: E402
+
+ZH_SENTENCE = "向量資料庫會把每個文件片段轉成向量，查詢時再找出最相近的片段。"
+EN_SENTENCE = "The retriever embeds the question once and searches every selected index in parallel. "
+
+
+def write_text(path: str, megabytes: int):
+    """中文段落沒有空行（類似 PDF 擷取出的文字），英文段落以空行分隔，穿插章節標題"""
+    rng = np.random.default_rng(0)
+    size, section = 0, 0
+    with open(path, "w", encoding="utf-8") as f:
+        while size < megabytes * 1024 * 1024:
+            section += 1
+            block = f"第{section}章 測試章節\n\n"
+            block += "\n".join(ZH_SENTENCE * int(rng.integers(1, 6)) for _ in range(int(rng.integers(5, 40)))) + "\n\n"
+            block += "\n\n".join(EN_SENTENCE * int(rng.integers(1, 8)) for _ in range(int(rng.integers(2, 10)))) + "\n\n"
+            f.write(block)
+            size += len(block.encode("utf-8"))
+
+
+def write_csv(path: str, rows: int):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("sku,name,price,stock\n")
+        for row in range(rows):
+            f.write(f"SKU-{10000 + row},wireless mouse {row % 97},{row % 500},{row % 999}\n")
+
+
+def measure(label: str, file_path: str, split):
+    start = time.perf_counter()
+    chunks = list(split(iter_file(file_path)))
+    elapsed = time.perf_counter() - start
+    tokens = np.array([count_tokens(chunk.page_content) for chunk in chunks])
+    megabytes = os.path.getsize(file_path) / 1024 / 1024
+    print(f"{label:<24} chunks={len(chunks):>8}  tokens p5/p50/p95/max="
+          f"{int(np.percentile(tokens, 5))}/{int(np.median(tokens))}/{int(np.percentile(tokens, 95))}/{tokens.max()}"
+          f"  total={tokens.sum():>9}  {megabytes / elapsed:6.2f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--text-mb", type=int, default=20)
+    parser.add_argument("--csv-rows", type=int, default=100_000)
+    args = parser.parse_args()
+    logging.getLogger("langchain_text_splitters.base").setLevel(logging.ERROR)
+
+    workdir = tempfile.mkdtemp(prefix="bench_chunking_")
+    text_path = os.path.join(workdir, "corpus.txt")
+    csv_path = os.path.join(workdir, "products.csv")
+    write_text(text_path, args.text_mb)
+    write_csv(csv_path, args.csv_rows)
+
+    splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    chunker = Chunker()
+
+    def character_split(docs):
+        for doc in docs:
+            yield from splitter.split_documents([doc])
+
+    for name, path in (("text", text_path), ("csv", csv_path)):
+        measure(f"{name} CharacterTextSplitter", path, character_split)
+        measure(f"{name} Chunker", path, chunker.iter_chunks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""參考資料組裝 benchmark（離線）：比較舊的 format_docs（直接串接 top-4 chunk）與新的 context 組裝
+（多取候選 -> 合併相鄰 chunk 去重疊 -> 去除近似重複 -> MMR -> 依 token 預算打包並附來源編號）。
+
+合成語料模擬常見的重複內容：
+- CSV：同一商品在多個倉庫各有一列，只有倉庫與庫存不同（近似重複列）
+- TXT：每個章節都附上相同的免責聲明段落，並以 Chunker 的重疊切塊
+
+量測每個問題放入 prompt 的參考資料 token 數，以及答案所需的事實（SKU 的價格）是否仍在參考資料中。
+
+用法（在 backend/ 目錄下）：
+    python benchmarks/bench_context.py --products 2000 --queries 200
+"""
+import argparse
+import hashlib
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from langchain_community.vectorstores import FAISS  # noqa: E402
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from utils.bm25 import BM25Index  # noqa: E402
+from utils.chunking import Chunker  # noqa: E402
+from utils.context import AGENT_CONTEXT_TOKEN_BUDGET, DEFAULT_CONTEXT_TOKEN_BUDGET, assemble_context  # noqa: E402
+from utils.loader import iter_file  # noqa: E402
+from utils.retriever import MultiIndexRetriever  # noqa: E402
+from utils.tokens import count_tokens  # noqa: E402
+
+WORDS = ("wireless ergonomic compact portable waterproof silent mechanical foldable rechargeable premium "
+         "mouse keyboard headset speaker charger backpack lamp monitor camera router tripod microphone").split()
+WAREHOUSES = ["Taipei", "Taichung", "Kaohsiung", "Tainan", "Hsinchu"]
+DISCLAIMER = ("Disclaimer: prices and availability are subject to change without notice. Please contact the "
+              "sales team for bulk orders, warranty terms and return policies before placing an order.")
+
+
+class HashedWordEmbeddings(Embeddings):
+    """以英文字與代碼做 feature hashing 的假語意向量"""
+
+    def __init__(self, size: int = 256):
+        self.size = size
+
+    def _vector(self, text: str) -> list[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"[a-z0-9\-]+", text.lower()):
+            vector[int.from_bytes(hashlib.md5(word.encode()).digest()[:4], "little") % self.size] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def write_corpus(workdir: str, products: int, seed: int = 0) -> tuple[list[str], dict[str, str]]:
+    rng = random.Random(seed)
+    prices: dict[str, str] = {}
+    csv_path = os.path.join(workdir, "inventory.csv")
+    with open(csv_path, "w", encoding="utf-8") as f:
+        f.write("sku,name,price,warehouse,stock,description\n")
+        for i in range(products):
+            sku = f"SKU-{10000 + i}"
+            name = f"{rng.choice(WORDS)} {rng.choice(WORDS)}"
+            price = f"{rng.uniform(5, 500):.2f}"
+            description = " ".join(rng.choice(WORDS) for _ in range(10))
+            prices[sku] = price
+            for warehouse in rng.sample(WAREHOUSES, rng.randint(2, 4)):
+                f.write(f"{sku},{name},{price},{warehouse},{rng.randint(0, 200)},{description}\n")
+
+    txt_path = os.path.join(workdir, "catalog.txt")
+    with open(txt_path, "w", encoding="utf-8") as f:
+        for section, sku in enumerate(list(prices)[: products // 4]):
+            body = " ".join(rng.choice(WORDS) for _ in range(120))
+            f.write(f"## {sku} overview\n\n{sku} is listed at {prices[sku]} dollars. {body}.\n\n{DISCLAIMER}\n\n")
+    return [csv_path, txt_path], prices
+
+
+def build_retriever(paths: list[str], k: int) -> MultiIndexRetriever:
+    embeddings = HashedWordEmbeddings()
+    stores, bm25_indexes = [], []
+    for path in paths:
+        chunks = Chunker().split_documents(iter_file(path))
+        db = FAISS.from_documents(chunks, embeddings)
+        stores.append(db)
+        bm25_indexes.append(BM25Index.from_faiss(db))
+    return MultiIndexRetriever(vectorstores=stores, embeddings=embeddings, k=k, bm25_indexes=bm25_indexes)
+
+
+def old_format_docs(docs) -> str:
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--fetch-k", type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_context_")
+    paths, prices = write_corpus(workdir, args.products)
+    retriever_old = build_retriever(paths, k=4)
+    retriever_new = build_retriever(paths, k=args.fetch_k)
+
+    rng = random.Random(1)
+    skus = rng.sample(list(prices), min(args.queries, len(prices)))
+    variants = {
+        "old: top-4 joined": lambda q: old_format_docs(retriever_old.invoke(q)),
+        f"new: top-{args.fetch_k}, budget {DEFAULT_CONTEXT_TOKEN_BUDGET}": lambda q: assemble_context(retriever_new.invoke(q), DEFAULT_CONTEXT_TOKEN_BUDGET),
+        f"new: top-{args.fetch_k}, budget {AGENT_CONTEXT_TOKEN_BUDGET} (agent)": lambda q: assemble_context(retriever_new.invoke(q), AGENT_CONTEXT_TOKEN_BUDGET),
+    }
+    print(f"{args.products} products, {len(skus)} queries\n")
+    print(f"{'variant':<36} {'tokens mean':>12} {'p95':>7} {'fact found':>11} {'ms/query':>9}")
+    for label, build in variants.items():
+        tokens, found = [], 0
+        start = time.perf_counter()
+        for sku in skus:
+            context = build(f"What is the price of {sku}?")
+            tokens.append(count_tokens(context))
+            found += sku in context and prices[sku] in context
+        elapsed = (time.perf_counter() - start) * 1000 / len(skus)
+        p95 = sorted(tokens)[int(0.95 * (len(tokens) - 1))]
+        print(f"{label:<36} {statistics.mean(tokens):>12.0f} {p95:>7} {found / len(skus):>10.1%} {elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Embedding 快取 benchmark：以假 embedding 後端離線量測命中率與吞吐量。
+
+用法（在 backend/ 目錄下）：
+    python benchmarks/bench_embedding_cache.py --texts 5000 --dup-ratio 0.3 --latency 0.05 --latency-per-text 0.0002
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from utils.embedding_cache import CachedEmbeddings, FakeEmbeddings, SQLiteEmbeddingStore
+
+
+def make_texts(count: int, dup_ratio: float, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    unique = max(1, int(count * (1 - dup_ratio)))
+    base = [f"row {i}: value={rng.random():.6f} category={rng.choice('ABCDE')}" for i in range(unique)]
+    return [base[i] if i < unique else rng.choice(base) for i in range(count)]
+
+
+def run(label: str, embeddings, texts: list[str]):
+    start = time.perf_counter()
+    embeddings.embed_documents(texts)
+    elapsed = time.perf_counter() - start
+    line = f"{label:<28} {elapsed:8.3f}s  {len(texts) / elapsed:10.1f} texts/s"
+    if isinstance(embeddings, CachedEmbeddings):
+        total = embeddings.hits + embeddings.misses
+        line += f"  hit rate {embeddings.hits / total:6.1%}" if total else ""
+        embeddings.hits = embeddings.misses = 0
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--dup-ratio", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0.05, help="每批模擬延遲（秒）")
+    parser.add_argument("--latency-per-text", type=float, default=0.0002, help="每筆文字模擬延遲（秒）")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    texts = make_texts(args.texts, args.dup_ratio)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteEmbeddingStore(os.path.join(tmp, "embeddings.sqlite"))
+
+        baseline = FakeEmbeddings(latency=args.latency, latency_per_text=args.latency_per_text)
+        # 無快取、單一請求送出全部文字（等同直接呼叫後端）
+        run("uncached, single request", baseline, texts)
+
+        serial = CachedEmbeddings(FakeEmbeddings(latency=args.latency, latency_per_text=args.latency_per_text), "fake", store,
+                                  batch_size=args.batch_size, concurrency=1)
+        run("cold cache, serial", serial, texts)
+
+        store_parallel = SQLiteEmbeddingStore(os.path.join(tmp, "parallel.sqlite"))
+        parallel = CachedEmbeddings(FakeEmbeddings(latency=args.latency, latency_per_text=args.latency_per_text), "fake", store_parallel,
+                                    batch_size=args.batch_size, concurrency=args.concurrency)
+        run(f"cold cache, concurrency={args.concurrency}", parallel, texts)
+        run("warm cache", parallel, texts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""LLM client 建立成本 benchmark：比較「每次請求新建 client」與「共用 registry client」。
+
+在本機啟動一個 OpenAI 相容的 stub server（不需網路、不需 API key），
+量測每次請求的平均延遲以及 server 實際接受的 TCP 連線數。
+用法（在 backend/ 目錄下）：
+    python benchmarks/bench_llm_clients.py --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+COMPLETION = {
+    "id": "chatcmpl-stub",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o-mini",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支援 keep-alive
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StubHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps(COMPLETION).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+async def measure(label: str, get_client, requests: int):
+    StubHandler.connections = 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        await get_client().ainvoke("ping")
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed / requests * 1000:8.2f} ms/request  connections={StubHandler.connections}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    params = {"base_url": f"http://127.0.0.1:{args.port}/v1", "max_retries": 0, "timeout": 10}
+
+    from langchain_openai import ChatOpenAI
+    from llm_provider import LLMRegistry
+
+    registry = LLMRegistry()
+
+    async def run():
+        await measure("new client per request",
+                      lambda: ChatOpenAI(model="gpt-4o-mini", temperature=0, **params), args.requests)
+        await measure("registry client", lambda: registry.get("openai", **params), args.requests)
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
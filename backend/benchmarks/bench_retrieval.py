@@ -0,0 +1,119 @@
+"""檢索品質與延遲 benchmark（離線）：比較 vector / bm25 / hybrid（RRF）三種檢索。
+
+合成一份類似 load_csv 輸出的商品資料（每列含 SKU 代碼與描述），以 feature hashing 的
+假 embedding 模擬語意向量：它只看一般英文字、看不到數字代碼，重現「精確代碼查詢常常找不到」的情況。
+兩類問題：
+- code：以 SKU 查詢（例如 "price of SKU-48213"）
+- semantic：以描述用字查詢（例如 "wireless ergonomic mouse for travel"）
+
+用法（在 backend/ 目錄下）：
+    python benchmarks/bench_retrieval.py --rows 20000 --queries 200 --k 4
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from langchain_community.vectorstores import FAISS  # noqa: E402
+from langchain_core.documents import Document  # noqa: E402
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from utils.bm25 import BM25Index  # noqa: E402
+from utils.retriever import MultiIndexRetriever  # noqa: E402
+
+ADJECTIVES = ["wireless", "ergonomic", "compact", "portable", "waterproof", "silent", "mechanical", "foldable",
+              "rechargeable", "premium", "budget", "gaming", "travel", "office", "outdoor", "smart"]
+NOUNS = ["mouse", "keyboard", "headset", "speaker", "charger", "backpack", "lamp", "monitor", "camera",
+         "router", "tripod", "microphone", "stand", "cable", "adapter", "watch"]
+
+
+class HashedWordEmbeddings(Embeddings):
+    """只以英文字（不含數字）做 feature hashing 的假語意向量"""
+
+    def __init__(self, size: int = 256):
+        self.size = size
+
+    def _vector(self, text: str) -> list[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"[a-z]+", text.lower()):
+            digest = hashlib.md5(word.encode()).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.size] += 1.0 if digest[4] % 2 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def make_corpus(rows: int, rng: np.random.Generator):
+    docs, products = [], []
+    for row in range(rows):
+        adjectives = list(rng.choice(ADJECTIVES, size=2, replace=False))
+        noun = str(rng.choice(NOUNS))
+        sku = f"SKU-{10000 + row}"
+        price = int(rng.integers(5, 500))
+        text = f"sku: {sku}\nname: {' '.join(adjectives)} {noun}\nprice: {price}\nstock: {int(rng.integers(0, 999))}"
+        docs.append(Document(page_content=text, metadata={"source": "products.csv", "row": row + 1}))
+        products.append((sku, adjectives, noun))
+    return docs, products
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    docs, products = make_corpus(args.rows, rng)
+    embeddings = HashedWordEmbeddings()
+    db = FAISS.from_documents(docs, embeddings)
+    bm25 = BM25Index.from_faiss(db)
+    row_of = {doc.page_content: i for i, doc in enumerate(docs)}
+
+    picks = rng.choice(args.rows, size=args.queries, replace=False)
+    query_sets = {
+        "code": [(f"What is the price of {products[i][0]}?", {i}) for i in picks],
+        "semantic": [],
+    }
+    for i in picks:
+        _, adjectives, noun = products[i]
+        relevant = {j for j, (_, adj, n) in enumerate(products) if n == noun and set(adj) == set(adjectives)}
+        query_sets["semantic"].append((f"looking for a {adjectives[0]} {adjectives[1]} {noun}", relevant))
+
+    retrievers = {
+        "vector": MultiIndexRetriever(vectorstores=[db], embeddings=embeddings, k=args.k),
+        "bm25": None,
+        "hybrid": MultiIndexRetriever(vectorstores=[db], embeddings=embeddings, k=args.k, bm25_indexes=[bm25]),
+    }
+
+    print(f"rows={args.rows} queries={args.queries} k={args.k}")
+    print(f"{'retriever':<8} {'queries':<9} {'hit@k':>6} {'precision':>10} {'ms/query':>9}")
+    for name, retriever in retrievers.items():
+        for kind, queries in query_sets.items():
+            hits, precision = 0, 0.0
+            start = time.perf_counter()
+            for question, relevant in queries:
+                if retriever is None:
+                    found = [row_of[db.docstore.search(doc_id).page_content] for doc_id, _ in bm25.search(question, args.k)]
+                else:
+                    found = [row_of[doc.page_content] for doc in retriever.invoke(question)]
+                matched = len(set(found) & relevant)
+                hits += matched > 0
+                precision += matched / max(1, min(args.k, len(relevant)))
+            latency_ms = (time.perf_counter() - start) / len(queries) * 1000
+            print(f"{name:<8} {kind:<9} {hits / len(queries):6.3f} {precision / len(queries):10.3f} {latency_ms:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""code_interpreter 沙箱 benchmark：量測單次延遲、並行執行的總時間，
+以及沙箱執行 CPU 密集程式碼時 event loop 是否仍能即時回應。
+
+用法（在 backend/ 目錄下）：
+    python benchmarks/bench_sandbox.py --concurrency 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+CPU_CODE = "s = 0\nfor i in range(10_000_000):\n    s += i\nprint(s)"
+
+
+async def heartbeat(stop: asyncio.Event) -> float:
+    """每 10ms 醒來一次，回傳最大延遲；數值接近 10ms 代表 server 沒有被卡住"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, time.perf_counter() - start)
+    return worst
+
+
+async def run(concurrency: int):
+    from tools.code_interpreter_tool import code_interpreter
+
+    await code_interpreter.ainvoke("1")  # 等 worker 完成預載
+
+    start = time.perf_counter()
+    await code_interpreter.ainvoke("2 + 2")
+    print(f"{'simple snippet':<20} {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    start = time.perf_counter()
+    await code_interpreter.ainvoke(CPU_CODE)
+    single = time.perf_counter() - start
+    print(f"{'cpu snippet x1':<20} {single:8.2f} s")
+
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*[code_interpreter.ainvoke(CPU_CODE) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    worst = await beat
+    print(f"{f'cpu snippet x{concurrency}':<20} {elapsed:8.2f} s  (speedup {single * concurrency / elapsed:.2f}x, cpus={os.cpu_count()})")
+    print(f"{'event loop max lag':<20} {worst * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""/api/ask 串流負載測試：以假 LLM 量測 time-to-first-token 與同時串流的承載量。
+
+在本機啟動 uvicorn（假模型不需網路），以多個並行 client 讀取 SSE 串流。
+用法（在 backend/ 目錄下）：
+    python benchmarks/bench_streaming.py --concurrency 1 8 32 --token-delay 0.01
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+
+def start_server(port: int):
+    import uvicorn
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def one_request(client, url: str, session: str) -> tuple[float, float]:
+    start = time.perf_counter()
+    first = None
+    payload = {"question": "hello", "model": "fake"}
+    async with client.stream("POST", url, json=payload, headers={"X-Session-ID": session}) as response:
+        async for line in response.aiter_lines():
+            if first is None and line.startswith("event: token"):
+                first = time.perf_counter() - start
+    return first or float("nan"), time.perf_counter() - start
+
+
+def percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def run_level(url: str, concurrency: int, rounds: int):
+    import httpx
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            one_request(client, url, f"bench-{concurrency}-{i}")
+            for i in range(concurrency * rounds)
+        ])
+        wall = time.perf_counter() - start
+    ttft = [r[0] for r in results]
+    total = [r[1] for r in results]
+    print(
+        f"concurrency={concurrency:<4} streams={len(results):<5} "
+        f"ttft p50={statistics.median(ttft) * 1000:7.1f}ms p95={percentile(ttft, 95) * 1000:7.1f}ms  "
+        f"total p50={statistics.median(total) * 1000:7.1f}ms  "
+        f"throughput={len(results) / wall:6.1f} streams/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    os.environ["ENABLE_FAKE_BACKENDS"] = "true"
+    os.environ["FAKE_LLM_TOKEN_DELAY"] = str(args.token_delay)
+    # 在暫存目錄執行，避免 history_store 等資料寫進專案
+    os.chdir(tempfile.mkdtemp(prefix="bench-streaming-"))
+    server = start_server(args.port)
+    try:
+        url = f"http://127.0.0.1:{args.port}/api/ask"
+        for concurrency in args.concurrency:
+            asyncio.run(run_level(url, concurrency, args.rounds))
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""多 worker 記憶體 benchmark（離線，需 Linux 的 /proc/<pid>/smaps_rollup）：比較每個 worker 各自複製一份索引
+（舊格式：flat 索引 + index.pkl docstore + 行程內建立的 BM25）與以 mmap 共用索引（IVF1 + SQLite docstore + numpy BM25）。
+
+每個 worker 載入同一個索引並執行查詢（向量搜尋 + BM25 + 讀取 docstore），全部 worker 同時存活時量測：
+- RSS：行程看到的常駐記憶體（共用頁面每個行程都會算一次）
+- USS：行程私有的記憶體（Private_Clean + Private_Dirty），worker 數增加時真正增加的量
+- PSS 總和：共用頁面依使用的行程數平分後的總和，即整組 worker 實際佔用的記憶體
+
+用法（在 backend/ 目錄下）：
+    python benchmarks/bench_workers.py --chunks 50000 --dim 768 --workers 1 2 4
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from langchain_community.vectorstores import FAISS  # noqa: E402
+from langchain_core.embeddings import FakeEmbeddings  # noqa: E402
+
+from utils.ann_index import load_faiss, save_faiss  # noqa: E402
+from utils.bm25 import BM25Index  # noqa: E402
+
+WORDS = ("invoice shipment warehouse refund contract budget quarterly revenue supplier inventory "
+         "forecast audit payroll compliance customer ticket outage latency deploy rollback").split()
+MODES = ("copy", "mmap")
+
+
+def smaps() -> dict[str, int]:
+    """目前行程的記憶體統計（KiB）"""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return values
+
+
+def build_corpus(workdir: str, chunks: int, dim: int):
+    """建立同一份語料的兩種索引目錄：copy（舊格式）與 mmap（新格式）"""
+    rng = random.Random(0)
+    texts = [" ".join(rng.choice(WORDS) for _ in range(120)) + f" ref-{i}" for i in range(chunks)]
+    vectors = np.random.default_rng(0).standard_normal((chunks, dim)).astype(np.float32)
+    embeddings = FakeEmbeddings(size=dim)
+    db = FAISS.from_embeddings(list(zip(texts, vectors.tolist())), embeddings)
+
+    db.save_local(os.path.join(workdir, "copy"))
+    save_faiss(db, os.path.join(workdir, "mmap"), mmap=True)
+    BM25Index.from_faiss(db).save(os.path.join(workdir, "mmap"))
+
+
+def worker(workdir: str, mode: str, dim: int, queries: int, barrier, results):
+    embeddings = FakeEmbeddings(size=dim)
+    path = os.path.join(workdir, mode)
+    if mode == "copy":
+        db = load_faiss(path, embeddings, mmap=False)
+        bm25 = BM25Index.from_faiss(db)
+    else:
+        db = load_faiss(path, embeddings, mmap=True)
+        bm25 = BM25Index.load(path)
+
+    rng = np.random.default_rng(os.getpid())
+    started = time.perf_counter()
+    for i in range(queries):
+        db.similarity_search_with_score_by_vector(rng.standard_normal(dim).tolist(), k=8)
+        for doc_id, _ in bm25.search(f"{WORDS[i % len(WORDS)]} ref-{i}", 8):
+            db.docstore.search(doc_id)
+    elapsed = (time.perf_counter() - started) * 1000 / queries
+
+    # 所有 worker 都載入完成後才量測，共用頁面的 PSS 才會被平分
+    barrier.wait()
+    memory = smaps()
+    results.put((memory["Rss"], memory["Private_Clean"] + memory["Private_Dirty"], memory["Pss"], elapsed))
+    barrier.wait()
+
+
+def run(workdir: str, mode: str, workers: int, dim: int, queries: int) -> list[tuple[int, int, int, float]]:
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(workdir, mode, dim, queries, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("This benchmark needs /proc/<pid>/smaps_rollup (Linux)")
+
+    workdir = tempfile.mkdtemp(prefix="bench_workers_")
+    started = time.perf_counter()
+    build_corpus(workdir, args.chunks, args.dim)
+    print(f"{args.chunks} chunks x {args.dim} dims, built in {time.perf_counter() - started:.1f}s\n")
+
+    print(f"{'mode':<6} {'workers':>7} {'RSS/worker MB':>14} {'USS/worker MB':>14} {'PSS total MB':>13} {'ms/query':>9}")
+    for mode in MODES:
+        for workers in args.workers:
+            samples = run(workdir, mode, workers, args.dim, args.queries)
+            rss = statistics.mean(s[0] for s in samples) / 1024
+            uss = statistics.mean(s[1] for s in samples) / 1024
+            pss = sum(s[2] for s in samples) / 1024
+            latency = statistics.mean(s[3] for s in samples)
+            print(f"{mode:<6} {workers:>7} {rss:>14.0f} {uss:>14.0f} {pss:>13.0f} {latency:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
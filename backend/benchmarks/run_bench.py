@@ -0,0 +1,377 @@
+"""端對端 benchmark（離線）：在同一個行程內以 uvicorn 啟動 main.app，搭配假 LLM、假 embedding 與假工具，
+以不同並行數打 /api/ask（plain / rag / cot / rag_cot）、/api/agent 與 /api/upload，
+並用遞增大小的合成 TXT / CSV / PDF 語料。
+
+每個情境輸出 p50 / p95 延遲、time-to-first-token、吞吐量與 peak RSS，結果存成 JSON 當作 baseline，
+之後可與新的結果比較（p95 延遲變慢或吞吐量下降超過 --tolerance 時 exit code 為 1）。
+
+用法（在 backend/ 目錄下）：
+    python benchmarks/run_bench.py --sizes 64 512 --concurrency 1 4 --output baseline.json
+    python benchmarks/run_bench.py --baseline baseline.json --output current.json
+    python benchmarks/run_bench.py --compare baseline.json current.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+ASK_MODES = {
+    "ask_plain": {"use_rag": False, "use_cot": False},
+    "ask_rag": {"use_rag": True, "use_cot": False},
+    "ask_cot": {"use_rag": False, "use_cot": True},
+    "ask_rag_cot": {"use_rag": True, "use_cot": True},
+}
+SCENARIOS = (*ASK_MODES, "agent", "upload")
+FORMATS = ("txt", "csv", "pdf")
+# 第一個 SSE 內容事件即為 time-to-first-token
+CONTENT_EVENTS = ("token", "thought", "final_answer")
+
+WORDS = ("vector index query latency throughput embedding chunk retrieval answer model token stream cache "
+         "cluster shard replica memory page batch worker schedule budget context prompt tool agent").split()
+CJK_PHRASES = ["向量資料庫", "檢索結果", "模型回答", "文件片段", "查詢延遲", "快取命中", "背景工作"]
+
+
+# ---------- 合成語料 ----------
+
+def synthetic_paragraphs(size_kb: int, seed: int):
+    rng = random.Random(seed)
+    written = 0
+    section = 0
+    while written < size_kb * 1024:
+        if rng.random() < 0.1:
+            section += 1
+            paragraph = f"## Section {section}"
+        else:
+            words = [rng.choice(WORDS) for _ in range(rng.randint(40, 120))]
+            words.insert(rng.randrange(len(words)), f"SKU-{rng.randint(0, 99999):05d}")
+            paragraph = " ".join(words) + ". " + rng.choice(CJK_PHRASES) + "。"
+        written += len(paragraph.encode("utf-8"))
+        yield paragraph
+
+
+def write_txt(path: str, size_kb: int, seed: int = 0):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(synthetic_paragraphs(size_kb, seed)))
+
+
+def write_csv(path: str, size_kb: int, seed: int = 0):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("sku,name,category,price,description\n")
+        while f.tell() < size_kb * 1024:
+            description = " ".join(rng.choice(WORDS) for _ in range(12))
+            f.write(f"SKU-{rng.randint(0, 99999):05d},{rng.choice(WORDS)} {rng.choice(WORDS)},"
+                    f"{rng.choice(WORDS)},{rng.uniform(1, 500):.2f},{description}\n")
+
+
+def write_pdf(path: str, size_kb: int, seed: int = 0):
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    page_text = ""
+    for paragraph in synthetic_paragraphs(size_kb, seed):
+        # 只用 ASCII 內容，避免內建字型缺字；每頁約 2500 字元
+        paragraph = paragraph.encode("ascii", "ignore").decode()
+        if len(page_text) + len(paragraph) > 2500:
+            doc.new_page().insert_textbox(fitz.Rect(40, 40, 560, 800), page_text, fontsize=8)
+            page_text = ""
+        page_text += paragraph + "\n\n"
+    if page_text:
+        doc.new_page().insert_textbox(fitz.Rect(40, 40, 560, 800), page_text, fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+WRITERS = {"txt": write_txt, "csv": write_csv, "pdf": write_pdf}
+
+
+def unique_content(content: bytes, fmt: str, tag: str) -> bytes:
+    """每次上傳的內容都不同，避免被判定為重複檔案而略過索引"""
+    if fmt == "txt":
+        return content + f"\n\nupload {tag}".encode()
+    if fmt == "csv":
+        return content + f"SKU-{tag},upload,bench,0,upload\n".encode()
+    # PDF：在檔尾之後附加註解，PyMuPDF 會忽略，但檔案 hash 不同
+    return content + f"\n%{tag}\n".encode()
+
+
+# ---------- 量測 ----------
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def peak_rss_mb() -> float:
+    # Linux 的 ru_maxrss 單位為 KB；加上子行程（PDF 擷取、程式沙箱）的峰值
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(max(own, children) / scale, 1)
+
+
+def summarize(scenario: str, size_kb: int, concurrency: int, samples: list[dict], wall: float) -> dict:
+    ok = [s for s in samples if not s["error"]]
+    latency = [s["latency"] for s in ok]
+    ttft = [s["ttft"] for s in ok if s["ttft"] is not None]
+    result = {
+        "scenario": scenario,
+        "size_kb": size_kb,
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "rejected": sum(1 for s in samples if s.get("rejected")),
+        "latency_ms": {"p50": round(percentile(latency, 50) * 1000, 1), "p95": round(percentile(latency, 95) * 1000, 1)},
+        "ttft_ms": {"p50": round(percentile(ttft, 50) * 1000, 1), "p95": round(percentile(ttft, 95) * 1000, 1)} if ttft else None,
+        "throughput_rps": round(len(ok) / wall, 2) if wall > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    ttft_text = f"ttft p50={result['ttft_ms']['p50']:8.1f}ms " if ttft else " " * 22
+    print(
+        f"{scenario:<12} size={size_kb:>6}KB c={concurrency:<3} n={len(samples):<4} err={result['errors']:<3} 429={result['rejected']:<3} "
+        f"p50={result['latency_ms']['p50']:8.1f}ms p95={result['latency_ms']['p95']:8.1f}ms "
+        f"{ttft_text}{result['throughput_rps']:7.2f} req/s  rss={result['peak_rss_mb']}MB"
+    )
+    return result
+
+
+async def stream_request(client, url: str, payload: dict, session: str) -> dict:
+    start = time.perf_counter()
+    ttft = None
+    error = False
+    rejected = False
+    try:
+        async with client.stream("POST", url, json=payload, headers={"X-Session-ID": session}) as response:
+            # 429：排隊控制在入口拒絕（後端滿載）
+            rejected = response.status_code == 429
+            error = response.status_code != 200
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                    if ttft is None and event in CONTENT_EVENTS:
+                        ttft = time.perf_counter() - start
+                    elif event == "error":
+                        error = True
+    except Exception:
+        error = True
+    return {"latency": time.perf_counter() - start, "ttft": ttft, "error": error, "rejected": rejected}
+
+
+async def upload_request(client, base_url: str, file_name: str, content: bytes) -> dict:
+    """上傳後輪詢背景工作直到完成，延遲 = 上傳到索引建立完成"""
+    start = time.perf_counter()
+    try:
+        response = await client.post(f"{base_url}/api/upload", files={"file": (file_name, content)})
+        job_id = response.json()["job_id"]
+        while True:
+            job = (await client.get(f"{base_url}/api/upload/{job_id}")).json()
+            if job["stage"] in ("done", "duplicate", "failed"):
+                break
+            await asyncio.sleep(0.02)
+        error = job["stage"] == "failed"
+    except Exception:
+        error = True
+    return {"latency": time.perf_counter() - start, "ttft": None, "error": error}
+
+
+async def run_level(make_request, total: int, concurrency: int) -> tuple[list[dict], float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(i: int):
+        async with semaphore:
+            return await make_request(i)
+
+    start = time.perf_counter()
+    samples = await asyncio.gather(*[limited(i) for i in range(total)])
+    return list(samples), time.perf_counter() - start
+
+
+# ---------- 執行 ----------
+
+def start_server(port: int):
+    import uvicorn
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_suite(args, corpora: dict[tuple[str, int], str]) -> list[dict]:
+    import httpx
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = []
+    async with httpx.AsyncClient(timeout=600) as client:
+        for scenario in args.scenarios:
+            if scenario == "upload":
+                for fmt in FORMATS:
+                    for size_kb in args.sizes:
+                        with open(corpora[(fmt, size_kb)], "rb") as f:
+                            content = f.read()
+                        for concurrency in args.concurrency:
+                            def make_upload(i: int, fmt=fmt, size_kb=size_kb, content=content, concurrency=concurrency):
+                                tag = f"{concurrency}-{i}-{time.time_ns()}"
+                                return upload_request(client, base_url, f"bench_{size_kb}kb_{tag}.{fmt}", unique_content(content, fmt, tag))
+
+                            samples, wall = await run_level(make_upload, args.uploads, concurrency)
+                            results.append(summarize(f"upload_{fmt}", size_kb, concurrency, samples, wall))
+                continue
+
+            if scenario == "agent":
+                url = f"{base_url}/api/agent"
+                sizes = [0]
+            else:
+                url = f"{base_url}/api/ask"
+                sizes = args.sizes if ASK_MODES[scenario]["use_rag"] else [0]
+
+            for size_kb in sizes:
+                selected_files = [corpora[(fmt, size_kb)] for fmt in FORMATS] if size_kb else []
+                for concurrency in args.concurrency:
+                    def make_request(i: int, scenario=scenario, selected_files=selected_files, concurrency=concurrency):
+                        # 每個請求問題不同，避免命中工具結果快取
+                        question = f"What is the latency of SKU-{i:05d} in run {concurrency}-{i}?"
+                        if scenario == "agent":
+                            payload = {
+                                "question": question,
+                                "model": "fake",
+                                "agent_mode": args.agent_mode,
+                                "plugin_detail": [{"tool_name": name, "enable": True} for name in ("fake_search", "fake_lookup")],
+                            }
+                        else:
+                            payload = {"question": question, "model": "fake", "selected_files": selected_files, **ASK_MODES[scenario]}
+                        return stream_request(client, url, payload, f"bench-{scenario}-{concurrency}-{i}")
+
+                    samples, wall = await run_level(make_request, args.requests, concurrency)
+                    results.append(summarize(scenario, size_kb, concurrency, samples, wall))
+    return results
+
+
+def build_corpora(args, workdir: str) -> dict[tuple[str, int], str]:
+    """產生語料，並預先建立 RAG 用的索引（索引建立時間由 upload 情境量測）"""
+    from vectorstore import vectorstore_manager
+
+    corpora = {}
+    for fmt in FORMATS:
+        for size_kb in args.sizes:
+            path = os.path.join(workdir, "corpus", f"corpus_{size_kb}kb.{fmt}")
+            WRITERS[fmt](path, size_kb)
+            corpora[(fmt, size_kb)] = path
+            if any(ASK_MODES.get(s, {}).get("use_rag") for s in args.scenarios):
+                vectorstore_manager.get(path, "fake")
+    return corpora
+
+
+def key_of(result: dict) -> tuple:
+    return result["scenario"], result["size_kb"], result["concurrency"]
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> bool:
+    """逐一比較相同情境：p95 延遲增加或吞吐量下降超過 tolerance 視為退步，回傳是否有退步"""
+    previous = {key_of(r): r for r in baseline["results"]}
+    regressed = False
+    print(f"\n{'scenario':<14}{'size':>8}{'c':>4}  {'p95 ms (old -> new)':>28}  {'req/s (old -> new)':>24}")
+    for result in current["results"]:
+        old = previous.get(key_of(result))
+        if old is None:
+            continue
+        p95_old, p95_new = old["latency_ms"]["p95"], result["latency_ms"]["p95"]
+        rps_old, rps_new = old["throughput_rps"] or 0, result["throughput_rps"] or 0
+        slower = p95_old > 0 and (p95_new - p95_old) / p95_old > tolerance
+        lower = rps_old > 0 and (rps_old - rps_new) / rps_old > tolerance
+        flag = "  REGRESSION" if slower or lower else ""
+        regressed = regressed or slower or lower
+        print(
+            f"{result['scenario']:<14}{result['size_kb']:>8}{result['concurrency']:>4}  "
+            f"{p95_old:>11.1f} -> {p95_new:<11.1f}({(p95_new - p95_old) / max(p95_old, 1e-9):+6.1%})  "
+            f"{rps_old:>8.2f} -> {rps_new:<8.2f}({(rps_new - rps_old) / max(rps_old, 1e-9):+6.1%}){flag}"
+        )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 512], help="合成語料大小（KB）")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--requests", type=int, default=16, help="每個並行等級的 ask / agent 請求數")
+    parser.add_argument("--uploads", type=int, default=4, help="每個並行等級的上傳數")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="假 LLM 每個 token 的延遲（秒）")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="假 embedding 每批的延遲（秒）")
+    parser.add_argument("--tool-latency", type=float, default=0.1, help="假工具延遲（秒）")
+    parser.add_argument("--agent-mode", default="parallel", choices=("react", "parallel"))
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--output", help="結果 JSON 的輸出路徑")
+    parser.add_argument("--baseline", help="與這份結果 JSON 比較")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="容許的退步比例")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="只比較兩份結果，不執行")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            sys.exit(1 if compare(json.load(f_old), json.load(f_new), args.tolerance) else 0)
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    # 假模型與假工具的延遲由環境變數設定，必須在 import app 之前
+    os.environ["ENABLE_FAKE_BACKENDS"] = "true"
+    os.environ["FAKE_LLM_TOKEN_DELAY"] = str(args.token_delay)
+    os.environ["FAKE_TOOL_LATENCY"] = str(args.tool_latency)
+    os.environ["FAKE_EMBEDDING_LATENCY"] = str(args.embed_latency)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("AGENT_TRACE_SAMPLE_RATE", "0")
+    # 在暫存目錄執行，上傳檔、索引與對話紀錄都不會寫進專案
+    workdir = tempfile.mkdtemp(prefix="run-bench-")
+    os.chdir(workdir)
+    os.makedirs("corpus")
+
+    # 上傳一律以 openai 的 embedding 建索引；benchmark 中所有後端都換成假 embedding，不需要網路與 API key
+    from utils import embedding
+    from utils.embedding_cache import FakeEmbeddings
+    embedding._create_embeddings = lambda model: FakeEmbeddings(size=256, latency=args.embed_latency)
+
+    corpora = build_corpora(args, workdir)
+    server = start_server(args.port)
+    try:
+        results = asyncio.run(run_suite(args, corpora))
+    finally:
+        server.should_exit = True
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "compare")},
+        },
+        "results": results,
+    }
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nresults written to {output}")
+    if baseline_path:
+        with open(baseline_path) as f:
+            if compare(json.load(f), report, args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# 測試以 app/ 為根目錄 import（與 uvicorn 在 app/ 下啟動時相同）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+# app 模組在 import 時就會在目前目錄建立上傳檔、索引與對話紀錄目錄；測試在暫存目錄執行，並啟用離線假後端
+os.chdir(tempfile.mkdtemp(prefix="backend-tests-"))
+os.environ.setdefault("ENABLE_FAKE_BACKENDS", "true")
+os.environ.setdefault("FAKE_LLM_TOKEN_DELAY", "0")
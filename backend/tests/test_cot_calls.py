@@ -0,0 +1,71 @@
+"""CoT chain 呼叫次數：每個問題只呼叫兩次 LLM（thought 與 final_answer），RAG 模式只檢索一次。"""
+import asyncio
+from typing import List
+
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.retrievers import BaseRetriever
+
+from chains.cot_chain import get_cot_chain
+from chains.rag_cot_chain import get_rag_cot_chain
+
+INPUTS = {"question": "1 + 1 = ?", "chat_history": []}
+
+
+class CallCounter(BaseCallbackHandler):
+    def __init__(self):
+        self.llm_calls = 0
+        self.retrievals = 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.llm_calls += 1
+
+    def on_retriever_start(self, serialized, query, **kwargs):
+        self.retrievals += 1
+
+
+class FakeRetriever(BaseRetriever):
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [Document(page_content=f"context for {query}")]
+
+
+def build_chain(name: str):
+    llm = FakeListChatModel(responses=["thinking step by step", "final answer: 2"])
+    if name == "cot":
+        return get_cot_chain(llm, llm)
+    return get_rag_cot_chain(llm, llm, FakeRetriever())
+
+
+CASES = [("cot", 2, 0), ("rag+cot", 2, 1)]
+
+
+@pytest.mark.parametrize("name, expected_llm, expected_retrievals", CASES)
+def test_invoke_calls_once_per_step(name, expected_llm, expected_retrievals):
+    counter = CallCounter()
+    result = build_chain(name).invoke(INPUTS, config={"callbacks": [counter]})
+
+    assert set(result) == {"thought", "final_answer"}
+    assert counter.llm_calls == expected_llm
+    assert counter.retrievals == expected_retrievals
+
+
+@pytest.mark.parametrize("name, expected_llm, expected_retrievals", CASES)
+def test_astream_calls_once_per_step(name, expected_llm, expected_retrievals):
+    chain = build_chain(name)
+
+    async def stream():
+        counter = CallCounter()
+        phases = []
+        async for chunk in chain.astream(INPUTS, config={"callbacks": [counter]}):
+            phases.extend(key for key in chunk if not phases or phases[-1] != key)
+        return counter, phases
+
+    counter, phases = asyncio.run(stream())
+
+    assert counter.llm_calls == expected_llm
+    assert counter.retrievals == expected_retrievals
+    assert phases == ["thought", "final_answer"]
@@ -0,0 +1,49 @@
+"""對話紀錄寫入次數：每一輪（含 CoT 模式）只儲存 2 則訊息，且只對後端寫入一次。"""
+import pytest
+from fastapi.testclient import TestClient
+
+import memory.file_memory as file_memory
+from memory.history_store import HistoryStore, SQLiteHistoryBackend
+
+
+class CountingBackend(SQLiteHistoryBackend):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.appends = 0
+
+    def append(self, session_id, messages):
+        self.appends += 1
+        super().append(session_id, messages)
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    backend = CountingBackend(str(tmp_path / "history.sqlite"))
+    # flush_interval=0：每輪結束後立即寫入，才能逐輪計算寫入次數
+    store = HistoryStore(backend, flush_interval=0, shared=False)
+    monkeypatch.setattr(file_memory, "history_store", store)
+    return backend
+
+
+@pytest.fixture
+def client():
+    from main import app
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("use_cot", [False, True], ids=["plain", "cot"])
+def test_one_write_per_turn(backend, client, use_cot):
+    session_id = f"history-writes-{'cot' if use_cot else 'plain'}"
+    for turn in range(1, 4):
+        before = backend.appends
+        response = client.post(
+            "/api/ask",
+            json={"question": f"question {turn}", "model": "fake", "use_cot": use_cot},
+            headers={"X-Session-ID": session_id},
+        )
+        assert response.status_code == 200
+        assert "event: error" not in response.text
+        file_memory.history_store.flush()
+
+        assert len(backend.load(session_id)) == turn * 2
+        assert backend.appends - before == 1
@@ -4,7 +4,13 @@ import React, { useState, useRef, useEffect } from "react";
 import ReactMarkdown from "react-markdown";
 import FileUploader from "./FileUploader";
 import OptionsPanel, { PluginDetail } from "./OptionsPanel";
-import { askQuestion, askAgent, getUploadedFiles } from "../utils/api";
+import {
+  askQuestion,
+  askAgent,
+  getUploadedFiles,
+  deleteUploadedFile,
+  UploadedFile,
+} from "../utils/api";
 
 interface Message {
   role: "user" | "ai";
@@ -21,7 +27,7 @@ const ChatBox = () => {
   const [file, setFile] = useState<File | null>(null);
   const [loading, setLoading] = useState(false);
   const [selectedFiles, setSelectedFiles] = useState<string[]>([]);
-  const [uploadedFiles, setUploadedFiles] = useState<string[]>([]);
+  const [uploadedFiles, setUploadedFiles] = useState<UploadedFile[]>([]);
 
   const aiMessageRef = useRef<HTMLDivElement>(null);
 
@@ -35,6 +41,17 @@ const ChatBox = () => {
     }
   };
 
+  // 刪除檔案後同步移除選取狀態
+  const handleDeleteFile = async (target: UploadedFile) => {
+    try {
+      await deleteUploadedFile(target.file_name);
+      setSelectedFiles((prev) => prev.filter((f) => f !== target.path));
+      await fetchUploadedFiles();
+    } catch (error) {
+      console.error("can't delete file:", error);
+    }
+  };
+
   useEffect(() => {
     fetchUploadedFiles();
   }, []);
@@ -94,7 +111,7 @@ const ChatBox = () => {
 
     let aiResponse = "";
     if (typeof result === "string") {
-      // 非 streaming（例如 CoT），直接顯示整段
+      // 非 streaming（例如錯誤訊息），直接顯示整段
       aiResponse += result;
       setMessages((prev) => [
         ...newMessages,
@@ -102,7 +119,7 @@ const ChatBox = () => {
       ]);
       scrollToBottom();
     } else {
-      // streaming（非 CoT 模式）
+      // streaming（CoT 模式會依序串流 Thought 與 Final Answer）
       for await (const chunk of result) {
         aiResponse += chunk;
         setMessages((prev) => [
@@ -145,6 +162,7 @@ const ChatBox = () => {
             selectedFiles={selectedFiles}
             setSelectedFiles={setSelectedFiles}
             uploadedFiles={uploadedFiles}
+            onDeleteFile={handleDeleteFile}
           />
         </div>
 
@@ -1,7 +1,9 @@
 "use client";
 
 import { useRef, useState } from "react";
-import { uploadFile } from "../utils/api";
+import { uploadFile, getUploadStatus } from "../utils/api";
+
+const FINISHED_STAGES = ["done", "duplicate", "failed"];
 
 type FileUploaderProps = {
   file: File | null;
@@ -16,6 +18,8 @@ const FileUploader = ({
 }: FileUploaderProps) => {
   const fileInputRef = useRef<HTMLInputElement | null>(null);
   const [isUploading, setIsUploading] = useState(false);
+  const [uploadStage, setUploadStage] = useState("");
+  const [replace, setReplace] = useState(false);
 
   const handleFileChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     const file = e.target.files?.[0] || null;
@@ -33,14 +37,26 @@ const FileUploader = ({
     if (file) {
       try {
         setIsUploading(true);
-        await uploadFile(file);
+        const result = await uploadFile(file, replace);
         // 上傳成功後更新檔案列表
         onUploadSuccess();
+
+        // 輪詢背景索引進度，直到完成或失敗
+        let stage = result.stage;
+        while (result.job_id && !FINISHED_STAGES.includes(stage)) {
+          await new Promise((resolve) => setTimeout(resolve, 1000));
+          const status = await getUploadStatus(result.job_id);
+          stage = status.stage;
+          setUploadStage(status.chunks ? `${stage} (${status.chunks})` : stage);
+        }
+        // 索引完成後更新檔案狀態
+        onUploadSuccess();
       } catch (error) {
         console.error("File Upload Failed:", error);
       } finally {
         handleClear();
         setIsUploading(false);
+        setUploadStage("");
       }
     }
   };
@@ -59,6 +75,19 @@ const FileUploader = ({
         ref={fileInputRef}
         disabled={isUploading}
       />
+      <div className="form-check mt-2">
+        <input
+          className="form-check-input"
+          type="checkbox"
+          id="replaceFile"
+          checked={replace}
+          onChange={() => setReplace(!replace)}
+          disabled={isUploading}
+        />
+        <label className="form-check-label text-sm" htmlFor="replaceFile">
+          Replace file with the same name
+        </label>
+      </div>
       <div className="d-flex gap-2">
         <button
           type="button"
@@ -79,7 +108,7 @@ const FileUploader = ({
                 role="status"
                 aria-hidden="true"
               ></span>
-              Uploading
+              {uploadStage ? `Indexing: ${uploadStage}` : "Uploading"}
             </>
           ) : (
             "Upload file"
@@ -1,6 +1,7 @@
 "use client";
 
 import { Dispatch, SetStateAction, useEffect } from "react";
+import { UploadedFile } from "../utils/api";
 
 export type PluginDetail = {
   id: number;
@@ -17,7 +18,8 @@ export type OptionsProps = {
   setPluginDetail: Dispatch<SetStateAction<PluginDetail[]>>;
   selectedFiles: string[];
   setSelectedFiles: Dispatch<SetStateAction<string[]>>;
-  uploadedFiles: string[];
+  uploadedFiles: UploadedFile[];
+  onDeleteFile: (file: UploadedFile) => void;
 };
 
 const AVAILABLE_PLUGINS: Omit<PluginDetail, "enable">[] = [
@@ -37,6 +39,7 @@ const OptionsPanel = ({
   selectedFiles,
   setSelectedFiles,
   uploadedFiles,
+  onDeleteFile,
 }: OptionsProps) => {
   useEffect(() => {
     if (pluginDetail.length === 0) {
@@ -63,9 +66,12 @@ const OptionsPanel = ({
     }
   };
 
-  // 從路徑中提取檔案名稱
-  const getFileName = (filePath: string) => {
-    return filePath.split("/").pop() || filePath;
+  // 索引尚未完成時顯示狀態
+  const getStatusLabel = (file: UploadedFile) => {
+    if (file.status === "indexing") {
+      return file.chunks ? `${file.stage} (${file.chunks})` : file.stage;
+    }
+    return file.status === "indexed" ? "" : file.status.replace("_", " ");
   };
 
   return (
@@ -127,22 +133,37 @@ const OptionsPanel = ({
             <label className="text-sm">RAG Files Knowledge</label>
             <div className="list-group list-group-sm">
               {uploadedFiles.map((file, index) => (
-                <div key={index} className="list-group-item py-1 px-2">
-                  <div className="form-check">
+                <div
+                  key={file.path}
+                  className="list-group-item py-1 px-2 d-flex align-items-center"
+                >
+                  <div className="form-check flex-grow-1">
                     <input
                       className="form-check-input"
                       type="checkbox"
                       id={`file-${index}`}
-                      checked={selectedFiles.includes(file)}
-                      onChange={() => handleFileToggle(file)}
+                      checked={selectedFiles.includes(file.path)}
+                      onChange={() => handleFileToggle(file.path)}
                     />
                     <label
                       className="form-check-label text-sm"
                       htmlFor={`file-${index}`}
+                      title={file.error || undefined}
                     >
-                      {getFileName(file)}
+                      {file.file_name}
+                      {getStatusLabel(file) && (
+                        <span className="badge bg-secondary ms-1">
+                          {getStatusLabel(file)}
+                        </span>
+                      )}
                     </label>
                   </div>
+                  <button
+                    type="button"
+                    className="btn-close btn-sm"
+                    aria-label="Delete file"
+                    onClick={() => onDeleteFile(file)}
+                  ></button>
                 </div>
               ))}
             </div>
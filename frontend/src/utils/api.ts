@@ -2,6 +2,65 @@ import axios from "axios";
 
 const API_BASE = "http://localhost:8000/api";
 
+export type SSEEvent = {
+  event: string;
+  data: string;
+};
+
+// 解析 SSE 事件（event: xxx / data: JSON），跨 chunk 的事件會先暫存
+async function* readSSE(response: Response): AsyncGenerator<SSEEvent> {
+  const reader = response.body?.getReader();
+  if (!reader) return;
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf("\n\n");
+    while (boundary !== -1) {
+      const raw = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf("\n\n");
+
+      let event = "message";
+      const dataLines: string[] = [];
+      for (const line of raw.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) dataLines.push(line.slice(5).trim());
+      }
+      if (dataLines.length > 0) {
+        yield { event, data: JSON.parse(dataLines.join("\n")) };
+      }
+    }
+  }
+}
+
+const PHASE_TITLES: Record<string, string> = {
+  thought: "**[Thought]**\n\n",
+  final_answer: "\n\n**[Final Answer]**\n\n",
+};
+
+// 取出回答文字；CoT 模式的 thought / final_answer 事件在各自開始時加上段落標題
+async function* streamTokens(response: Response) {
+  let phase = "";
+  for await (const { event, data } of readSSE(response)) {
+    if (event === "token") {
+      yield data;
+    } else if (event in PHASE_TITLES) {
+      if (phase !== event) {
+        phase = event;
+        yield PHASE_TITLES[event];
+      }
+      yield data;
+    } else if (event === "error") {
+      yield `\n\n⚠️ ${data}`;
+    }
+  }
+}
+
 // 一般問答（不含插件）
 export async function askQuestion(payload: {
   question: string;
@@ -20,22 +79,10 @@ export async function askQuestion(payload: {
 
   if (contentType.includes("text/event-stream")) {
     // --- 處理 Streaming Response ---
-    const reader = response.body?.getReader();
-    const decoder = new TextDecoder();
-
-    if (!reader) return;
-
-    async function* stream() {
-      while (true) {
-        const { done, value } = await reader!.read();
-        if (done) break;
-        yield decoder.decode(value);
-      }
-    }
-
-    return stream(); // 回傳 async generator
+    if (!response.body) return;
+    return streamTokens(response); // 回傳 async generator
   } else {
-    // --- 處理非 Streaming Response（CoT 模式）---
+    // --- 處理非 Streaming Response（例如錯誤訊息）---
     const text = await response.text();
     return text; // 回傳一般文字
   }
@@ -60,34 +107,61 @@ export async function askAgent(payload: {
     body: JSON.stringify(payload),
   });
 
-  const reader = response.body?.getReader();
-  const decoder = new TextDecoder();
-
-  async function* stream() {
-    while (true) {
-      const { done, value } = await reader!.read();
-      if (done) break;
-      yield decoder.decode(value);
-    }
+  const contentType = response.headers.get("Content-Type") || "";
+  if (!contentType.includes("text/event-stream")) {
+    // 非 streaming 回應（例如 429 後端忙碌），回傳錯誤訊息文字
+    return await response.text();
   }
-
-  return stream();
+  return streamTokens(response);
 }
 
 // 檔案上傳
-export async function uploadFile(file: File) {
+export async function uploadFile(file: File, replace = false) {
   const formData = new FormData();
   formData.append("file", file);
+  // replace：取代同名檔案，後端只重新 embedding 有變動的 chunk
+  formData.append("replace", String(replace));
 
   const response = await axios.post(`${API_BASE}/upload`, formData, {
     headers: { "Content-Type": "multipart/form-data" },
   });
 
-  return response.data; // 應回傳檔案儲存後的資訊（如檔名、路徑等）
+  return response.data; // 應回傳檔案儲存後的資訊（如檔名、job_id 等）
+}
+
+// 查詢背景建立索引的進度
+export async function getUploadStatus(jobId: string): Promise<{
+  job_id: string;
+  file_name: string;
+  stage: string;
+  chunks: number;
+  error: string | null;
+}> {
+  const response = await axios.get(`${API_BASE}/upload/${jobId}`);
+  return response.data;
 }
 
-// 取得所有已上傳的檔案名稱
-export async function getUploadedFiles(): Promise<string[]> {
+export type UploadedFile = {
+  path: string;
+  file_name: string;
+  size: number;
+  status: "indexing" | "indexed" | "failed" | "not_indexed";
+  stage: string | null;
+  chunks: number | null;
+  job_id: string | null;
+  error: string | null;
+};
+
+// 取得所有已上傳的檔案與索引狀態
+export async function getUploadedFiles(): Promise<UploadedFile[]> {
   const response = await axios.get(`${API_BASE}/files`);
   return response.data;
 }
+
+// 刪除已上傳的檔案（索引由後端在背景清除）
+export async function deleteUploadedFile(fileName: string) {
+  const response = await axios.delete(
+    `${API_BASE}/files/${encodeURIComponent(fileName)}`
+  );
+  return response.data;
+}